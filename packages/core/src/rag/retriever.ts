@@ -45,18 +45,26 @@ export async function retrieveForAsk(prisma: any, openai: any, childId: string,
     ...lexParams
   ) as any as Span[];
 
-  const emb = await openai.embeddings.create({ model: process.env.OPENAI_EMBEDDINGS_MODEL || "text-embedding-3-small", input: query });
-  const vecStr = `ARRAY[${emb.data[0].embedding.join(",")}]::vector`;
+  // Must match the worker's EMBED_STORAGE / EMBED_DIMENSIONS so queries hit the populated column
+  const halfvec = (process.env.EMBED_STORAGE || "vector").toLowerCase() === "halfvec";
+  const column = halfvec ? "embedding_half" : "embedding";
+  const dimensions = Number(process.env.EMBED_DIMENSIONS || 0);
+  const emb = await openai.embeddings.create({
+    model: process.env.OPENAI_EMBEDDINGS_MODEL || "text-embedding-3-small",
+    input: query,
+    ...(dimensions > 0 ? { dimensions } : {}),
+  });
+  const vecStr = `ARRAY[${emb.data[0].embedding.join(",")}]::${halfvec ? "halfvec" : "vector"}`;
   const vecDocClause = scopedDocId ? " AND ds.document_id = $2::uuid" : "";
   const vecParams = scopedDocId ? [childId, scopedDocId] : [childId];
 
   const vec = await prisma.$queryRawUnsafe(
     `SELECT ds.id, ds.document_id, COALESCE(d.original_name, d.type) as doc_name, ds.page, ds.text,
-            1 - (ds.embedding <=> ${vecStr}) AS "scoreVec"
+            1 - (ds.${column} <=> ${vecStr}) AS "scoreVec"
      FROM doc_spans ds
      JOIN documents d ON d.id = ds.document_id
      WHERE d.child_id = $1::uuid${vecDocClause}
-     ORDER BY ds.embedding <=> ${vecStr}
+     ORDER BY ds.${column} <=> ${vecStr}
      LIMIT 30`,
     ...vecParams
   ) as any as Span[];
@@ -28,6 +28,24 @@ BEGIN
   END IF;
 END$$;
 
+-- Half-precision copy of the embedding (pgvector >= 0.7), written when EMBED_STORAGE=halfvec.
+-- Backfill existing rows with `reembed_spans.py --copy-halfvec`; see docs/OPERATIONS_CHECKLIST.md.
+-- The size must equal the worker's embedding size (EMBED_DIMENSIONS); the worker checks it at startup.
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'doc_spans' AND column_name = 'embedding_half'
+  ) THEN
+    BEGIN
+      ALTER TABLE doc_spans ADD COLUMN IF NOT EXISTS embedding_half halfvec(1536);
+      CREATE INDEX IF NOT EXISTS docspan_embedding_half_idx ON doc_spans USING hnsw (embedding_half halfvec_cosine_ops);
+    EXCEPTION WHEN undefined_object THEN
+      RAISE NOTICE 'pgvector >= 0.7 required for halfvec; skipping doc_spans.embedding_half';
+    END;
+  END IF;
+END$$;
+
 -- Maintain tsv via trigger
 CREATE OR REPLACE FUNCTION doc_spans_tsv_update()
 RETURNS trigger AS $$
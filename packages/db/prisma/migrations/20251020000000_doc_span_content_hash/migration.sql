@@ -0,0 +1,6 @@
+-- AlterTable
+ALTER TABLE "doc_spans" ADD COLUMN "content_hash" TEXT,
+ADD COLUMN "embedding_model" TEXT;
+
+-- CreateIndex
+CREATE INDEX "doc_spans_document_id_content_hash_idx" ON "doc_spans"("document_id", "content_hash");
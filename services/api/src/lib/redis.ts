@@ -2,7 +2,8 @@ import Redis from "ioredis";
 export const redis = new Redis(process.env.REDIS_URL!);
 
 export async function enqueue(job: Record<string, any>) {
-  await redis.rpush("jobs", JSON.stringify(job));
+  // enqueued_at (epoch ms) lets the worker measure queue wait time
+  await redis.rpush("jobs", JSON.stringify({ enqueued_at: Date.now(), ...job }));
 }
 
 
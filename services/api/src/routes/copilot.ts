@@ -707,7 +707,7 @@ if (intentInfo.intent === "goals.smart") {
         });
       }
 
-      if (outline.status === "pending") {
+      if (outline.status === "pending" || outline.status === "streaming") {
         return reply.send({
           intent: intentInfo.intent,
           answer: withDisclaimer("I'm still organizing that outline. Refresh the advocacy tab in a moment."),
@@ -931,7 +931,7 @@ if (intentInfo.intent === "goals.smart") {
         });
       }
 
-      if (onePager.status === "pending") {
+      if (onePager.status === "pending" || onePager.status === "streaming") {
         return reply.send({
           intent: intentInfo.intent,
           answer: withDisclaimer("I'm still pulling that information together. Refresh the one-pagers tab in a moment."),
@@ -11,16 +11,23 @@ export default async function routes(app: FastifyInstance) {
   });
 
   app.patch<{ Params: { id: string } }>("/internal/jobs/:id", async (req, reply) => {
-    const { status, error_text, payload, type } = (req.body as any);
+    const { status, error_text, payload, type, progress } = (req.body as any);
     const updates: Record<string, any> = {};
     if (typeof status === "string" && status.trim()) updates.status = status.trim();
     if (typeof type === "string" && type.trim()) updates.type = type.trim();
     if (error_text !== undefined) updates.error_text = error_text ?? null;
     if (payload !== undefined) updates.payload_json = payload;
-    if (!Object.keys(updates).length) {
+    if (!Object.keys(updates).length && !(progress && typeof progress === "object")) {
       return reply.status(400).send({ error: "no_update_fields" });
     }
     try {
+      if (progress && typeof progress === "object" && payload === undefined) {
+        // Merge worker progress into the stored payload instead of replacing it
+        const existing = await (prisma as any).job_runs.findUnique({ where: { id: (req.params as any).id }, select: { payload_json: true } });
+        if (!existing) return reply.status(404).send({ error: "not_found" });
+        const base = existing.payload_json && typeof existing.payload_json === "object" ? existing.payload_json : {};
+        updates.payload_json = { ...base, progress };
+      }
       const row = await (prisma as any).job_runs.update({ where: { id: (req.params as any).id }, data: updates });
       return reply.send({ ok: true, job: row });
     } catch (err: any) {
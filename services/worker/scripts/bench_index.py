@@ -0,0 +1,93 @@
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+WORKER_DIR = Path(__file__).resolve().parents[1]
+if str(WORKER_DIR) not in sys.path:
+    sys.path.insert(0, str(WORKER_DIR))
+
+from src.index import (  # noqa: E402
+    EMBED_BATCH_SIZE,
+    EMBED_BATCH_TOKENS,
+    HashingEmbeddings,
+    _batched,
+    _iter_chunks,
+    get_embedding_provider,
+)
+
+_WORDS = (
+    "student goal reading fluency accommodations speech therapy minutes weekly services "
+    "evaluation baseline progress report annual review placement transportation behavior "
+    "support plan parent consent district eligibility assessment occupational math writing"
+).split()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure chunking + embedding throughput of the indexer on synthetic pages (no database)."
+    )
+    parser.add_argument("--pages", type=int, default=200, help="Synthetic pages to index (default: 200).")
+    parser.add_argument("--words", type=int, default=450, help="Words per page (default: 450).")
+    parser.add_argument(
+        "--provider",
+        default="hashing",
+        help="Embedding provider: hashing (local, default) or openai (uses the API).",
+    )
+    parser.add_argument("--dims", type=int, default=1536, help="Dimensions for the hashing provider.")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for the synthetic text.")
+    return parser.parse_args()
+
+
+def synthetic_pages(count: int, words: int, seed: int):
+    rng = random.Random(seed)
+    for page in range(1, count + 1):
+        sentences = []
+        remaining = words
+        while remaining > 0:
+            length = min(remaining, rng.randint(8, 24))
+            sentences.append(" ".join(rng.choice(_WORDS) for _ in range(length)).capitalize() + ".")
+            remaining -= length
+        yield {"page": page, "text": " ".join(sentences)}
+
+
+def main() -> None:
+    args = parse_args()
+    if args.provider == "hashing":
+        provider = HashingEmbeddings(dims=args.dims)
+    else:
+        provider = get_embedding_provider(kind=args.provider)
+
+    chunks = batches = 0
+    embed_seconds = 0.0
+    started = time.perf_counter()
+    for batch in _batched(_iter_chunks(synthetic_pages(args.pages, args.words, args.seed)), EMBED_BATCH_SIZE, EMBED_BATCH_TOKENS):
+        t0 = time.perf_counter()
+        provider.embed([item["text"] for item in batch])
+        embed_seconds += time.perf_counter() - t0
+        chunks += len(batch)
+        batches += 1
+    elapsed = time.perf_counter() - started
+    print(
+        json.dumps(
+            {
+                "provider": provider.name,
+                "pages": args.pages,
+                "chunks": chunks,
+                "batches": batches,
+                "elapsed_seconds": round(elapsed, 3),
+                "embed_seconds": round(embed_seconds, 3),
+                "pages_per_second": round(args.pages / elapsed, 1) if elapsed else None,
+                "chunks_per_second": round(chunks / elapsed, 1) if elapsed else None,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import redis
+
+WORKER_DIR = Path(__file__).resolve().parents[1]
+if str(WORKER_DIR) not in sys.path:
+    sys.path.insert(0, str(WORKER_DIR))
+
+from src.backfill import (  # noqa: E402
+    BACKFILL_BATCH_SIZE,
+    BACKFILL_CONCURRENCY,
+    BACKFILL_REQUESTS_PER_MINUTE,
+    BACKFILL_TOKENS_PER_MINUTE,
+    Throttle,
+    copy_to_halfvec,
+    load_checkpoint,
+    reembed_spans,
+    reset_checkpoint,
+)
+from src.segcache import SEGMENT_CACHE_ENABLED, SegmentCache  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Re-embed doc_spans onto a new embedding model, resuming from the Redis checkpoint."
+    )
+    parser.add_argument(
+        "--model",
+        default=os.getenv("OPENAI_EMBEDDINGS_MODEL", "text-embedding-3-small"),
+        help="Target embedding model (default: OPENAI_EMBEDDINGS_MODEL env or text-embedding-3-small).",
+    )
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=None,
+        help="Request shortened embeddings; must match the doc_spans.embedding column size.",
+    )
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="Spans per embeddings request.")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY, help="Embeddings requests in flight.")
+    parser.add_argument("--rpm", type=int, default=BACKFILL_REQUESTS_PER_MINUTE, help="Request budget per minute (0 = off).")
+    parser.add_argument("--tpm", type=int, default=BACKFILL_TOKENS_PER_MINUTE, help="Token budget per minute (0 = off).")
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Stop after this many seconds; rerun to resume (default: run until done).",
+    )
+    parser.add_argument(
+        "--redis-url",
+        default=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        help="Redis connection URL used for the checkpoint (default: REDIS_URL env).",
+    )
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("DATABASE_URL"),
+        help="Postgres connection URL (default: DATABASE_URL env).",
+    )
+    parser.add_argument(
+        "--queue",
+        default=os.getenv("JOB_QUEUE_NAME", "jobs"),
+        help="Worker queue used by --enqueue (default: jobs or JOB_QUEUE_NAME env).",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--enqueue", action="store_true", help="Hand the backfill to the workers as a reembed_spans job.")
+    mode.add_argument("--status", action="store_true", help="Print the current checkpoint and exit.")
+    mode.add_argument("--reset", action="store_true", help="Delete the checkpoint so the next run starts from the beginning.")
+    mode.add_argument(
+        "--copy-halfvec",
+        action="store_true",
+        help="Fill embedding_half from the float32 embedding column (no API calls); honours --dimensions.",
+    )
+    return parser.parse_args()
+
+
+def connect(redis_url: str) -> redis.Redis:
+    try:
+        return redis.from_url(redis_url, decode_responses=True)
+    except Exception as err:
+        raise SystemExit(f"Failed to connect to Redis ({redis_url}): {err}") from err
+
+
+def enqueue(client: redis.Redis, args: argparse.Namespace) -> dict:
+    job = {
+        "kind": "reembed_spans",
+        "model": args.model,
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+        "enqueued_at": int(time.time() * 1000),
+    }
+    if args.dimensions:
+        job["dimensions"] = args.dimensions
+    client.rpush(args.queue, json.dumps(job))
+    return {"enqueued": True, "queue": args.queue, "model": args.model}
+
+
+def segment_cache(args: argparse.Namespace):
+    # Separate client: cached rows are msgpack bytes, not decoded strings
+    return SegmentCache(redis.from_url(args.redis_url)) if SEGMENT_CACHE_ENABLED else None
+
+
+def run_local(client: redis.Redis, args: argparse.Namespace) -> dict:
+    if not args.database_url:
+        raise SystemExit("--database-url or DATABASE_URL is required")
+    import psycopg
+    from openai import OpenAI
+
+    openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    with psycopg.connect(args.database_url) as conn:
+        return reembed_spans(
+            conn,
+            openai_client,
+            model=args.model,
+            redis_client=client,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            throttle=Throttle(args.rpm, args.tpm),
+            max_seconds=args.max_seconds,
+            dimensions=args.dimensions,
+            segment_cache=segment_cache(args),
+        )
+
+
+def copy_halfvec(client: redis.Redis, args: argparse.Namespace) -> dict:
+    if not args.database_url:
+        raise SystemExit("--database-url or DATABASE_URL is required")
+    import psycopg
+
+    with psycopg.connect(args.database_url) as conn:
+        return copy_to_halfvec(
+            conn,
+            redis_client=client,
+            dims=args.dimensions,
+            max_seconds=args.max_seconds,
+            segment_cache=segment_cache(args),
+        )
+
+
+def main() -> None:
+    args = parse_args()
+    if args.batch_size <= 0 or args.concurrency <= 0:
+        raise SystemExit("--batch-size and --concurrency must be positive")
+
+    client = connect(args.redis_url)
+    if args.status:
+        result = {"model": args.model, "checkpoint": load_checkpoint(client, args.model)}
+    elif args.reset:
+        reset_checkpoint(client, args.model)
+        result = {"model": args.model, "reset": True}
+    elif args.enqueue:
+        result = enqueue(client, args)
+    elif args.copy_halfvec:
+        result = copy_halfvec(client, args)
+    else:
+        result = run_local(client, args)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -0,0 +1,51 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import redis
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Re-index stored documents: only chunks whose text changed are re-embedded."
+    )
+    parser.add_argument("document_ids", nargs="+", help="documents.id values to re-index.")
+    parser.add_argument(
+        "--org-id",
+        default=None,
+        help="Org the documents belong to; sets the RLS context for the lookup.",
+    )
+    parser.add_argument(
+        "--redis-url",
+        default=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        help="Redis connection URL (default: REDIS_URL env).",
+    )
+    parser.add_argument(
+        "--queue",
+        default=os.getenv("JOB_QUEUE_NAME", "jobs"),
+        help="Worker queue (default: jobs or JOB_QUEUE_NAME env).",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        client = redis.from_url(args.redis_url, decode_responses=True)
+    except Exception as err:
+        raise SystemExit(f"Failed to connect to Redis ({args.redis_url}): {err}") from err
+    for document_id in args.document_ids:
+        job = {"kind": "reindex_document", "document_id": document_id, "enqueued_at": int(time.time() * 1000)}
+        if args.org_id:
+            job["org_id"] = args.org_id
+        client.rpush(args.queue, json.dumps(job))
+    print(json.dumps({"enqueued": len(args.document_ids), "queue": args.queue}))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import random
+import sys
+from pathlib import Path
+
+WORKER_DIR = Path(__file__).resolve().parents[1]
+if str(WORKER_DIR) not in sys.path:
+    sys.path.insert(0, str(WORKER_DIR))
+
+from src.vectors import compare_recall  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare recall@k of halfvec / int8 / truncated embeddings against float32 search."
+    )
+    parser.add_argument("--corpus", type=int, default=2000, help="Number of stored spans to search (default: 2000).")
+    parser.add_argument("--queries", type=int, default=50, help="Held-out spans used as queries (default: 50).")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared per query (default: 10).")
+    parser.add_argument(
+        "--dims",
+        default="",
+        help="Comma-separated Matryoshka truncations to evaluate as well, e.g. 512,768.",
+    )
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("DATABASE_URL"),
+        help="Sample real embeddings from doc_spans (default: DATABASE_URL env).",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        metavar="DIMS",
+        help="Use clustered random vectors of this size instead of the database.",
+    )
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for sampling.")
+    return parser.parse_args()
+
+
+def _parse_vector(text: str) -> list:
+    return [float(x) for x in text.strip("[]").split(",") if x]
+
+
+def load_from_db(database_url: str, count: int, seed: int) -> list:
+    import psycopg
+
+    with psycopg.connect(database_url) as conn:
+        conn.execute("SELECT setseed(%s)", (((seed % 1000) / 1000.0),))
+        rows = conn.execute(
+            "SELECT embedding::text FROM doc_spans WHERE embedding IS NOT NULL ORDER BY random() LIMIT %s",
+            (count,),
+        ).fetchall()
+    return [_parse_vector(row[0]) for row in rows]
+
+
+def synthetic(count: int, dims: int, seed: int) -> list:
+    rng = random.Random(seed)
+    centers = [[rng.gauss(0, 1) for _ in range(dims)] for _ in range(max(1, count // 50))]
+    vectors = []
+    for _ in range(count):
+        center = rng.choice(centers)
+        vectors.append([c + rng.gauss(0, 0.35) for c in center])
+    return vectors
+
+
+def main() -> None:
+    args = parse_args()
+    total = args.corpus + args.queries
+    if args.synthetic:
+        vectors = synthetic(total, args.synthetic, args.seed)
+    elif args.database_url:
+        vectors = load_from_db(args.database_url, total, args.seed)
+    else:
+        raise SystemExit("--database-url (or DATABASE_URL) or --synthetic is required")
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"need more than {args.queries} embeddings, found {len(vectors)}")
+
+    queries, corpus = vectors[: args.queries], vectors[args.queries :]
+    dims = [int(d) for d in args.dims.split(",") if d.strip()]
+    for row in compare_recall(corpus, queries, k=args.k, dims=dims, variants=("float32", "halfvec", "int8")):
+        print(json.dumps({**row, "corpus": len(corpus), "queries": len(queries), "k": args.k}))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
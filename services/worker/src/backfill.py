@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.breaker import DependencyUnavailable, guarded
+from src.chunking import count_tokens
+from src.deadline import DeadlineExceeded, within
+from src.eventlog import log_event
+from src.vectors import EMBED_DIMENSIONS, storage_column, truncate, vector_literal
+
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "256"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+BACKFILL_REQUESTS_PER_MINUTE = int(os.getenv("BACKFILL_REQUESTS_PER_MINUTE", "500"))
+BACKFILL_TOKENS_PER_MINUTE = int(os.getenv("BACKFILL_TOKENS_PER_MINUTE", "1000000"))
+BACKFILL_SLICE_SECONDS = float(os.getenv("BACKFILL_SLICE_SECONDS", "240"))
+BACKFILL_MAX_ATTEMPTS = int(os.getenv("BACKFILL_MAX_ATTEMPTS", "5"))
+CHECKPOINT_PREFIX = "backfill:reembed"
+
+_MIN_UUID = "00000000-0000-0000-0000-000000000000"
+_WINDOW_SECONDS = 60.0
+
+
+class Throttle:
+    """Sliding one-minute request/token budget shared by the embedding threads.
+
+    ``acquire`` blocks until the call fits inside both limits; a limit of 0
+    disables it. A single request larger than the token budget is let through
+    once the window is empty so it cannot stall forever.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = BACKFILL_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = BACKFILL_TOKENS_PER_MINUTE,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.requests_per_minute = max(0, int(requests_per_minute))
+        self.tokens_per_minute = max(0, int(tokens_per_minute))
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._events: Deque[Tuple[float, int]] = deque()
+        self._tokens = 0
+
+    def acquire(self, tokens: int) -> float:
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                while self._events and now - self._events[0][0] >= _WINDOW_SECONDS:
+                    self._tokens -= self._events.popleft()[1]
+                fits_requests = not self.requests_per_minute or len(self._events) < self.requests_per_minute
+                fits_tokens = (
+                    not self.tokens_per_minute
+                    or not self._events
+                    or self._tokens + tokens <= self.tokens_per_minute
+                )
+                if fits_requests and fits_tokens:
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return waited
+                delay = max(0.01, self._events[0][0] + _WINDOW_SECONDS - now)
+            self._sleep(delay)
+            waited += delay
+
+
+def checkpoint_key(model: str) -> str:
+    return f"{CHECKPOINT_PREFIX}:{model}"
+
+
+def load_checkpoint(redis_client, model: str) -> Dict[str, Any]:
+    if redis_client is None:
+        return {}
+    return dict(redis_client.hgetall(checkpoint_key(model)) or {})
+
+
+def reset_checkpoint(redis_client, model: str) -> None:
+    if redis_client is not None:
+        redis_client.delete(checkpoint_key(model))
+
+
+def _save_checkpoint(redis_client, model: str, **fields: Any) -> None:
+    if redis_client is None:
+        return
+    try:
+        redis_client.hset(checkpoint_key(model), mapping={k: str(v) for k, v in fields.items()})
+    except Exception as err:
+        # The keyset query skips already migrated rows, so a lost checkpoint only costs a rescan
+        log_event("backfill.checkpoint_failed", model=model, error=str(err))
+
+
+def _invalidate_segments(segment_cache, document_ids: Iterable[str]) -> None:
+    if segment_cache is None:
+        return
+    # Cached segments embed the old vectors; bump each touched document's version once the page commits
+    for document_id in sorted(set(document_ids)):
+        segment_cache.invalidate(document_id)
+
+
+def _embed_batch(
+    client,
+    model: str,
+    rows: Sequence[Tuple[str, str, str]],
+    throttle: Throttle,
+    dimensions: Optional[int],
+    sleep: Callable[[float], None],
+) -> List[List[float]]:
+    dimensions = dimensions or EMBED_DIMENSIONS or None
+    texts = [row[1] or " " for row in rows]
+    throttle.acquire(sum(count_tokens(text) for text in texts))
+    kwargs: Dict[str, Any] = {"model": model, "input": texts}
+    if dimensions:
+        kwargs["dimensions"] = dimensions
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            resp = guarded("openai", lambda: within("openai", lambda **options: client.embeddings.create(**kwargs, **options)))
+            return [truncate(d.embedding, dimensions or None) for d in resp.data]
+        except (DependencyUnavailable, DeadlineExceeded):
+            raise
+        except Exception as err:
+            if attempt >= BACKFILL_MAX_ATTEMPTS:
+                raise
+            delay = min(60.0, 2.0 ** attempt)
+            log_event("backfill.embed_retry", model=model, attempt=attempt, delay=delay, error=str(err))
+            sleep(delay)
+
+
+def reembed_spans(
+    conn,
+    client,
+    *,
+    model: str,
+    redis_client=None,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    throttle: Optional[Throttle] = None,
+    max_seconds: Optional[float] = None,
+    dimensions: Optional[int] = None,
+    segment_cache=None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Dict[str, Any]:
+    """Re-embed every span whose ``embedding_model`` differs from ``model``.
+
+    Spans are paged by primary key (keyset, never OFFSET). Each page holds
+    ``concurrency`` embedding batches that run in parallel, is written back
+    with a single ``UPDATE ... FROM unnest(...)`` and committed before the
+    checkpoint advances, so the run can be interrupted at any point and
+    resumed from Redis. When ``segment_cache`` is given, every document a
+    committed page touched has its cached segments invalidated. Returns a
+    summary with ``done`` set once no spans remain.
+    """
+    batch_size = max(1, int(batch_size))
+    concurrency = max(1, int(concurrency))
+    throttle = throttle or Throttle()
+    column, cast = storage_column()
+    state = load_checkpoint(redis_client, model)
+    last_id = state.get("last_id") or _MIN_UUID
+    processed = int(state.get("processed") or 0)
+    started = time.monotonic()
+    deadline = started + max_seconds if max_seconds else None
+    done = False
+    wrapped = False
+    updated = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="backfill-embed") as pool:
+        while deadline is None or time.monotonic() < deadline:
+            rows = conn.execute(
+                "SELECT id::text, text, document_id::text FROM doc_spans "
+                "WHERE id > %s::uuid AND embedding_model IS DISTINCT FROM %s "
+                "ORDER BY id LIMIT %s",
+                (last_id, model, batch_size * concurrency),
+            ).fetchall()
+            if not rows:
+                if not wrapped:
+                    # Sweep once more from the start: random uuids inserted behind the cursor
+                    # by workers still on the old model would otherwise be missed.
+                    last_id, wrapped = _MIN_UUID, True
+                    continue
+                done = True
+                break
+            batches = [rows[i : i + batch_size] for i in range(0, len(rows), batch_size)]
+            # Each batch runs in a copy of this context so the job deadline reaches the pool threads
+            results = pool.map(
+                lambda job: job[0].run(_embed_batch, client, model, job[1], throttle, dimensions, sleep),
+                [(contextvars.copy_context(), batch) for batch in batches],
+            )
+            vectors = [vector_literal(vec) for batch_vectors in results for vec in batch_vectors]
+            conn.execute(
+                f"UPDATE doc_spans AS s SET {column} = v.embedding::{cast}, embedding_model = %s "
+                "FROM unnest(%s::uuid[], %s::text[]) AS v(id, embedding) WHERE s.id = v.id",
+                (model, [row[0] for row in rows], vectors),
+            )
+            conn.commit()
+            _invalidate_segments(segment_cache, (row[2] for row in rows))
+            last_id = rows[-1][0]
+            processed += len(rows)
+            updated += len(rows)
+            _save_checkpoint(redis_client, model, last_id=last_id, processed=processed, updated_at=time.time())
+            log_event("backfill.progress", model=model, last_id=last_id, processed=processed)
+
+    if done:
+        _save_checkpoint(redis_client, model, last_id=last_id, processed=processed, done=1, updated_at=time.time())
+    summary = {
+        "model": model,
+        "updated": updated,
+        "processed": processed,
+        "last_id": last_id,
+        "done": done,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
+    log_event("backfill.slice_done", **summary)
+    return summary
+
+
+def copy_to_halfvec(
+    conn,
+    *,
+    redis_client=None,
+    batch_size: int = 5000,
+    dims: Optional[int] = None,
+    max_seconds: Optional[float] = None,
+    segment_cache=None,
+) -> Dict[str, Any]:
+    """Fill ``embedding_half`` from the existing float32 ``embedding`` without re-embedding.
+
+    With ``dims`` the vectors are Matryoshka-truncated in SQL (subvector +
+    l2_normalize, pgvector >= 0.7). Keyset-paged and checkpointed like
+    ``reembed_spans``, including the segment cache invalidation.
+    """
+    dims = dims or EMBED_DIMENSIONS or None
+    key = "halfvec" if not dims else f"halfvec:{dims}"
+    state = load_checkpoint(redis_client, key)
+    last_id = state.get("last_id") or _MIN_UUID
+    processed = int(state.get("processed") or 0)
+    source = "l2_normalize(subvector(embedding, 1, %s))::halfvec" if dims else "embedding::halfvec"
+    started = time.monotonic()
+    deadline = started + max_seconds if max_seconds else None
+    done = False
+    while deadline is None or time.monotonic() < deadline:
+        params: tuple = (dims,) if dims else ()
+        rows = conn.execute(
+            f"UPDATE doc_spans SET embedding_half = {source} WHERE id IN ("
+            "SELECT id FROM doc_spans WHERE id > %s::uuid AND embedding IS NOT NULL AND embedding_half IS NULL "
+            "ORDER BY id LIMIT %s) RETURNING id::text, document_id::text",
+            params + (last_id, max(1, int(batch_size))),
+        ).fetchall()
+        conn.commit()
+        if not rows:
+            done = True
+            break
+        _invalidate_segments(segment_cache, (row[1] for row in rows))
+        last_id = max(row[0] for row in rows)
+        processed += len(rows)
+        _save_checkpoint(redis_client, key, last_id=last_id, processed=processed, updated_at=time.time())
+        log_event("backfill.halfvec_progress", last_id=last_id, processed=processed)
+    if done:
+        _save_checkpoint(redis_client, key, last_id=last_id, processed=processed, done=1, updated_at=time.time())
+    return {"copied": processed, "last_id": last_id, "done": done}
+
+
+__all__ = [
+    "Throttle",
+    "checkpoint_key",
+    "copy_to_halfvec",
+    "load_checkpoint",
+    "reembed_spans",
+    "reset_checkpoint",
+]
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Protocol
+
+from src.eventlog import log_event
+from src.jobs.registry import JobParked
+from src.metrics import metrics
+from src.runner import ENQUEUED_AT_FIELD, queue_wait_seconds, stamp_enqueued_at
+
+BATCH_ENABLED = os.getenv("BATCH_ENABLED", "1") not in ("0", "false", "False")
+BATCH_FIELD = "batch"
+BATCH_ENDPOINT = "/v1/responses"
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "5000"))
+# Submit a partial batch once its oldest request has waited this long
+BATCH_MAX_WAIT_SECONDS = float(os.getenv("BATCH_MAX_WAIT_SECONDS", "300"))
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "60"))
+BATCH_PREFIX = os.getenv("BATCH_PREFIX", "batch")
+BATCH_BASE_URL = os.getenv("OPENAI_BATCH_BASE_URL")
+BATCH_WAIT_BUCKETS = (60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600, 24 * 3600)
+
+DEFAULT_BATCH_KINDS = frozenset({"research_summary", "prep_recommendations"})
+
+
+def _parse_kinds(spec: Optional[str]) -> FrozenSet[str]:
+    if spec is None:
+        return DEFAULT_BATCH_KINDS
+    return frozenset(kind.strip() for kind in spec.split(",") if kind.strip())
+
+
+BATCH_KINDS = _parse_kinds(os.getenv("BATCH_KINDS"))
+
+# Terminal Batch API statuses; anything else is still in flight
+_DONE = "completed"
+_FAILED = frozenset({"failed", "expired", "cancelled"})
+
+
+@dataclass
+class BatchStatus:
+    status: str
+    output: Optional[str] = None
+    errors: Optional[str] = None
+
+
+class BatchTransport(Protocol):
+    """Where batch files go: the OpenAI Batch API in production, a stand-in server or fake under test."""
+
+    def submit(self, jsonl: bytes, *, endpoint: str, completion_window: str, metadata: Dict[str, str]) -> str:
+        ...
+
+    def status(self, batch_id: str) -> BatchStatus:
+        ...
+
+
+def _file_text(content: Any) -> str:
+    text = getattr(content, "text", None)
+    if callable(text):
+        text = text()
+    if text is None:
+        raw = content.read() if hasattr(content, "read") else content
+        text = raw.decode("utf-8") if isinstance(raw, bytes) else str(raw)
+    return text
+
+
+class OpenAIBatchTransport:
+    """Files + Batches endpoints of an OpenAI client (point ``base_url`` at a stand-in server to test)."""
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+    def submit(self, jsonl: bytes, *, endpoint: str, completion_window: str, metadata: Dict[str, str]) -> str:
+        uploaded = self.client.files.create(file=("batch.jsonl", jsonl), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=endpoint,
+            completion_window=completion_window,
+            metadata=metadata,
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> BatchStatus:
+        batch = self.client.batches.retrieve(batch_id)
+        output = errors = None
+        if batch.status == _DONE or batch.status in _FAILED:
+            if getattr(batch, "output_file_id", None):
+                output = _file_text(self.client.files.content(batch.output_file_id))
+            if getattr(batch, "error_file_id", None):
+                errors = _file_text(self.client.files.content(batch.error_file_id))
+        return BatchStatus(batch.status, output, errors)
+
+
+def eligible(kind: str, task: Optional[Dict[str, Any]]) -> bool:
+    return bool(BATCH_ENABLED and task and task.get(BATCH_FIELD) and kind in BATCH_KINDS)
+
+
+def request_line(custom_id: str, request: Dict[str, Any], endpoint: str = BATCH_ENDPOINT) -> str:
+    return json.dumps(
+        {"custom_id": custom_id, "method": "POST", "url": endpoint, "body": request},
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+
+
+def output_text(body: Dict[str, Any]) -> Optional[str]:
+    """Text of a Responses API body from a batch output line (first message part with text)."""
+    for item in body.get("output") or []:
+        for part in item.get("content") or []:
+            if part.get("text"):
+                return part["text"]
+    return None
+
+
+def parse_results(output: Optional[str]) -> Dict[str, str]:
+    """``custom_id -> response text`` for every successful line of a batch output file."""
+    results: Dict[str, str] = {}
+    for line in (output or "").splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            continue
+        text = output_text(response.get("body") or {})
+        if text is not None and record.get("custom_id"):
+            results[record["custom_id"]] = text
+    return results
+
+
+class BatchLane:
+    """Collects LLM requests from non-urgent jobs and runs them through the Batch API.
+
+    A job marked ``"batch": true`` whose kind is in ``BATCH_KINDS`` does not
+    call the model: its request is queued here under the response-cache key
+    and the job is parked (``JobParked``). ``tick`` submits queued requests
+    as one JSONL file, polls active batches, writes each answer into the LLM
+    response cache and re-enqueues the parked jobs without the batch flag.
+    On that second run ``create_response`` is a cache hit, so the handler's
+    own persistence code stores the result. Requests whose batch failed or
+    expired simply run synchronously on the second pass.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        transport: BatchTransport,
+        *,
+        cache=None,
+        queue_name: str = "jobs",
+        prefix: str = BATCH_PREFIX,
+        max_requests: int = BATCH_MAX_REQUESTS,
+        max_wait_seconds: float = BATCH_MAX_WAIT_SECONDS,
+        completion_window: str = BATCH_COMPLETION_WINDOW,
+        clock=time.time,
+    ) -> None:
+        self.redis = redis_client
+        self.transport = transport
+        self.cache = cache
+        self.queue_name = queue_name
+        self.max_requests = max(1, max_requests)
+        self.max_wait_seconds = max_wait_seconds
+        self.completion_window = completion_window
+        self.clock = clock
+        self.pending_key = f"{prefix}:pending"
+        self.requests_key = f"{prefix}:requests"
+        self.active_key = f"{prefix}:active"
+        self.lock_key = f"{prefix}:lock"
+        self.waiting_prefix = f"{prefix}:waiting"
+
+    def _response_cache(self):
+        if self.cache is None:
+            from src.llm import _default_cache
+
+            self.cache = _default_cache()
+        return self.cache
+
+    # -- collecting ----------------------------------------------------------
+
+    def park(self, key: str, request: Dict[str, Any], *, kind: str, task: Dict[str, Any]) -> None:
+        """Queue ``request`` (deduplicated by cache key), remember the job, and raise ``JobParked``."""
+        self.redis.hset(self.requests_key, key, request_line(key, request))
+        self.redis.zadd(self.pending_key, {key: self.clock()}, nx=True)
+        self.redis.rpush(f"{self.waiting_prefix}:{key}", json.dumps(task, default=str))
+        metrics.increment("batch", "queued")
+        log_event("batch.queued", kind=kind, job_id=task.get("job_id"))
+        raise JobParked(f"{kind} queued for the batch lane")
+
+    # -- submitting and polling ----------------------------------------------
+
+    def tick(self) -> None:
+        # One replica at a time; the lock outlives a slow poll rather than letting two submit
+        token = uuid.uuid4().hex
+        if not self.redis.set(self.lock_key, token, nx=True, ex=max(60, int(BATCH_POLL_SECONDS * 5))):
+            return
+        try:
+            self.poll()
+            self.submit_due()
+        finally:
+            if self.redis.get(self.lock_key) == token:
+                self.redis.delete(self.lock_key)
+
+    def submit_due(self) -> Optional[str]:
+        oldest = self.redis.zrange(self.pending_key, 0, 0, withscores=True)
+        if not oldest:
+            return None
+        count = int(self.redis.zcard(self.pending_key))
+        if count < self.max_requests and self.clock() - float(oldest[0][1]) < self.max_wait_seconds:
+            return None
+        keys = list(self.redis.zrange(self.pending_key, 0, self.max_requests - 1))
+        lines = [line for line in (self.redis.hget(self.requests_key, key) for key in keys) if line]
+        if not lines:
+            self.redis.zrem(self.pending_key, *keys)
+            return None
+        try:
+            batch_id = self.transport.submit(
+                ("\n".join(lines) + "\n").encode("utf-8"),
+                endpoint=BATCH_ENDPOINT,
+                completion_window=self.completion_window,
+                metadata={"source": "worker"},
+            )
+        except Exception as err:
+            metrics.increment("batch", "submit_error")
+            log_event("batch.submit_failed", requests=len(lines), error=str(err))
+            return None
+        self.redis.hset(self.active_key, batch_id, json.dumps({"keys": keys, "submitted_at": self.clock()}))
+        self.redis.zrem(self.pending_key, *keys)
+        self.redis.hdel(self.requests_key, *keys)
+        metrics.increment("batch", "submitted")
+        log_event("batch.submitted", batch_id=batch_id, requests=len(lines))
+        return batch_id
+
+    def poll(self) -> None:
+        for batch_id, entry in (self.redis.hgetall(self.active_key) or {}).items():
+            try:
+                status = self.transport.status(batch_id)
+            except Exception as err:
+                log_event("batch.poll_failed", batch_id=batch_id, error=str(err))
+                continue
+            if status.status != _DONE and status.status not in _FAILED:
+                continue
+            keys = json.loads(entry).get("keys") or []
+            results = parse_results(status.output) if status.status == _DONE else {}
+            stored = self._store(results)
+            released = self._release(keys)
+            self.redis.hdel(self.active_key, batch_id)
+            metrics.increment("batch", status.status)
+            log_event(
+                "batch.finished",
+                batch_id=batch_id,
+                status=status.status,
+                requests=len(keys),
+                succeeded=stored,
+                released_jobs=released,
+            )
+
+    def _store(self, results: Dict[str, str]) -> int:
+        stored = 0
+        for key, text in results.items():
+            try:
+                self._response_cache().put(key, text)
+                stored += 1
+            except Exception as err:
+                log_event("batch.store_failed", error=str(err))
+        return stored
+
+    def _release(self, keys: Iterable[str]) -> int:
+        released = 0
+        now = self.clock()
+        for key in keys:
+            waiting_key = f"{self.waiting_prefix}:{key}"
+            # LPOP one at a time: a job parked while we drain is either popped here or left for its next batch
+            while True:
+                payload = self.redis.lpop(waiting_key)
+                if payload is None:
+                    break
+                task = json.loads(payload)
+                task.pop(BATCH_FIELD, None)
+                waited = queue_wait_seconds(task, now)
+                if waited is not None:
+                    metrics.observe("batch_wait_seconds", str(task.get("kind") or "unknown"), waited, buckets=BATCH_WAIT_BUCKETS)
+                # Queue wait measures time on the job queue; the batch turnaround is batch_wait_seconds
+                task.pop(ENQUEUED_AT_FIELD, None)
+                self.redis.lpush(self.queue_name, json.dumps(stamp_enqueued_at(task, now), default=str))
+                released += 1
+        metrics.increment("batch", "released", released)
+        return released
+
+    def depth(self) -> Dict[str, int]:
+        return {"pending": int(self.redis.zcard(self.pending_key)), "active": int(self.redis.hlen(self.active_key))}
+
+
+_lane: Optional[BatchLane] = None
+_lane_lock = threading.Lock()
+
+
+def get_lane() -> BatchLane:
+    global _lane
+    with _lane_lock:
+        if _lane is None:
+            import redis
+            from openai import OpenAI
+
+            client = OpenAI(base_url=BATCH_BASE_URL) if BATCH_BASE_URL else OpenAI()
+            _lane = BatchLane(
+                redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True),
+                OpenAIBatchTransport(client),
+                queue_name=os.getenv("JOB_QUEUE_NAME", "jobs"),
+            )
+    return _lane
+
+
+def start_batch_lane(interval: float = BATCH_POLL_SECONDS) -> Optional[threading.Thread]:
+    """Submit and poll batches on a timer in a daemon thread (no-op when BATCH_ENABLED=0)."""
+    if not BATCH_ENABLED:
+        return None
+
+    def loop() -> None:
+        while True:
+            try:
+                lane = get_lane()
+                lane.tick()
+                depth = lane.depth()
+                metrics.set_gauge("batch_pending_requests", depth["pending"])
+                metrics.set_gauge("batch_active", depth["active"])
+            except Exception as err:
+                log_event("batch.tick_error", error=str(err))
+            time.sleep(max(1.0, interval))
+
+    thread = threading.Thread(target=loop, name="batch-lane", daemon=True)
+    thread.start()
+    return thread
+
+
+__all__ = [
+    "BATCH_FIELD",
+    "BatchLane",
+    "BatchStatus",
+    "BatchTransport",
+    "OpenAIBatchTransport",
+    "eligible",
+    "get_lane",
+    "parse_results",
+    "request_line",
+    "start_batch_lane",
+]
@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, FrozenSet, Optional, Tuple
+
+from src.eventlog import log_event
+from src.jobs.registry import DeadlineExceeded, JobDeferred
+from src.metrics import metrics
+
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "1") not in ("0", "false", "False")
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "60"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_MAX_OPEN_SECONDS = float(os.getenv("BREAKER_MAX_OPEN_SECONDS", "300"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "2"))
+CONCURRENCY_MAX = int(os.getenv("DEPENDENCY_CONCURRENCY_MAX", "16"))
+CONCURRENCY_WAIT_SECONDS = float(os.getenv("DEPENDENCY_CONCURRENCY_WAIT_SECONDS", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_GAUGE = {CLOSED: 0.0, HALF_OPEN: 1.0, OPEN: 2.0}
+
+# A call slower than this counts against the dependency even when it succeeds
+DEFAULT_SLOW_CALL_SECONDS = {"openai": 90.0, "s3": 30.0, "internal_api": 5.0}
+
+# Which upstreams a job kind cannot finish without. Kinds not listed are never gated.
+DEFAULT_JOB_DEPENDENCIES: Dict[str, FrozenSet[str]] = {
+    "ingest_pdf": frozenset({"s3", "openai"}),
+    "extract_iep": frozenset({"openai"}),
+    "extract_eob": frozenset({"openai", "internal_api"}),
+    "prep_iep_diff": frozenset({"openai"}),
+    "denial_explain": frozenset({"openai"}),
+    "research_summary": frozenset({"openai"}),
+    "build_advocacy_outline": frozenset({"openai"}),
+    "generate_safety_phrase": frozenset({"openai"}),
+    "build_one_pager": frozenset({"openai"}),
+    "goal_smart": frozenset({"openai"}),
+    "prep_recommendations": frozenset({"openai"}),
+    "reembed_spans": frozenset({"openai"}),
+}
+
+
+def _parse_seconds(spec: Optional[str], default: Dict[str, float]) -> Dict[str, float]:
+    """Parse ``name=seconds`` pairs, e.g. ``openai=120,internal_api=3``, over ``default``."""
+    values = dict(default)
+    for chunk in (spec or "").split(","):
+        name, sep, value = chunk.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            values[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+BREAKER_SLOW_CALL_SECONDS = _parse_seconds(os.getenv("BREAKER_SLOW_CALL_SECONDS"), DEFAULT_SLOW_CALL_SECONDS)
+
+
+class DependencyUnavailable(JobDeferred):
+    """The circuit toward ``dependency`` is open (or saturated); retry the job later."""
+
+    def __init__(self, dependency: str, reason: str, delay_seconds: float) -> None:
+        super().__init__(reason, delay_seconds=delay_seconds)
+        self.dependency = dependency
+
+
+def status_code(err: BaseException) -> Optional[int]:
+    status = getattr(err, "status_code", None)
+    response = getattr(err, "response", None)
+    if status is None and isinstance(response, dict):
+        # botocore ClientError
+        status = (response.get("ResponseMetadata") or {}).get("HTTPStatusCode")
+    elif status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_dependency_failure(err: BaseException) -> bool:
+    """Server errors, timeouts and connection failures count; client errors and 429s don't.
+
+    A 4xx means the dependency answered (the request was wrong), and rate
+    limits are already handled by the shared limiter.
+    """
+    if isinstance(err, (JobDeferred, DeadlineExceeded)):
+        # Our own budget ran out; the dependency may be perfectly healthy
+        return False
+    status = status_code(err)
+    if status is None:
+        return True
+    return status >= 500 or status == 408
+
+
+class CircuitBreaker:
+    """Closed → open → half-open breaker over a rolling window of call outcomes.
+
+    The circuit opens once at least ``min_calls`` calls in the window have
+    completed and the share of failures (or of slow calls) reaches its
+    threshold. After ``open_seconds`` it lets ``half_open_probes`` calls
+    through; if they all succeed it closes, otherwise it reopens with the
+    open period doubled (up to ``max_open_seconds``).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window_seconds: float = BREAKER_WINDOW_SECONDS,
+        min_calls: int = BREAKER_MIN_CALLS,
+        error_rate: float = BREAKER_ERROR_RATE,
+        slow_call_seconds: float = 60.0,
+        slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        max_open_seconds: float = BREAKER_MAX_OPEN_SECONDS,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max(open_seconds, max_open_seconds)
+        self.half_open_probes = max(1, half_open_probes)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._open_for = open_seconds
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._last_error: Optional[str] = None
+        metrics.set_gauge(f"breaker_state.{name}", _STATE_GAUGE[CLOSED])
+
+    # -- state ---------------------------------------------------------------
+
+    def _current(self, now: float) -> str:
+        # Caller holds the lock. Open decays to half-open lazily on read.
+        if self._state == OPEN and now - self._opened_at >= self._open_for:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state: str, **fields: Any) -> None:
+        self._state = state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        metrics.set_gauge(f"breaker_state.{self.name}", _STATE_GAUGE[state])
+        metrics.increment("breaker", f"{self.name}.{state}")
+        log_event("breaker.state", dependency=self.name, state=state, **fields)
+
+    def _open(self, now: float, reason: str) -> None:
+        self._opened_at = now
+        self._outcomes.clear()
+        self._transition(OPEN, reason=reason, open_seconds=round(self._open_for, 3), error=self._last_error)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current(self.clock())
+
+    def retry_after(self) -> float:
+        with self._lock:
+            now = self.clock()
+            if self._current(now) != OPEN:
+                return 0.0
+            return max(0.0, self._open_for - (now - self._opened_at))
+
+    def admits(self) -> bool:
+        """Whether a new job depending on this circuit should start now."""
+        with self._lock:
+            state = self._current(self.clock())
+            return state == CLOSED or (state == HALF_OPEN and self._probes_in_flight < self.half_open_probes)
+
+    # -- calls ---------------------------------------------------------------
+
+    def before_call(self) -> None:
+        with self._lock:
+            now = self.clock()
+            state = self._current(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return
+            wait = self._open_for - (now - self._opened_at) if state == OPEN else self.open_seconds
+        metrics.increment("breaker", f"{self.name}.rejected")
+        raise DependencyUnavailable(self.name, f"circuit open for {self.name}", delay_seconds=_jitter(wait))
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot taken by ``before_call`` for a call that never ran."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record(self, ok: bool, latency: float, error: Optional[str] = None) -> None:
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            now = self.clock()
+            if error:
+                self._last_error = error[:200]
+            state = self._current(now)
+            if state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if not ok or slow:
+                    self._open_for = min(self.max_open_seconds, self._open_for * 2)
+                    self._open(now, "probe_failed" if not ok else "probe_slow")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._open_for = self.open_seconds
+                    self._transition(CLOSED)
+                return
+            if state == OPEN:
+                # Straggler from before the circuit opened
+                return
+            self._outcomes.append((now, ok, slow))
+            cutoff = now - self.window_seconds
+            while self._outcomes and self._outcomes[0][0] < cutoff:
+                self._outcomes.popleft()
+            total = len(self._outcomes)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, good, _ in self._outcomes if not good)
+            slow_calls = sum(1 for _, _, was_slow in self._outcomes if was_slow)
+            if failures / total >= self.error_rate:
+                self._open(now, "error_rate")
+            elif slow_calls / total >= self.slow_call_rate:
+                self._open(now, "slow_calls")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = self.clock()
+            state = self._current(now)
+            total = len(self._outcomes)
+            failures = sum(1 for _, good, _ in self._outcomes if not good)
+            return {
+                "state": state,
+                "calls": total,
+                "error_rate": round(failures / total, 3) if total else 0.0,
+                "retry_after_seconds": round(max(0.0, self._open_for - (now - self._opened_at)), 3) if state == OPEN else 0.0,
+                "last_error": self._last_error,
+            }
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit: +1 per window of healthy calls, halved on failure or slowness."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        maximum: int = CONCURRENCY_MAX,
+        minimum: int = 1,
+        wait_seconds: float = CONCURRENCY_WAIT_SECONDS,
+    ) -> None:
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.wait_seconds = wait_seconds
+        self._limit = float(self.maximum)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        metrics.set_gauge(f"concurrency_limit.{name}", self._limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> None:
+        deadline = time.monotonic() + self.wait_seconds
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.increment("breaker", f"{self.name}.saturated")
+                    raise DependencyUnavailable(
+                        self.name,
+                        f"concurrency limit {int(self._limit)} reached for {self.name}",
+                        delay_seconds=_jitter(10.0),
+                    )
+                self._cond.wait(remaining)
+            self._in_flight += 1
+
+    def release(self, ok: bool, slow: bool) -> None:
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if ok and not slow:
+                self._limit = min(float(self.maximum), self._limit + 1.0 / self._limit)
+            else:
+                self._limit = max(float(self.minimum), self._limit / 2.0)
+            metrics.set_gauge(f"concurrency_limit.{self.name}", round(self._limit, 3))
+            self._cond.notify()
+
+
+class Dependency:
+    """An upstream guarded by a circuit breaker and an adaptive concurrency limit."""
+
+    def __init__(self, name: str, *, breaker: Optional[CircuitBreaker] = None, limit: Optional[AdaptiveLimit] = None) -> None:
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name, slow_call_seconds=BREAKER_SLOW_CALL_SECONDS.get(name, 60.0))
+        self.limit = limit or AdaptiveLimit(name)
+
+    def call(self, fn: Callable[[], Any], *, failed: Optional[Callable[[Any], bool]] = None):
+        """Run ``fn`` through the breaker; ``failed`` flags bad results that did not raise (e.g. a 503 response)."""
+        self.breaker.before_call()
+        try:
+            self.limit.acquire()
+        except DependencyUnavailable:
+            self.breaker.release_probe()
+            raise
+        start = time.perf_counter()
+        ok, error = True, None
+        try:
+            result = fn()
+            if failed is not None and failed(result):
+                ok, error = False, f"bad response: {getattr(result, 'status_code', result)!r}"
+            return result
+        except Exception as err:
+            ok = not is_dependency_failure(err)
+            error = None if ok else f"{type(err).__name__}: {err}"
+            raise
+        finally:
+            latency = time.perf_counter() - start
+            self.limit.release(ok, latency >= self.breaker.slow_call_seconds)
+            self.breaker.record(ok, latency, error)
+            if not ok:
+                metrics.increment("breaker", f"{self.name}.failure")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.breaker.snapshot(), "concurrency_limit": self.limit.limit, "in_flight": self.limit.in_flight}
+
+
+def _jitter(seconds: float) -> float:
+    # Spread deferred jobs so they don't all come back the instant a circuit half-opens
+    return max(1.0, seconds) * random.uniform(1.0, 1.25)
+
+
+_dependencies: Dict[str, Dependency] = {}
+_dependencies_lock = threading.Lock()
+
+
+def dependency(name: str) -> Dependency:
+    with _dependencies_lock:
+        dep = _dependencies.get(name)
+        if dep is None:
+            dep = _dependencies[name] = Dependency(name)
+        return dep
+
+
+def guarded(name: str, fn: Callable[[], Any], *, failed: Optional[Callable[[Any], bool]] = None):
+    """Call ``fn`` through the ``name`` dependency's breaker (or directly when BREAKER_ENABLED=0)."""
+    if not BREAKER_ENABLED:
+        return fn()
+    return dependency(name).call(fn, failed=failed)
+
+
+def check_job(kind: str, job_dependencies: Optional[Dict[str, FrozenSet[str]]] = None) -> None:
+    """Raise ``DependencyUnavailable`` if a dependency of ``kind`` has an open circuit.
+
+    The runner calls this before dispatch so jobs that would only fail go
+    straight to the retry set, due back around when the circuit half-opens.
+    """
+    if not BREAKER_ENABLED:
+        return
+    table = DEFAULT_JOB_DEPENDENCIES if job_dependencies is None else job_dependencies
+    for name in sorted(table.get(kind, ())):
+        dep = dependency(name)
+        if not dep.breaker.admits():
+            metrics.increment("breaker", f"{name}.job_deferred")
+            wait = dep.breaker.retry_after() or dep.breaker.open_seconds
+            raise DependencyUnavailable(name, f"circuit open for {name}", delay_seconds=_jitter(wait))
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    with _dependencies_lock:
+        deps = list(_dependencies.values())
+    return {dep.name: dep.snapshot() for dep in deps}
+
+
+def reset() -> None:
+    with _dependencies_lock:
+        _dependencies.clear()
+
+
+__all__ = [
+    "AdaptiveLimit",
+    "CircuitBreaker",
+    "Dependency",
+    "DependencyUnavailable",
+    "check_job",
+    "dependency",
+    "guarded",
+    "is_dependency_failure",
+    "snapshot",
+]
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import math
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "60"))
+CHUNK_MERGE_PAGES = os.getenv("CHUNK_MERGE_PAGES", "0") in ("1", "true", "True")
+TOKENIZER_ENCODING = os.getenv("CHUNK_TOKENIZER_ENCODING", "cl100k_base")
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n+")
+# Sentence end: terminal punctuation (optionally closed by quotes/brackets) followed by whitespace
+_SENTENCE_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n(?=\s*(?:[-*•]|\d+[.)])\s)")
+_WORD_RE = re.compile(r"\S+\s*")
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+TokenCounter = Callable[[str], int]
+
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly tracks BPE tokenizers: one token per word/punctuation piece, plus
+    # extra tokens for long words that get split into sub-words.
+    total = 0
+    for piece in _PIECE_RE.findall(text):
+        total += 1 + len(piece) // 8
+    return total
+
+
+def _load_token_counter() -> TokenCounter:
+    try:
+        import tiktoken  # type: ignore
+
+        encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        return _estimate_tokens
+
+    def _count(text: str) -> int:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return _count
+
+
+_token_counter: Optional[TokenCounter] = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count from the local tokenizer (tiktoken when installed, estimate otherwise)."""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = _load_token_counter()
+    return _token_counter(text or "")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    text: str
+    page: int
+    pages: Tuple[int, ...]
+    token_count: int
+
+
+@dataclass(frozen=True)
+class _Unit:
+    text: str
+    page: int
+    tokens: int
+    paragraph_start: bool
+
+
+def _split_long(text: str, max_tokens: int, counter: TokenCounter) -> Iterator[str]:
+    """Split an oversized sentence on word boundaries (hard-cutting giant words)."""
+    buf: List[str] = []
+    buf_tokens = 0
+    for match in _WORD_RE.finditer(text):
+        word = match.group(0)
+        word_tokens = counter(word)
+        if word_tokens > max_tokens:
+            if buf:
+                yield "".join(buf)
+                buf, buf_tokens = [], 0
+            step = max(1, math.floor(len(word) * max_tokens / word_tokens))
+            for start in range(0, len(word), step):
+                yield word[start : start + step]
+            continue
+        if buf and buf_tokens + word_tokens > max_tokens:
+            yield "".join(buf)
+            buf, buf_tokens = [], 0
+        buf.append(word)
+        buf_tokens += word_tokens
+    if buf:
+        yield "".join(buf)
+
+
+def _units(page: int, text: str, max_tokens: int, counter: TokenCounter) -> Iterator[_Unit]:
+    for paragraph in _PARAGRAPH_RE.split(text or ""):
+        if not paragraph.strip():
+            continue
+        first = True
+        for sentence in _SENTENCE_RE.split(paragraph):
+            sentence = (sentence or "").strip()
+            if not sentence:
+                continue
+            tokens = counter(sentence)
+            pieces = [sentence] if tokens <= max_tokens else list(_split_long(sentence, max_tokens, counter))
+            for piece in pieces:
+                piece = piece.strip()
+                if not piece:
+                    continue
+                yield _Unit(piece, page, tokens if len(pieces) == 1 else counter(piece), first)
+                first = False
+
+
+class Chunker:
+    """Sentence-aware chunker that packs units up to a token target.
+
+    Pages are consumed lazily and chunks are yielded as soon as they fill, so
+    memory stays bounded by one chunk plus the overlap window. Every sentence
+    is tokenized exactly once, keeping the whole pass linear in input size.
+    """
+
+    def __init__(
+        self,
+        *,
+        target_tokens: int = CHUNK_TARGET_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        merge_pages: bool = CHUNK_MERGE_PAGES,
+        token_counter: Optional[TokenCounter] = None,
+    ) -> None:
+        self.target_tokens = max(16, int(target_tokens))
+        self.overlap_tokens = max(0, min(int(overlap_tokens), self.target_tokens // 2))
+        self.merge_pages = merge_pages
+        self.count = token_counter or count_tokens
+
+    def chunk_pages(self, pages: Iterable[dict]) -> Iterator[Chunk]:
+        window: Deque[_Unit] = deque()
+        window_tokens = 0
+        fresh = 0  # units in the window not yet emitted in a previous chunk
+
+        def emit() -> Chunk:
+            parts: List[str] = []
+            for idx, unit in enumerate(window):
+                if idx:
+                    parts.append("\n\n" if unit.paragraph_start else " ")
+                parts.append(unit.text)
+            page_list = tuple(dict.fromkeys(unit.page for unit in window))
+            return Chunk("".join(parts), page_list[0], page_list, window_tokens)
+
+        def carry_overlap() -> None:
+            nonlocal window_tokens
+            kept: Deque[_Unit] = deque()
+            kept_tokens = 0
+            while window and kept_tokens + window[-1].tokens <= self.overlap_tokens:
+                unit = window.pop()
+                kept.appendleft(unit)
+                kept_tokens += unit.tokens
+            window.clear()
+            window.extend(kept)
+            window_tokens = kept_tokens
+
+        for page in pages:
+            page_no = int(page.get("page") or 0)
+            if not self.merge_pages and fresh:
+                yield emit()
+                window.clear()
+                window_tokens = 0
+                fresh = 0
+            elif not self.merge_pages:
+                window.clear()
+                window_tokens = 0
+            for unit in _units(page_no, page.get("text") or "", self.target_tokens, self.count):
+                if fresh and window_tokens + unit.tokens > self.target_tokens:
+                    yield emit()
+                    carry_overlap()
+                    fresh = 0
+                    while window and window_tokens + unit.tokens > self.target_tokens:
+                        window_tokens -= window.popleft().tokens
+                window.append(unit)
+                window_tokens += unit.tokens
+                fresh += 1
+        if fresh:
+            yield emit()
+
+
+def chunk_pages(pages: Iterable[dict], **kwargs) -> Iterator[Chunk]:
+    return Chunker(**kwargs).chunk_pages(pages)
+
+
+__all__ = ["Chunk", "Chunker", "chunk_pages", "count_tokens"]
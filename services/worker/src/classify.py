@@ -1,7 +1,11 @@
-import os, json, re
+import os, json
 from typing import List, Dict
 from openai import OpenAI
 
+from src.keywords import KeywordMatcher
+from src.llm import create_response
+from src.prompts import build_messages
+
 MODEL = os.getenv("OPENAI_MODEL_NANO", "gpt-5-nano")
 
 LABELS = ["iep","eob","denial_letter","therapy_notes","provider_letter","eval_report","other"]
@@ -40,58 +44,49 @@ SCHEMA = {
 
 Classification = Dict[str, List[str] | str | None]
 
-def heuristics(filename:str, sample:str = "") -> Classification:
-  f = (filename or "").lower()
-  text = (sample or "").lower()
-  doc_type = None
-  if "eob" in f:
-    doc_type = "eob"
-  elif "denial" in f:
-    doc_type = "denial_letter"
-  elif "iep" in f:
-    doc_type = "iep"
-  elif re.search(r"progress|session|therapy", f):
-    doc_type = "therapy_notes"
-  elif re.search(r"eval|evaluation|assessment", f):
-    doc_type = "eval_report"
+# Filename rules in priority order: the first one that matches sets doc_type
+DOC_TYPE_KEYWORDS = KeywordMatcher({
+  "eob": ["eob"],
+  "denial_letter": ["denial"],
+  "iep": ["iep"],
+  "therapy_notes": ["progress", "session", "therapy"],
+  "eval_report": ["eval", "evaluation", "assessment"],
+})
 
-  domains: List[str] = []
-  domain_keywords = [
-    ("speech", "speech_language"),
-    ("language", "speech_language"),
-    ("ot ", "occupational_therapy"),
-    ("occupational therapy", "occupational_therapy"),
-    ("pta", "physical_therapy"),
-    ("physical therapy", "physical_therapy"),
-    ("behavior", "behavior"),
-    ("aba", "behavior"),
-    ("reading", "academic"),
-    ("math", "academic"),
-    ("social", "social_emotional"),
-    ("emotional", "social_emotional"),
-    ("medical", "medical"),
-    ("assistive", "assistive_technology"),
-    ("device", "assistive_technology"),
-    ("transport", "transportation")
-  ]
-  for token, domain in domain_keywords:
-    if token in text:
-      domains.append(domain)
-  domains = sorted(set(domains))
+DOMAIN_KEYWORDS = KeywordMatcher({
+  "speech_language": ["speech", "language"],
+  "occupational_therapy": ["ot ", "occupational therapy"],
+  "physical_therapy": ["pta", "physical therapy"],
+  "behavior": ["behavior", "aba"],
+  "academic": ["reading", "math"],
+  "social_emotional": ["social", "emotional"],
+  "medical": ["medical"],
+  "assistive_technology": ["assistive", "device"],
+  "transportation": ["transport"],
+})
+
+def heuristics(filename:str, sample:str = "") -> Classification:
+  doc_types = DOC_TYPE_KEYWORDS.matched(filename or "")
+  doc_type = doc_types[0] if doc_types else None
+  domains = sorted(DOMAIN_KEYWORDS.hits(sample or ""))
   return {"doc_type": doc_type, "domains": domains}
 
 def classify_text(doc_text:str, filename:str) -> Classification:
   client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
   heur = heuristics(filename, doc_text)
-  prompt = f"""Filename: {filename}
-
-Text sample:
-{(doc_text or '')[:4000]}"""
+  # Filename last: it differs on every upload, the instructions and schema never do
+  messages = build_messages(
+    f"Classify the document. Return doc_type (one of {', '.join(LABELS)}) and up to 3 evaluation domains from {DOMAINS}.",
+    documents=[f"Text sample:\n{(doc_text or '')[:4000]}"],
+    request=[f"Filename: {filename}"],
+    joiner="\n\n",
+  )
   try:
-    resp = client.responses.create(
+    resp = create_response(
+      client,
+      kind="classify",
       model=MODEL,
-      input=[{"role":"system","content":f"Classify the document. Return doc_type (one of {', '.join(LABELS)}) and up to 3 evaluation domains from {DOMAINS}."},
-             {"role":"user","content": prompt}],
+      input=messages,
       response_format={ "type":"json_schema", "json_schema": SCHEMA }
     )
     parsed = json.loads(resp.output[0].content[0].text)
@@ -1,6 +1,8 @@
 import os, time
 import psycopg
 
+from src.eventlog import log_event
+
 RETENTION_DAYS = int(os.getenv("RETENTION_DAYS","365"))
 DB_URL = os.getenv("DATABASE_URL")
 
@@ -17,6 +19,6 @@ if __name__ == "__main__":
     try:
       purge()
     except Exception as e:
-      print("[CRON] purge error", e, flush=True)
+      log_event("cron.purge_error", error=str(e))
     time.sleep(24*3600)
 
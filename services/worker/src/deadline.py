@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import contextvars
+import os
+import signal
+import subprocess
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, TypeVar
+
+from src.eventlog import log_event
+from src.metrics import metrics
+
+# Keep under JOB_VISIBILITY_TIMEOUT_SECONDS (300) so a stuck job is cancelled
+# here rather than requeued onto another worker that hangs the same way
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "240"))
+# Calls are not started with less budget than this; they could only time out
+DEADLINE_MIN_CALL_SECONDS = float(os.getenv("DEADLINE_MIN_CALL_SECONDS", "0.5"))
+
+# OCR and backfill slices (BACKFILL_SLICE_SECONDS, 240) need the most room
+DEFAULT_JOB_DEADLINES = {"ingest_pdf": 280.0, "reembed_spans": 280.0}
+
+
+def parse_deadlines(spec: Optional[str]) -> Dict[str, float]:
+    """Parse ``kind=seconds`` pairs, e.g. ``ingest_pdf=280,goal_smart=60`` (``0`` disables the deadline)."""
+    deadlines: Dict[str, float] = {}
+    for chunk in (spec or "").split(","):
+        kind, sep, value = chunk.partition("=")
+        kind = kind.strip().lower()
+        if not kind or not sep:
+            continue
+        try:
+            deadlines[kind] = float(value)
+        except ValueError:
+            continue
+    return deadlines
+
+
+JOB_DEADLINES = {**DEFAULT_JOB_DEADLINES, **parse_deadlines(os.getenv("JOB_DEADLINES"))}
+
+clock = time.monotonic
+T = TypeVar("T")
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("job_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The job ran past its deadline; the call in ``what`` was cancelled (or never started)."""
+
+    def __init__(self, reason: str, what: str = ""):
+        super().__init__(reason)
+        self.what = what
+
+
+def deadline_for(kind: str) -> Optional[float]:
+    seconds = JOB_DEADLINES.get((kind or "").strip().lower(), JOB_DEADLINE_SECONDS)
+    return seconds if seconds and seconds > 0 else None
+
+
+@contextmanager
+def job_deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Run the block under a deadline ``seconds`` from now (no deadline if None).
+
+    The deadline lives in a context variable: worker threads only see it if
+    started through ``contextvars.copy_context().run``.
+    """
+    token = _deadline.set(None if seconds is None else clock() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current job's deadline, or None outside a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - clock()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def _exceeded(what: str) -> DeadlineExceeded:
+    metrics.increment("deadline_cancelled", what)
+    log_event("deadline.cancelled", what=what)
+    return DeadlineExceeded(f"job deadline passed during {what}", what)
+
+
+def timeout(what: str, cap: Optional[float] = None) -> Optional[float]:
+    """Timeout for the next blocking call: what is left of the deadline, at most ``cap``.
+
+    Raises ``DeadlineExceeded`` when too little is left to start the call.
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left < DEADLINE_MIN_CALL_SECONDS:
+        raise _exceeded(what)
+    return left if cap is None else min(cap, left)
+
+
+def check(what: str) -> None:
+    if expired():
+        raise _exceeded(what)
+
+
+@contextmanager
+def bounded(what: str, cap: Optional[float] = None) -> Iterator[Optional[float]]:
+    """Yield the call's timeout; a failure once the deadline has passed becomes ``DeadlineExceeded``.
+
+    Client libraries report the timeout in their own way (``APITimeoutError``,
+    ``ReadTimeout``, ``QueryCanceled``); callers see one exception type, and
+    the circuit breakers don't count our own budget running out as an
+    upstream failure.
+    """
+    limit = timeout(what, cap)
+    try:
+        yield limit
+    except DeadlineExceeded:
+        raise
+    except Exception as err:
+        if expired():
+            raise _exceeded(what) from err
+        raise
+
+
+def within(what: str, fn: Callable[..., T], *, cap: Optional[float] = None) -> T:
+    """Call ``fn(**options)`` under ``bounded``; ``options`` holds ``timeout`` only when there is one.
+
+    Omitting it matters: OpenAI and requests treat an explicit
+    ``timeout=None`` as "wait forever" rather than "use the default".
+    """
+    with bounded(what, cap) as limit:
+        return fn(**({} if limit is None else {"timeout": limit}))
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run(
+    args: Sequence[str],
+    *,
+    what: str,
+    check: bool = False,
+    capture_output: bool = False,
+    **kwargs: Any,
+) -> subprocess.CompletedProcess:
+    """``subprocess.run`` bounded by the job deadline.
+
+    The child gets its own process group, so on timeout the whole group is
+    killed: tools like ocrmypdf fan out to tesseract/ghostscript workers that
+    would otherwise outlive the parent.
+    """
+    limit = timeout(what)
+    if capture_output:
+        kwargs.setdefault("stdout", subprocess.PIPE)
+        kwargs.setdefault("stderr", subprocess.PIPE)
+    with subprocess.Popen(args, start_new_session=True, **kwargs) as proc:
+        try:
+            stdout, stderr = proc.communicate(timeout=limit)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc)
+            proc.communicate()
+            raise _exceeded(what) from None
+        except BaseException:
+            _kill_group(proc)
+            raise
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+
+
+def apply_statement_timeout(conn) -> None:
+    """Cap every statement on ``conn`` at what is left of the job deadline (no-op outside one)."""
+    left = remaining()
+    if left is None:
+        return
+    if left < DEADLINE_MIN_CALL_SECONDS:
+        raise _exceeded("db")
+    conn.execute("SELECT set_config('statement_timeout', %s, false)", (str(max(1, int(left * 1000))),))
+    conn.commit()
+
+
+__all__ = [
+    "DeadlineExceeded",
+    "JOB_DEADLINES",
+    "apply_statement_timeout",
+    "bounded",
+    "check",
+    "deadline_for",
+    "expired",
+    "job_deadline",
+    "parse_deadlines",
+    "remaining",
+    "run",
+    "timeout",
+    "within",
+]
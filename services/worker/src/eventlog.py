@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import atexit
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, TextIO, Tuple
+
+DEFAULT_CAPACITY = int(os.getenv("WORKER_LOG_BUFFER_SIZE", "10000"))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("WORKER_LOG_FLUSH_INTERVAL", "0.25"))
+DEFAULT_BATCH_SIZE = int(os.getenv("WORKER_LOG_BATCH_SIZE", "500"))
+
+_Record = Tuple[float, str, Dict[str, Any]]
+
+
+def _iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def parse_sample_rates(spec: Optional[str]) -> Dict[str, float]:
+    """Parse ``event=rate`` pairs, e.g. ``job.attempt_failed=0.1,queue.depth=0.5``."""
+    rates: Dict[str, float] = {}
+    for chunk in (spec or "").split(","):
+        name, sep, value = chunk.partition("=")
+        name = name.strip()
+        if not name or not sep:
+            continue
+        try:
+            rates[name] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+class EventLogger:
+    """Structured JSON logger that keeps serialization and I/O off the caller's thread.
+
+    ``emit`` only appends to a bounded ring buffer. A daemon thread drains the
+    buffer in batches, serializes each record, and writes the batch with a
+    single ``write``. When the buffer is full the oldest record is dropped and
+    counted, so a stalled stdout can never block job processing.
+    """
+
+    def __init__(
+        self,
+        *,
+        stream: Optional[TextIO] = None,
+        capacity: int = DEFAULT_CAPACITY,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        sample_rates: Optional[Dict[str, float]] = None,
+        random_fn: Callable[[], float] = random.random,
+    ) -> None:
+        self._stream = stream
+        self._buffer: Deque[_Record] = deque(maxlen=max(1, capacity))
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._flush_interval = max(0.01, flush_interval)
+        self._batch_size = max(1, batch_size)
+        self._sample_rates = dict(sample_rates or {})
+        self._random = random_fn
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"emitted": 0, "written": 0, "dropped": 0, "sampled_out": 0, "write_errors": 0}
+
+    # ---- producer side -----------------------------------------------------
+
+    def emit(self, event: str, **fields: Any) -> None:
+        rate = self._sample_rates.get(event)
+        if rate is not None and rate < 1.0 and self._random() >= rate:
+            with self._lock:
+                self._stats["sampled_out"] += 1
+            return
+        if rate is not None and 0.0 < rate < 1.0:
+            fields.setdefault("sample_rate", rate)
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._stats["dropped"] += 1
+            self._buffer.append((time.time(), event, fields))
+            self._stats["emitted"] += 1
+            self._idle.clear()
+            pending = len(self._buffer)
+        self._ensure_thread()
+        if pending >= self._batch_size:
+            self._wakeup.set()
+
+    def set_sample_rate(self, event: str, rate: Optional[float]) -> None:
+        with self._lock:
+            if rate is None:
+                self._sample_rates.pop(event, None)
+            else:
+                self._sample_rates[event] = min(1.0, max(0.0, float(rate)))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "buffered": len(self._buffer)}
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything buffered so far has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return True
+        self._wakeup.set()
+        return self._idle.wait(timeout)
+
+    # ---- writer side -------------------------------------------------------
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            self._drain()
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                if not self._buffer:
+                    self._idle.set()
+                    return
+                count = min(len(self._buffer), self._batch_size)
+                batch = [self._buffer.popleft() for _ in range(count)]
+            self._write(batch)
+
+    def _write(self, batch: list[_Record]) -> None:
+        lines = []
+        for ts, event, fields in batch:
+            payload = {"ts": _iso(ts), "event": event, **fields}
+            try:
+                lines.append(json.dumps(payload, default=str))
+            except Exception:
+                lines.append(json.dumps({"ts": payload["ts"], "event": event, "repr": repr(fields)}))
+        stream = self._stream or sys.stdout
+        try:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except Exception:
+            with self._lock:
+                self._stats["write_errors"] += 1
+            return
+        with self._lock:
+            self._stats["written"] += len(batch)
+
+
+logger = EventLogger(sample_rates=parse_sample_rates(os.getenv("WORKER_LOG_SAMPLE_RATES")))
+atexit.register(logger.flush, 2.0)
+
+
+def log_event(event: str, **fields: Any) -> None:
+    logger.emit(event, **fields)
+
+
+__all__ = ["EventLogger", "log_event", "logger", "parse_sample_rates"]
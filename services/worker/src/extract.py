@@ -1,9 +1,21 @@
-import os, json, datetime
+import os, json, datetime, re, time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 import requests
 import psycopg
 from psycopg.types.json import Json
 
+from src.breaker import guarded
+from src.deadline import DeadlineExceeded, apply_statement_timeout, within
+from src.eventlog import log_event
+from src.jobs.registry import JobDeferred
+from src.chunking import count_tokens
+from src.packing import budget_for, split_windows, trim_to_tokens
+from src.llm import LLM_CACHE_BYPASS_FIELD, create_response
+from src.routing import org_tier
+from src.prompts import build_messages
+
 MODEL = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
 API_URL = os.getenv("API_URL", "http://api:8080")
 _default_internal = "dev-internal" if os.getenv("NODE_ENV") != "production" else None
@@ -11,6 +23,12 @@ INTERNAL_KEY = os.getenv("INTERNAL_API_KEY") or (_default_internal or "")
 if not INTERNAL_KEY:
     raise RuntimeError("INTERNAL_API_KEY must be set for worker EOB ingestion")
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Safety cap on spans read for one IEP; windows cover all of them
+IEP_MAX_SPANS = int(os.getenv("IEP_MAX_SPANS", "2000"))
+# Excerpt tokens per map window (0: the extract_iep prompt budget)
+IEP_WINDOW_TOKENS = int(os.getenv("IEP_WINDOW_TOKENS", "0"))
+IEP_MAP_CONCURRENCY = int(os.getenv("IEP_MAP_CONCURRENCY", "4"))
+IEP_SYSTEM_PROMPT = "You are Joslyn, a special education assistant. Extract concrete details without inventing."
 
 IEP_SCHEMA = {
     "name": "IepSnapshot",
@@ -91,7 +109,7 @@ def _parse_date(value: str | None) -> datetime.date | None:
         return None
 
 
-def _fetch_segments(conn: psycopg.Connection, document_id: str, limit: int = 80) -> list[dict]:
+def _fetch_segments(conn: psycopg.Connection, document_id: str, limit: int = IEP_MAX_SPANS) -> list[dict]:
     rows = conn.execute(
         """
         SELECT ds.id::text, ds.page, ds.text, ds.document_id, d.original_name
@@ -117,19 +135,164 @@ def _fetch_segments(conn: psycopg.Connection, document_id: str, limit: int = 80)
     return segments
 
 
+def _iep_messages(window, index: int, total: int) -> list[dict]:
+    request = []
+    if total > 1:
+        request.append(f"These excerpts are part {index} of {total} of the document; extract only what appears in them.")
+    return build_messages(
+        IEP_SYSTEM_PROMPT,
+        instructions=[
+            "Summarize the following IEP excerpts.",
+            "Return structured JSON matching the schema with services, goals, accommodations, placement, and meeting dates.",
+            "Include excerpt labels in each item's citations array so staff can trace back to the source."
+        ],
+        documents=["Excerpts:", *window.render()],
+        request=request,
+    )
+
+
+def _extract_window(client, task: dict, window, index: int, total: int, tier: str | None = None) -> dict:
+    response = create_response(
+        client,
+        kind="extract_iep",
+        bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+        tier=tier,
+        model=MODEL,
+        input=_iep_messages(window, index, total),
+        response_format={"type": "json_schema", "json_schema": IEP_SCHEMA}
+    )
+    raw = response.output[0].content[0].text if response.output and response.output[0].content else None
+    if not raw:
+        raise ValueError("empty iep extraction response")
+    return json.loads(raw)
+
+
+def _normalize(value) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(value or "").lower()).strip()
+
+
+def _empty(value) -> bool:
+    return value is None or value == "" or value == []
+
+
+# Items describing the same thing across windows share these normalized fields
+_MERGE_KEYS = {
+    "services": ("name",),
+    "goals": ("area", "target"),
+    "accommodations": ("name",),
+}
+
+
+def merge_iep_extractions(parts: list[dict], label_map: dict) -> dict:
+    """Merge per-window IEP extractions in window (page) order.
+
+    Items with the same normalized key are folded into the first occurrence:
+    its empty fields are filled from later ones and citations are unioned in
+    order. Citations not in ``label_map`` are dropped. Placement and dates
+    come from the first window that states them; notes are deduplicated.
+    The result only depends on the order of ``parts``.
+    """
+    merged: dict = {}
+    for field, key_fields in _MERGE_KEYS.items():
+        items: list[dict] = []
+        by_key: dict = {}
+        for part in parts:
+            for item in part.get(field) or []:
+                if not isinstance(item, dict):
+                    continue
+                key = tuple(_normalize(item.get(name)) for name in key_fields)
+                if not any(key):
+                    continue
+                citations = []
+                for label in item.get("citations") or []:
+                    label = str(label).strip()
+                    if label in label_map and label not in citations:
+                        citations.append(label)
+                existing = by_key.get(key)
+                if existing is None:
+                    existing = by_key[key] = {**item, "citations": citations}
+                    items.append(existing)
+                    continue
+                for name, value in item.items():
+                    if name != "citations" and _empty(existing.get(name)) and not _empty(value):
+                        existing[name] = value
+                existing["citations"].extend(c for c in citations if c not in existing["citations"])
+        merged[field] = items
+
+    for field in ("placement", "start_date", "end_date"):
+        merged[field] = next((part.get(field) for part in parts if not _empty(part.get(field))), None)
+
+    notes: list[str] = []
+    seen_notes = set()
+    for part in parts:
+        for note in part.get("notes") or []:
+            key = _normalize(note)
+            if key and key not in seen_notes:
+                seen_notes.add(key)
+                notes.append(str(note).strip())
+    merged["notes"] = notes
+    return merged
+
+
+def _map_reduce_extract(client, task: dict, segments: list[dict], tier: str | None = None) -> dict:
+    """Extract every window of the document concurrently, then merge the results.
+
+    A window that fails is skipped (and noted) as long as at least one
+    succeeds; a deferral (rate limit, open circuit) defers the whole job.
+    """
+    budget = IEP_WINDOW_TOKENS or budget_for("extract_iep", MODEL)
+    windows = split_windows(segments, budget)
+    total = len(windows)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(IEP_MAP_CONCURRENCY, total)), thread_name_prefix="iep-map") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _extract_window, client, task, window, index, total, tier) for index, window in enumerate(windows, start=1)]
+        parts: list[dict] = []
+        failed_pages: list[str] = []
+        first_error = None
+        for window, future in zip(windows, futures):
+            try:
+                parts.append(future.result())
+            except JobDeferred:
+                raise
+            except Exception as err:
+                first_error = first_error or err
+                pages = [seg["page"] for seg in window.segments if seg.get("page") is not None]
+                failed_pages.append(f"{min(pages)}-{max(pages)}" if pages else "?")
+                log_event("extract_iep.window_failed", document_id=task.get("document_id"), pages=failed_pages[-1], error=str(err))
+    if not parts:
+        raise first_error or ValueError("no iep windows extracted")
+
+    label_map: dict = {}
+    for window in windows:
+        label_map.update(window.label_map)
+    data = merge_iep_extractions(parts, label_map)
+    if failed_pages:
+        data["notes"].append(f"Pages {', '.join(failed_pages)} could not be extracted.")
+    log_event(
+        "extract_iep.map_reduce",
+        document_id=task.get("document_id"),
+        spans=len(segments),
+        windows=total,
+        failed_windows=len(failed_pages),
+        duration_ms=int((time.perf_counter() - started) * 1000),
+    )
+    return data
+
+
 def extract_iep(task: dict):
     document_id = task.get("document_id")
     org_id = task.get("org_id")
     child_id = task.get("child_id")
-    print(f"[EXTRACT] IEP for document_id={document_id}")
+    log_event("extract_iep.start", document_id=document_id)
     if not document_id or not DATABASE_URL:
         return {"status": "skipped"}
 
     client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     try:
         with psycopg.connect(DATABASE_URL) as conn:
+            apply_statement_timeout(conn)
             _set_org_context(conn, org_id)
-            segments = _fetch_segments(conn, document_id, limit=80)
+            segments = _fetch_segments(conn, document_id)
             if not segments:
                 conn.execute(
                     """
@@ -149,46 +312,10 @@ def extract_iep(task: dict):
                 conn.commit()
                 return {"status": "empty"}
 
-            label_map = {seg["label"]: seg for seg in segments}
-            prompt_parts = [
-                "Summarize the following IEP excerpts.",
-                "Return structured JSON matching the schema with services, goals, accommodations, placement, and meeting dates.",
-                "Include excerpt labels in each item's citations array so staff can trace back to the source."
-            ]
-            prompt_parts.append("Excerpts:")
-            for seg in segments:
-                prompt_parts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text'][:800]}")
-            prompt = "\n".join(prompt_parts)
-
-            response = client.responses.create(
-                model=MODEL,
-                input=[
-                    {"role": "system", "content": "You are Joslyn, a special education assistant. Extract concrete details without inventing."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_schema", "json_schema": IEP_SCHEMA}
-            )
-            raw = response.output[0].content[0].text if response.output and response.output[0].content else None
-            if not raw:
-                raise ValueError("empty iep extraction response")
-            data = json.loads(raw)
-
-            def _resolve(items: list[dict]) -> list[dict]:
-                resolved = []
-                for item in items or []:
-                    citations = []
-                    for label in item.get("citations") or []:
-                        label = str(label).strip()
-                        if label and label in label_map:
-                            citations.append(label)
-                    new_item = dict(item)
-                    new_item["citations"] = citations
-                    resolved.append(new_item)
-                return resolved
-
-            services = _resolve(data.get("services") or [])
-            goals = _resolve(data.get("goals") or [])
-            accommodations = _resolve(data.get("accommodations") or [])
+            data = _map_reduce_extract(client, task, segments, tier=org_tier(conn, org_id))
+            services = data["services"]
+            goals = data["goals"]
+            accommodations = data["accommodations"]
             placement = data.get("placement") or None
             start_date = _parse_date(data.get("start_date"))
             end_date = _parse_date(data.get("end_date"))
@@ -221,8 +348,10 @@ def extract_iep(task: dict):
                 ),
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as err:
-        print("[WORKER] extract_iep failed:", err)
+        log_event("extract_iep.failed", document_id=document_id, error=str(err))
         if DATABASE_URL:
             try:
                 with psycopg.connect(DATABASE_URL) as conn:
@@ -233,7 +362,9 @@ def extract_iep(task: dict):
                     )
                     conn.commit()
             except Exception as inner:
-                print("[WORKER] failed to mark iep_extract error:", inner)
+                log_event("extract_iep.error_mark_failed", document_id=document_id, error=str(inner))
+        if isinstance(err, DeadlineExceeded):
+            raise
         return {"status": "error"}
 
     return {"status": "ok"}
@@ -257,18 +388,36 @@ EOB_SCHEMA = {
   }
 }
 
+def eob_pages(pages) -> list:
+    """Leading pages of ``pages`` up to the ``extract_eob`` token budget.
+
+    Reads lazily and stops at the first page past the budget: ``extract_eob``
+    trims to that budget anyway, so later pages never reach the model.
+    """
+    budget = budget_for("extract_eob", MODEL)
+    kept: list = []
+    used = 0
+    for page in pages:
+        kept.append(page)
+        used += count_tokens(page.get("text") or "")
+        if used > budget:
+            break
+    return kept
+
 def extract_eob(task: dict):
-    print(f"[EXTRACT] EOB for document_id={task.get('document_id')}")
+    log_event("extract_eob.start", document_id=task.get("document_id"))
     document_id = task["document_id"]
     client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     # gather a few pages from task if present, else skip
     pages = task.get("pages") or []
-    text = "\n\n".join([(p.get("text") or "") for p in pages][:30])
+    text = trim_to_tokens("\n\n".join([(p.get("text") or "") for p in pages]), budget_for("extract_eob", MODEL))
 
-    resp = client.responses.create(
+    resp = create_response(
+        client,
+        kind="extract_eob",
+        bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
         model=MODEL,
-        input=[{"role":"system","content":"Extract EOB fields from this text. Do not invent values."},
-               {"role":"user","content": text[:120000]}],
+        input=build_messages("Extract EOB fields from this text. Do not invent values.", documents=[text]),
         response_format={ "type":"json_schema", "json_schema": EOB_SCHEMA }
     )
     parsed = json.loads(resp.output[0].content[0].text)
@@ -277,11 +426,14 @@ def extract_eob(task: dict):
         headers = {"x-internal-key": INTERNAL_KEY, "Content-Type": "application/json"}
         if task.get("org_id"):
             headers["x-org-id"] = task["org_id"]
-        requests.post(url, headers=headers, json={
+        guarded("internal_api", lambda: within("internal_api", lambda **options: requests.post(url, headers=headers, json={
             "child_id": task.get("child_id"),
             "document_id": document_id,
             "parsed": parsed,
-        }, timeout=20)
+        }, **options), cap=20), failed=lambda r: r.status_code >= 500)
+    except JobDeferred:
+        # Circuit open: retry later (the extraction itself is served from the LLM cache)
+        raise
     except Exception as e:
-        print("[WORKER] failed to POST EOB ingest:", e)
+        log_event("extract_eob.ingest_post_failed", document_id=document_id, error=str(e))
     return {"status":"ok"}
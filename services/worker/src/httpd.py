@@ -1,64 +1,231 @@
 from __future__ import annotations
 
+import hmac
 import json
 import os
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from typing import Callable
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
 
+from src import breaker
+from src.eventlog import log_event, logger as event_logger
+from src.memory import start_tracemalloc, stop_tracemalloc, top_allocations
 from src.metrics import metrics as global_metrics
+from src.profiling import ProfilerBusy, dump_thread_stacks, sample_stacks
 from src.state import WorkerState
 
+HEALTH_CACHE_SECONDS = float(os.getenv("WORKER_HEALTH_CACHE_SECONDS", "1.0"))
+DEBUG_MAX_CONCURRENCY = int(os.getenv("WORKER_DEBUG_MAX_CONCURRENCY", "1"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("WORKER_HTTP_TIMEOUT_SECONDS", "10"))
+
+_Rendered = Tuple[int, bytes]
+_Response = Tuple[int, bytes, str]
+_JSON = "application/json"
+_TEXT = "text/plain; charset=utf-8"
+_INVALID = (400, b'{"error":"invalid_parameters"}', _JSON)
+
+
+class _BodyCache:
+    """Serves a rendered (status, body) pair for ``ttl`` seconds.
+
+    Only one thread re-renders when the entry expires; concurrent probes keep
+    getting the previous body instead of queueing behind the render.
+    """
+
+    def __init__(self, render: Callable[[], _Rendered], ttl: float) -> None:
+        self._render = render
+        self._ttl = max(0.0, ttl)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._value: Optional[_Rendered] = None
+        self._expires_at = 0.0
+
+    def get(self) -> _Rendered:
+        with self._lock:
+            value, fresh = self._value, time.monotonic() < self._expires_at
+        if value is not None and fresh:
+            return value
+        if value is not None and not self._refresh_lock.acquire(blocking=False):
+            return value
+        if value is None:
+            self._refresh_lock.acquire()
+        try:
+            with self._lock:
+                if self._value is not None and time.monotonic() < self._expires_at:
+                    return self._value
+            rendered = self._render()
+            with self._lock:
+                self._value = rendered
+                self._expires_at = time.monotonic() + self._ttl
+            return rendered
+        finally:
+            self._refresh_lock.release()
+
 
 class _Handler(BaseHTTPRequestHandler):
-    state: WorkerState
-    metrics_supplier: Callable[[], dict]
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_TIMEOUT_SECONDS
+    health_cache: _BodyCache
+    metrics_cache: _BodyCache
+    debug_slots: threading.BoundedSemaphore
 
     # Silence default logging to stderr; operational logs use JSON elsewhere
     def log_message(self, format: str, *args) -> None:  # noqa: A003
         return
 
     def do_GET(self) -> None:  # noqa: N802
-        if self.path == "/health":
-            summary = self.state.health()
-            body = json.dumps(
-                {
-                    **summary.as_dict(),
-                    "state": self.state.snapshot(),
-                }
-            ).encode("utf-8")
-            self.send_response(200 if summary.ok else 503)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Content-Length", str(len(body)))
-            self.end_headers()
-            self.wfile.write(body)
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = parse_qs(parts.query)
+
+        if path == "/health":
+            status, body = self.health_cache.get()
+            self._send(status, body, _JSON)
+            return
+
+        if path == "/metrics":
+            status, body = self.metrics_cache.get()
+            self._send(status, body, _JSON)
+            return
+
+        if path == "/debug/stacks":
+            self._run_debug(lambda: (200, dump_thread_stacks().encode("utf-8"), _TEXT))
+            return
+        if path == "/debug/profile":
+            self._run_debug(lambda: self._handle_profile(query))
+            return
+        if path == "/debug/memory":
+            self._run_debug(lambda: self._handle_memory_top(query))
+            return
+
+        self._send(404, b"", "text/plain")
+
+    def do_POST(self) -> None:  # noqa: N802
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        self._discard_body()
+        if parts.path in ("/debug/memory/start", "/debug/memory/stop"):
+            self._run_debug(lambda: self._handle_tracemalloc_toggle(parts.path, query))
             return
 
-        if self.path == "/metrics":
-            metrics_snapshot = self.metrics_supplier()
-            body = json.dumps(metrics_snapshot).encode("utf-8")
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Content-Length", str(len(body)))
-            self.end_headers()
-            self.wfile.write(body)
+        self._send(404, b"", "text/plain")
+
+    # --------------------------------------------------------------- helpers -
+
+    def _run_debug(self, action: Callable[[], _Response]) -> None:
+        if not self._authorized():
+            self._send(403, b'{"error":"forbidden"}', _JSON)
+            return
+        # Heavy endpoints get their own small budget so they never starve probes
+        if not self.debug_slots.acquire(blocking=False):
+            self._send(429, b'{"error":"debug_busy"}', _JSON)
             return
+        try:
+            status, body, content_type = action()
+        finally:
+            self.debug_slots.release()
+        self._send(status, body, content_type)
+
+    def _handle_profile(self, query: Dict[str, List[str]]) -> _Response:
+        try:
+            seconds = float((query.get("seconds") or ["5"])[0])
+            interval = float((query.get("interval_ms") or ["10"])[0]) / 1000.0
+        except ValueError:
+            return _INVALID
+        include_idle = (query.get("idle") or ["0"])[0] in ("1", "true")
+        try:
+            collapsed = sample_stacks(seconds, interval=interval, include_idle=include_idle)
+        except ProfilerBusy:
+            return 409, b'{"error":"profile_in_progress"}', _JSON
+        return 200, collapsed.encode("utf-8"), _TEXT
+
+    def _handle_memory_top(self, query: Dict[str, List[str]]) -> _Response:
+        try:
+            limit = int((query.get("limit") or ["25"])[0])
+            report = top_allocations(limit, (query.get("group_by") or ["lineno"])[0])
+        except ValueError:
+            return _INVALID
+        return 200, json.dumps(report).encode("utf-8"), _JSON
+
+    def _handle_tracemalloc_toggle(self, path: str, query: Dict[str, List[str]]) -> _Response:
+        if path.endswith("/start"):
+            try:
+                frames = int((query.get("frames") or ["1"])[0])
+            except ValueError:
+                return _INVALID
+            status = start_tracemalloc(frames)
+        else:
+            status = stop_tracemalloc()
+        return 200, json.dumps(status).encode("utf-8"), _JSON
+
+    def _authorized(self) -> bool:
+        expected = os.getenv("INTERNAL_API_KEY") or ""
+        provided = self.headers.get("x-internal-key") or ""
+        if not expected or not provided:
+            return False
+        return hmac.compare_digest(expected.encode("utf-8"), provided.encode("utf-8"))
 
-        self.send_response(404)
+    def _discard_body(self) -> None:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = 0
+        if length > 0:
+            self.rfile.read(min(length, 64 * 1024))
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
         self.end_headers()
+        self.wfile.write(body)
+
+
+def _render_health(state: WorkerState) -> _Rendered:
+    summary = state.health()
+    body = json.dumps(
+        {
+            **summary.as_dict(),
+            "state": state.snapshot(),
+            # Informational: an open circuit defers jobs but does not make this replica unhealthy
+            "dependencies": breaker.snapshot(),
+        }
+    ).encode("utf-8")
+    return (200 if summary.ok else 503), body
+
+
+def _render_metrics(supplier: Callable[[], dict]) -> _Rendered:
+    return 200, json.dumps({**supplier(), "logging": event_logger.stats()}).encode("utf-8")
+
+
+class _HealthServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 64
 
 
-def start_health_server(state: WorkerState, *, port: int | None = None) -> None:
-    actual_port = port or int(os.getenv("PORT", "9090"))
+def start_health_server(
+    state: WorkerState,
+    *,
+    port: int | None = None,
+    cache_seconds: float | None = None,
+) -> ThreadingHTTPServer:
+    actual_port = int(os.getenv("PORT", "9090")) if port is None else port
+    ttl = HEALTH_CACHE_SECONDS if cache_seconds is None else cache_seconds
+    supplier = global_metrics.snapshot
     handler = type(
         "HealthHandler",
         (_Handler,),
         {
-            "state": state,
-            "metrics_supplier": staticmethod(global_metrics.snapshot),
+            "health_cache": _BodyCache(lambda: _render_health(state), ttl),
+            "metrics_cache": _BodyCache(lambda: _render_metrics(supplier), ttl),
+            "debug_slots": threading.BoundedSemaphore(max(1, DEBUG_MAX_CONCURRENCY)),
         },
     )
-    server = HTTPServer(("0.0.0.0", actual_port), handler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server = _HealthServer(("0.0.0.0", actual_port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="health-server", daemon=True)
     thread.start()
-    print(f"Health server listening on :{actual_port}")
+    log_event("health_server.listening", port=server.server_address[1])
+    return server
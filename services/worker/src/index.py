@@ -1,14 +1,39 @@
-import os, tempfile
+import hashlib, math, os, re, tempfile, time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional, Sequence
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover - optional speedup
+    np = None
+
 import psycopg
 from openai import OpenAI
 import boto3
+from botocore.config import Config
 import fitz  # PyMuPDF
 import requests
 
+from src.breaker import guarded
+from src.chunking import chunk_pages
+from src.deadline import apply_statement_timeout, timeout, within
+from src.eventlog import log_event
+from src.ratelimit import estimate_tokens, get_limiter, is_rate_limited
+from src.vectors import EMBED_DIMENSIONS, storage_column, truncate, vector_literal
+
 EMBED_MODEL = os.getenv("OPENAI_EMBEDDINGS_MODEL", "text-embedding-3-small")
 DB_URL = os.getenv("DATABASE_URL")
 API_BASE = os.getenv("API_BASE_URL") or os.getenv("API_URL") or "http://localhost:8080"
 DEFAULT_ORG = os.getenv("DEMO_ORG_ID", "00000000-0000-4000-8000-000000000000")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "60000"))
+INDEX_PROGRESS_INTERVAL = float(os.getenv("INDEX_PROGRESS_INTERVAL_SECONDS", "5"))
+INDEX_PAGE_SUMMARIES = os.getenv("INDEX_PAGE_SUMMARIES", "1") not in ("0", "false", "False")
+# openai (default) or hashing; EMBED_FALLBACK_PROVIDER=hashing covers rate-limited batches
+EMBED_PROVIDER = (os.getenv("EMBED_PROVIDER") or "openai").strip().lower()
+EMBED_FALLBACK_PROVIDER = (os.getenv("EMBED_FALLBACK_PROVIDER") or "").strip().lower()
+LOCAL_EMBED_DIMENSIONS = int(os.getenv("LOCAL_EMBED_DIMENSIONS", "1536"))
 
 def _trim_env(name: str):
     v = os.environ.get(name)
@@ -25,15 +50,25 @@ S3_ACCESS_KEY_ID = _trim_env("S3_ACCESS_KEY_ID")
 S3_SECRET_ACCESS_KEY = _trim_env("S3_SECRET_ACCESS_KEY")
 
 def _download_from_s3(key: str, path: str):
+    # Per-read socket timeouts from the job deadline (boto3 has no per-call total timeout)
+    limit = timeout("s3", 60)
     s3 = boto3.client(
         "s3",
         endpoint_url=S3_ENDPOINT,
         aws_access_key_id=S3_ACCESS_KEY_ID,
         aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+        config=Config(connect_timeout=min(limit, 10), read_timeout=limit),
     )
-    s3.download_file(S3_BUCKET, key, path)
+    guarded("s3", lambda: within("s3", lambda **_: s3.download_file(S3_BUCKET, key, path)))
 
-def _patch_job(job_id: str | None, stage: str, status: str, org_id: str | None = None, error_text: str | None = None):
+def _patch_job(
+    job_id: str | None,
+    stage: str,
+    status: str,
+    org_id: str | None = None,
+    error_text: str | None = None,
+    progress: dict | None = None,
+):
     if not job_id:
         return
     headers = {
@@ -48,175 +83,543 @@ def _patch_job(job_id: str | None, stage: str, status: str, org_id: str | None =
     payload = {"type": stage, "status": status}
     if error_text:
         payload["error_text"] = error_text
+    if progress:
+        payload["progress"] = progress
     try:
         base = API_BASE.rstrip("/")
-        resp = requests.patch(f"{base}/internal/jobs/{job_id}", json=payload, headers=headers, timeout=5)
+        resp = guarded(
+            "internal_api",
+            lambda: within(
+                "internal_api",
+                lambda **options: requests.patch(f"{base}/internal/jobs/{job_id}", json=payload, headers=headers, **options),
+                cap=5,
+            ),
+            failed=lambda r: r.status_code >= 500,
+        )
         if resp.status_code >= 400:
-            print(f"[INDEX] patch job failed: {resp.status_code} {resp.text}")
+            log_event("index.patch_job_failed", job_id=job_id, status=resp.status_code, body=resp.text[:400])
     except Exception as e:
-        print("[INDEX] patch job failed:", e)
-
-def _chunk(text: str, max_chars: int = 1800):
-    text = text or ""
-    parts = []
-    start = 0
-    while start < len(text):
-        end = min(len(text), start + max_chars)
-        parts.append(text[start:end])
-        start = end
-    return [p for p in parts if p.strip()]
+        log_event("index.patch_job_failed", job_id=job_id, error=str(e))
 
 def _summarize(text: str, client: OpenAI) -> str:
     model = os.getenv("OPENAI_MODEL_NANO", "gpt-5-nano")
     prompt = (text or "").strip()[:2000]
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Summarize in 1-2 short sentences (<=200 chars)."},
-                {"role": "user", "content": prompt },
-            ],
-            max_tokens=80,
+        messages = [
+            {"role": "system", "content": "Summarize in 1-2 short sentences (<=200 chars)."},
+            {"role": "user", "content": prompt },
+        ]
+        resp = get_limiter().call(
+            model,
+            estimate_tokens(messages, expected_output=80),
+            lambda: guarded(
+                "openai",
+                lambda: within("openai", lambda **options: client.chat.completions.create(model=model, messages=messages, max_tokens=80, **options)),
+            ),
         )
         return (resp.choices[0].message.content or "").strip()[:200]
     except Exception as e:
-        print("[INDEX] summarize failed:", e)
+        log_event("index.summarize_failed", error=str(e))
         return ""
 
-def embed_and_store(task: dict):
-    document_id = task["document_id"]
-    pages = task.get("pages") or []
-    job_id = task.get("job_id")
-    s3_key = task.get("s3_key")
-    print(f"[INDEX] Embedding and storing spans for document_id={document_id}")
-    # Idempotency: skip if already indexed
-    try:
-        if DB_URL:
-            with psycopg.connect(DB_URL) as conn:
-                try:
-                    org = task.get("org_id")
-                    conn.execute("SELECT set_config('request.jwt.org_id', %s, true)", (org,))
-                except Exception:
-                    pass
-                cnt = conn.execute("SELECT COUNT(*) FROM doc_spans WHERE document_id=%s", (document_id,)).fetchone()[0]
-                if cnt and cnt > 0:
-                    print("[INDEX] Spans already exist; skipping embed")
-                    return
-    except Exception as e:
-        print("[INDEX] idempotency check failed:", e)
+@dataclass(frozen=True)
+class Embedded:
+    vectors: list
+    model: str
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-    chunks = []
-    meta = []
-    # Build bbox map by matching chunks to page blocks
-    bbox_by_index: dict[int, tuple[float,float,float,float,float,float]] = {}
-    # Download original PDF to derive coordinates
-    tmp_dir = None
-    bbox_doc = None
+class OpenAIEmbeddings:
+    """Embeddings API backend (the production default)."""
+
+    def __init__(self, client: OpenAI, model: str = EMBED_MODEL, dimensions: int = EMBED_DIMENSIONS):
+        self.client = client
+        self.name = model
+        self.dimensions = dimensions
+
+    def embed(self, texts: Sequence[str]) -> Embedded:
+        kwargs: dict = {"model": self.name, "input": list(texts)}
+        if self.dimensions:
+            kwargs["dimensions"] = self.dimensions
+        resp = get_limiter().call(
+            self.name,
+            estimate_tokens(kwargs["input"], expected_output=0),
+            lambda: guarded("openai", lambda: within("openai", lambda **options: self.client.embeddings.create(**kwargs, **options))),
+        )
+        return Embedded([truncate(d.embedding) for d in resp.data], self.name)
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=200_000)
+def _feature_slots(feature: str, dims: int, probes: int) -> tuple:
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=4 * probes).digest()
+    slots = []
+    for i in range(probes):
+        value = int.from_bytes(digest[4 * i : 4 * i + 4], "little")
+        slots.append((value >> 1) % dims)
+        slots.append(1.0 if value & 1 else -1.0)
+    return tuple(slots)
+
+
+class HashingEmbeddings:
+    """Deterministic local embedder: signed feature hashing as a sparse random projection.
+
+    Words and word bigrams are hashed (blake2b, stable across processes) onto
+    ``probes`` signed slots each, weighted by sublinear term frequency and
+    L2-normalized. Texts sharing vocabulary land close together, which keeps
+    retrieval meaningful for tests and load runs without any network calls.
+    The matrix is filled with NumPy scatter-adds when NumPy is installed.
+    """
+
+    def __init__(self, dims: int = LOCAL_EMBED_DIMENSIONS, probes: int = 3):
+        self.dims = max(8, int(dims))
+        self.probes = max(1, int(probes))
+        self.name = f"local-hash-v1-{self.dims}"
+
+    def _features(self, text: str) -> dict:
+        words = _TOKEN_RE.findall((text or "").lower())
+        counts: dict = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        for left, right in zip(words, words[1:]):
+            key = f"{left} {right}"
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def embed(self, texts: Sequence[str]) -> Embedded:
+        rows, cols, vals = [], [], []
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                weight = 1.0 + math.log(count)
+                slots = _feature_slots(feature, self.dims, self.probes)
+                for i in range(0, len(slots), 2):
+                    rows.append(row)
+                    cols.append(slots[i])
+                    vals.append(slots[i + 1] * weight)
+        if np is not None:
+            matrix = np.zeros((len(texts), self.dims), dtype=np.float32)
+            np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), np.asarray(vals, dtype=np.float32))
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            np.divide(matrix, norms, out=matrix, where=norms > 0)
+            return Embedded(matrix.tolist(), self.name)
+        vectors = [[0.0] * self.dims for _ in texts]
+        for row, col, val in zip(rows, cols, vals):
+            vectors[row][col] += val
+        for vec in vectors:
+            norm = math.sqrt(sum(x * x for x in vec))
+            if norm:
+                vec[:] = [x / norm for x in vec]
+        return Embedded(vectors, self.name)
+
+
+class FallbackEmbeddings:
+    """Uses ``primary`` and falls back to ``fallback`` for batches rejected by rate limits.
+
+    Fallback spans keep the fallback's model name, so ``reembed_spans`` picks
+    them up later and moves them back to the primary model.
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = primary.name
+
+    def embed(self, texts: Sequence[str]) -> Embedded:
+        try:
+            return self.primary.embed(texts)
+        except Exception as err:
+            if not is_rate_limited(err):
+                raise
+            log_event("index.embed_fallback", provider=self.fallback.name, batch=len(texts), error=str(err))
+            return self.fallback.embed(texts)
+
+
+def _build_provider(kind: str, client: Optional[OpenAI]):
+    if kind == "hashing":
+        return HashingEmbeddings()
+    if kind == "openai":
+        return OpenAIEmbeddings(client or OpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+    raise ValueError(f"unknown embedding provider: {kind}")
+
+
+def get_embedding_provider(client: Optional[OpenAI] = None, kind: Optional[str] = None):
+    """Provider configured by EMBED_PROVIDER (+ EMBED_FALLBACK_PROVIDER)."""
+    primary = _build_provider(kind or EMBED_PROVIDER, client)
+    if EMBED_FALLBACK_PROVIDER and EMBED_FALLBACK_PROVIDER != (kind or EMBED_PROVIDER):
+        return FallbackEmbeddings(primary, _build_provider(EMBED_FALLBACK_PROVIDER, client))
+    return primary
+
+
+# Output size of the OpenAI embedding models when EMBED_DIMENSIONS is 0
+NATIVE_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+
+def provider_dimensions(kind: str) -> Optional[int]:
+    """Length of the vectors provider ``kind`` writes, or None when unknown."""
+    if kind == "hashing":
+        return max(8, LOCAL_EMBED_DIMENSIONS)
+    if kind == "openai":
+        return EMBED_DIMENSIONS or NATIVE_DIMENSIONS.get(EMBED_MODEL)
+    return None
+
+
+def check_embedding_dimensions(declared: Optional[int], storage: Optional[str] = None) -> None:
+    """Raise ``RuntimeError`` when the configured providers can't write to the storage column.
+
+    ``declared`` comes from ``column_dimensions``. Without this check every
+    span write fails at runtime after a change to EMBED_DIMENSIONS, the
+    embeddings model or EMBED_STORAGE that the schema didn't follow.
+    """
+    column, sql_type = storage_column(storage)
+    if declared is None:
+        raise RuntimeError(f"doc_spans.{column} is missing; apply packages/db/prisma/extensions.sql before using EMBED_STORAGE={sql_type}")
+    if not declared:
+        return
+    for kind in dict.fromkeys(filter(None, (EMBED_PROVIDER, EMBED_FALLBACK_PROVIDER))):
+        dims = provider_dimensions(kind)
+        if dims and dims != declared:
+            raise RuntimeError(
+                f"doc_spans.{column} is {sql_type}({declared}) but the {kind} embeddings provider writes {dims} dimensions; "
+                "set EMBED_DIMENSIONS to match or migrate the column (docs/OPERATIONS_CHECKLIST.md)"
+            )
+
+
+def _summary_client() -> Optional[OpenAI]:
+    if not INDEX_PAGE_SUMMARIES:
+        return None
     try:
-        if s3_key:
-            tmp_dir = tempfile.TemporaryDirectory()
-            tmp_path = os.path.join(tmp_dir.name, "doc.pdf")
-            _download_from_s3(s3_key, tmp_path)
-            bbox_doc = fitz.open(tmp_path)
+        return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     except Exception as e:
-        print("[INDEX] download for bbox failed:", e)
-    for p in pages:
-        text = p.get("text") or ""
-        summary = _summarize(text, client)
-        first = True
-        for c in _chunk(text):
-            if first and summary:
-                c = f"[Summary] {summary}\n" + c
-                first = False
-            chunks.append(c)
-            meta.append({"page": p["page"]})
-
-    # If we have the pdf locally, compute bboxes for first match per chunk
-    if bbox_doc:
-        try:
-            for idx, m in enumerate(meta):
-                try:
-                    page_num = int(m["page"]) - 1
-                    if page_num < 0 or not bbox_doc or page_num >= len(bbox_doc):
-                        continue
-                    page = bbox_doc[page_num]
-                    blocks = page.get_text("blocks")
-                    needle = (chunks[idx] or "").strip()[:100].lower()
-                    if needle.startswith("[summary]"):
-                        needle = needle.split("\n", 1)[-1].lower()
-                    best = None
-                    for b in blocks:
-                        x0, y0, x1, y1, btxt, *_ = b
-                        if not isinstance(btxt, str):
-                            continue
-                        hay = btxt.replace("\n", " ").strip().lower()
-                        if needle and needle[:30] in hay:
-                            best = (x0, y0, x1, y1, page.rect.width, page.rect.height)
-                            break
-                    if best:
-                        bbox_by_index[idx] = best
-                except Exception:
-                    continue
-        except Exception as e:
-            print("[INDEX] bbox compute failed:", e)
-        finally:
-            try:
-                bbox_doc.close()
-            except Exception:
-                pass
-            bbox_doc = None
-    if tmp_dir:
-        try:
-            tmp_dir.cleanup()
-        except Exception:
-            pass
+        log_event("index.summary_client_unavailable", error=str(e))
+        return None
+
+
+def _batched(items: Iterable[dict], max_items: int, max_tokens: int) -> Iterator[list[dict]]:
+    batch: list[dict] = []
+    tokens = 0
+    for item in items:
+        item_tokens = int(item.get("tokens") or 0)
+        if batch and (len(batch) >= max_items or tokens + item_tokens > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(item)
+        tokens += item_tokens
+    if batch:
+        yield batch
+
 
-    if not chunks:
-        print("[INDEX] No text chunks to embed")
+class _BboxMatcher:
+    """Finds the first text block matching a chunk; caches blocks for the current page only."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._page_num: Optional[int] = None
+        self._blocks: list = []
+        self._size: tuple[float, float] = (0.0, 0.0)
+
+    def match(self, page_no: int, text: str):
+        page_num = int(page_no) - 1
+        if not self.doc or page_num < 0 or page_num >= len(self.doc):
+            return None
+        if page_num != self._page_num:
+            page = self.doc[page_num]
+            self._blocks = [
+                (x0, y0, x1, y1, btxt.replace("\n", " ").strip().lower())
+                for x0, y0, x1, y1, btxt, *_ in page.get_text("blocks")
+                if isinstance(btxt, str)
+            ]
+            self._size = (page.rect.width, page.rect.height)
+            self._page_num = page_num
+        needle = (text or "").strip()[:100].lower()
+        if needle.startswith("[summary]"):
+            needle = needle.split("\n", 1)[-1].lower()
+        if not needle:
+            return None
+        for x0, y0, x1, y1, hay in self._blocks:
+            if needle[:30] in hay:
+                return (x0, y0, x1, y1, self._size[0], self._size[1])
+        return None
+
+
+def _content_hash(page: int, text: str) -> str:
+    return hashlib.sha256(f"{int(page)}\n{(text or '').strip()}".encode("utf-8")).hexdigest()
+
+
+def _iter_chunks(pages: Iterable[dict]) -> Iterator[dict]:
+    """Yield raw chunks with their content hash.
+
+    The first chunk of each page carries ``summary_source`` so the page
+    summary is only requested for chunks that actually get embedded.
+    """
+    sources: dict[int, str] = {}
+
+    def _tracked_pages():
+        for p in pages:
+            sources[p["page"]] = (p.get("text") or "").strip()[:2000]
+            yield p
+
+    for chunk in chunk_pages(_tracked_pages()):
+        yield {
+            "text": chunk.text,
+            "page": chunk.page,
+            "pages": list(chunk.pages),
+            "tokens": chunk.token_count,
+            "hash": _content_hash(chunk.page, chunk.text),
+            "summary_source": sources.pop(chunk.page, None),
+        }
+
+
+def _attach_summary(item: dict, client: Optional[OpenAI]) -> None:
+    source = item.pop("summary_source", None)
+    if not source or client is None:
         return
+    summary = _summarize(source, client)
+    if summary:
+        item["text"] = f"[Summary] {summary}\n" + item["text"]
+
+
+class _ExistingSpans:
+    """Stored spans of a document keyed by content hash, claimed as chunks match."""
+
+    def __init__(self, rows: Iterable[tuple]):
+        self._by_hash: dict[str, list[tuple[str, Optional[str]]]] = {}
+        self._unhashed: list[str] = []
+        for span_id, content_hash, model in rows:
+            if content_hash:
+                self._by_hash.setdefault(content_hash, []).append((str(span_id), model))
+            else:
+                self._unhashed.append(str(span_id))
 
-    resp = client.embeddings.create(model=EMBED_MODEL, input=chunks)
-    vectors = [d.embedding for d in resp.data]
+    @classmethod
+    def load(cls, conn, document_id: str) -> "_ExistingSpans":
+        rows = conn.execute(
+            "SELECT id::text, content_hash, embedding_model FROM doc_spans WHERE document_id=%s",
+            (document_id,),
+        ).fetchall()
+        return cls(rows)
+
+    def claim(self, content_hash: str) -> Optional[tuple[str, Optional[str]]]:
+        matches = self._by_hash.get(content_hash)
+        if not matches:
+            return None
+        match = matches.pop()
+        if not matches:
+            del self._by_hash[content_hash]
+        return match
+
+    def unclaimed(self) -> list[str]:
+        ids = list(self._unhashed)
+        for matches in self._by_hash.values():
+            ids.extend(span_id for span_id, _ in matches)
+        return ids
+
+
+def _insert_spans(cur, document_id: str, org_id: str | None, batch: list[dict], vectors: list, matcher, model: str) -> None:
+    rows = []
+    for item, vec in zip(batch, vectors):
+        bb = None
+        if matcher:
+            try:
+                bb = matcher.match(item["page"], item["text"])
+            except Exception as e:
+                log_event("index.bbox_compute_failed", document_id=document_id, page=item["page"], error=str(e))
+        bbox_values = None
+        pw = None
+        ph = None
+        if bb:
+            x0, y0, x1, y1, pw, ph = bb
+            bbox_values = [float(x0), float(y0), float(x1 - x0), float(y1 - y0)]
+            if pw is not None:
+                pw = float(pw)
+            if ph is not None:
+                ph = float(ph)
+        rows.append(
+            (
+                document_id,
+                org_id,
+                item["page"],
+                bbox_values,
+                pw,
+                ph,
+                item["text"][:4000],
+                vector_literal(vec),
+                item["hash"],
+                model,
+            )
+        )
+    column, cast = storage_column()
+    cur.executemany(
+        f"INSERT INTO doc_spans (document_id, org_id, page, bbox, page_width, page_height, text, {column}, content_hash, embedding_model) "
+        f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s::{cast}, %s, %s)",
+        rows,
+    )
+
+
+def _refresh_spans(cur, batch: list[dict], vectors: list, model: str) -> None:
+    """Re-embed matched spans in place so their ids (and citations) survive."""
+    column, cast = storage_column()
+    cur.executemany(
+        f"UPDATE doc_spans SET text=%s, {column}=%s::{cast}, embedding_model=%s WHERE id=%s",
+        [(item["text"][:4000], vector_literal(vec), model, item["span_id"]) for item, vec in zip(batch, vectors)],
+    )
+
+
+def _set_org_context(conn, org_id: Optional[str]) -> None:
+    """Set the RLS org for the current transaction; call again after every commit."""
+    try:
+        conn.execute("SELECT set_config('request.jwt.org_id', %s, true)", (org_id,))
+    except Exception:
+        pass
+
+
+def _prepare_document(conn, document_id: str, reindex: bool = False) -> Optional[str]:
+    """Pick the indexing mode: ``"full"``, ``"incremental"`` or None to skip.
+
+    Spans without ``processed_at`` come from a run that died mid-stream; they
+    are reconciled incrementally like an explicit re-index.
+    """
+    row = conn.execute(
+        "SELECT d.processed_at, (SELECT COUNT(*) FROM doc_spans s WHERE s.document_id = d.id) FROM documents d WHERE d.id=%s",
+        (document_id,),
+    ).fetchone()
+    processed_at, span_count = (row[0], row[1]) if row else (None, 0)
+    if not span_count:
+        return "full"
+    if processed_at and not reindex:
+        log_event("index.skipped_existing", document_id=document_id, spans=span_count)
+        return None
+    log_event("index.incremental", document_id=document_id, spans=span_count, resumed=not processed_at)
+    return "incremental"
+
+
+def embed_and_store(task: dict, pages: Iterable[dict] | None = None, pdf_doc=None, provider=None):
+    """Stream pages through chunking, embedding and DB writes with bounded buffering.
+
+    ``pages`` may be any iterable (typically a generator over an open PDF);
+    only one embedding batch of chunks is held in memory at a time and each
+    batch is committed as soon as it is embedded. ``pdf_doc`` is an already
+    open fitz document used for bbox matching; when omitted the original PDF
+    is downloaded for that purpose. ``provider`` overrides the embedding
+    backend from EMBED_PROVIDER (see ``get_embedding_provider``).
+
+    With ``task["reindex"]`` an already indexed document is reconciled by
+    content hash: unchanged spans are kept, spans embedded with another model
+    are re-embedded in place, new chunks are inserted and stale spans deleted.
+    """
+    document_id = task["document_id"]
+    org_id = task.get("org_id")
+    job_id = task.get("job_id")
+    s3_key = task.get("s3_key")
+    if pages is None:
+        pages = task.get("pages") or []
+    log_event("index.start", document_id=document_id)
 
     if not DB_URL:
-        print("[INDEX] DATABASE_URL not set; skipping DB write")
+        log_event("index.db_write_skipped", document_id=document_id, reason="no_database_url")
         return
 
-    _patch_job(job_id, "index", "processing", task.get("org_id"))
-    with psycopg.connect(DB_URL) as conn:
-        try:
-            org = task.get("org_id")
-            conn.execute("SELECT set_config('request.jwt.org_id', %s, true)", (org,))
-        except Exception:
-            pass
-        with conn.cursor() as cur:
-            for idx, (vec, m, text) in enumerate(zip(vectors, meta, chunks)):
-                vec_lit = "ARRAY[" + ",".join(str(x) for x in vec) + "]::vector"
-                bb = bbox_by_index.get(idx)
-                bbox_values = None
-                pw = None
-                ph = None
-                if bb:
-                    x0, y0, x1, y1, pw, ph = bb
-                    bbox_values = [float(x0), float(y0), float(x1 - x0), float(y1 - y0)]
-                    if pw is not None:
-                        pw = float(pw)
-                    if ph is not None:
-                        ph = float(ph)
-                query = (
-                    "INSERT INTO doc_spans (document_id, org_id, page, bbox, page_width, page_height, text, embedding) "
-                    f"VALUES (%s, %s, %s, %s, %s, %s, %s, {vec_lit})"
-                )
-                cur.execute(
-                    query,
-                    (document_id, task.get("org_id"), m["page"], bbox_values, pw, ph, text[:4000])
-                )
-        try:
-            conn.execute("UPDATE documents SET processed_at = NOW() WHERE id=%s", (document_id,))
-        except Exception:
-            pass
-        conn.commit()
+    client = _summary_client()
+    provider = provider or get_embedding_provider(client)
+    tmp_dir = None
+    bbox_doc = pdf_doc
+    owns_doc = False
+    try:
+        with psycopg.connect(DB_URL) as conn:
+            apply_statement_timeout(conn)
+            _set_org_context(conn, org_id)
+            # No fallback on failure: the transaction would be aborted, and
+            # guessing "full" would duplicate an existing index. Fail and retry.
+            mode = _prepare_document(conn, document_id, reindex=bool(task.get("reindex")))
+            if mode is None:
+                return
+            existing = _ExistingSpans.load(conn, document_id) if mode == "incremental" else None
+
+            if bbox_doc is None and s3_key:
+                try:
+                    tmp_dir = tempfile.TemporaryDirectory()
+                    tmp_path = os.path.join(tmp_dir.name, "doc.pdf")
+                    _download_from_s3(s3_key, tmp_path)
+                    bbox_doc = fitz.open(tmp_path)
+                    owns_doc = True
+                except Exception as e:
+                    log_event("index.bbox_download_failed", document_id=document_id, error=str(e))
+            matcher = _BboxMatcher(bbox_doc) if bbox_doc is not None else None
 
+            _patch_job(job_id, "index", "processing", org_id)
+            counts = {"chunks": 0, "inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+            last_progress = time.monotonic()
+            for batch in _batched(_iter_chunks(pages), EMBED_BATCH_SIZE, EMBED_BATCH_TOKENS):
+                counts["chunks"] += len(batch)
+                fresh: list[dict] = []
+                stale: list[dict] = []
+                for item in batch:
+                    match = existing.claim(item["hash"]) if existing else None
+                    if match is None:
+                        fresh.append(item)
+                    elif match[1] == provider.name:
+                        counts["unchanged"] += 1
+                    else:
+                        item["span_id"] = match[0]
+                        stale.append(item)
+                pending = stale + fresh
+                if not pending:
+                    continue
+                for item in pending:
+                    _attach_summary(item, client)
+                embedded = provider.embed([item["text"] for item in pending])
+                vectors = embedded.vectors
+                with conn.cursor() as cur:
+                    if stale:
+                        _refresh_spans(cur, stale, vectors[: len(stale)], embedded.model)
+                    if fresh:
+                        _insert_spans(cur, document_id, org_id, fresh, vectors[len(stale) :], matcher, embedded.model)
+                conn.commit()
+                _set_org_context(conn, org_id)
+                counts["updated"] += len(stale)
+                counts["inserted"] += len(fresh)
+                now = time.monotonic()
+                if now - last_progress >= INDEX_PROGRESS_INTERVAL:
+                    _patch_job(
+                        job_id,
+                        "index",
+                        "processing",
+                        org_id,
+                        progress={
+                            "spans": counts["inserted"] + counts["updated"],
+                            "unchanged": counts["unchanged"],
+                            "page": batch[-1]["page"],
+                        },
+                    )
+                    last_progress = now
 
+            if not counts["chunks"]:
+                # Never wipe an existing index because a pass produced no text
+                log_event("index.no_chunks", document_id=document_id)
+                return
+            if existing:
+                stale_ids = existing.unclaimed()
+                if stale_ids:
+                    conn.execute("DELETE FROM doc_spans WHERE id = ANY(%s::uuid[])", (stale_ids,))
+                    counts["deleted"] = len(stale_ids)
+            try:
+                conn.execute("UPDATE documents SET processed_at = NOW() WHERE id=%s", (document_id,))
+            except Exception:
+                pass
+            conn.commit()
+            log_event("index.done", document_id=document_id, mode=mode, **counts)
+    finally:
+        if owns_doc and bbox_doc is not None:
+            try:
+                bbox_doc.close()
+            except Exception:
+                pass
+        if tmp_dir:
+            try:
+                tmp_dir.cleanup()
+            except Exception:
+                pass
@@ -1,9 +1,12 @@
 from .registry import (
+    DeadlineExceeded,
+    JobDeferred,
     JobFailed,
+    JobParked,
     JobRegistry,
     dispatch_job,
     register_job,
     registry,
 )
 
-__all__ = ["JobFailed", "JobRegistry", "dispatch_job", "register_job", "registry"]
+__all__ = ["DeadlineExceeded", "JobDeferred", "JobFailed", "JobParked", "JobRegistry", "dispatch_job", "register_job", "registry"]
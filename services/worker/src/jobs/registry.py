@@ -3,6 +3,8 @@ from __future__ import annotations
 import time
 from typing import Any, Callable, Dict, Optional, TYPE_CHECKING
 
+from src.deadline import DeadlineExceeded, expired
+
 if TYPE_CHECKING:
     from src.metrics import MetricsRecorder
 
@@ -19,6 +21,29 @@ class JobFailed(Exception):
         self.attempts = attempts
 
 
+class JobDeferred(Exception):
+    """Raised by a handler that cannot make progress right now (e.g. an upstream budget is exhausted).
+
+    The runner parks the payload in its retry set for ``delay_seconds``
+    instead of burning retries; it does not count as a failed attempt.
+    """
+
+    def __init__(self, reason: str, delay_seconds: float = 30.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.delay_seconds = max(0.0, float(delay_seconds))
+
+
+class JobParked(JobDeferred):
+    """The payload was handed to another lane (e.g. the batch lane), which re-enqueues it when ready.
+
+    The runner only acknowledges it: nothing goes to the retry set.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason, delay_seconds=0.0)
+
+
 class JobRegistry:
     def __init__(self) -> None:
         self._handlers: Dict[str, JobHandler] = {}
@@ -79,11 +104,18 @@ def dispatch_job(
             if metrics:
                 metrics.record_success(kind)
             return
+        except JobDeferred:
+            # Not a failure: the runner reschedules the payload via its retry set
+            raise
         except Exception as err:
+            if expired() and not isinstance(err, DeadlineExceeded):
+                # e.g. the statement_timeout or a client timeout derived from the deadline fired
+                err = DeadlineExceeded(f"job deadline passed: {err}")
             last_err = err
             if log_fn:
                 log_fn("job.attempt_failed", kind=kind, attempt=attempt, error=str(err))
-            if attempt >= max(max_attempts, 1):
+            # The deadline covers every attempt: once it has passed, retrying only repeats the hang
+            if attempt >= max(max_attempts, 1) or isinstance(err, DeadlineExceeded):
                 break
             if metrics:
                 metrics.record_retry(kind)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import bisect
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# Joins a batch into one string; no keyword contains it, so no match spans two texts
+_SEPARATOR = "\x00"
+
+
+class KeywordMatcher:
+    """Case-insensitive substring rules compiled into a single regex.
+
+    ``rules`` maps a rule name to its terms. Every text is scanned once,
+    whatever the number of rules or terms: the pattern is one alternation
+    inside a lookahead, so a match is reported at every start position
+    (overlapping terms all count), longest term first. A matched term also
+    credits the rules of any shorter term that is its prefix, which keeps
+    the result identical to ``term in text.lower()`` for every term.
+    """
+
+    def __init__(self, rules: Dict[str, Sequence[str]]) -> None:
+        self.rules = {name: tuple(term.lower() for term in terms if term) for name, terms in rules.items()}
+        owners: Dict[str, List[str]] = {}
+        for name, terms in self.rules.items():
+            for term in terms:
+                owners.setdefault(term, [])
+                if name not in owners[term]:
+                    owners[term].append(name)
+        # Longest first so the alternation prefers e.g. "minute" over "min" at the same position
+        terms = sorted(owners, key=lambda term: (-len(term), term))
+        self._credits: Dict[str, Tuple[str, ...]] = {}
+        for term in terms:
+            credited: List[str] = []
+            for other in terms:
+                if term.startswith(other):
+                    credited.extend(name for name in owners[other] if name not in credited)
+            self._credits[term] = tuple(credited)
+        alternation = "|".join(re.escape(term) for term in terms) or "(?!)"
+        self._pattern = re.compile(f"(?=({alternation}))")
+
+    def hits(self, text: str) -> Dict[str, int]:
+        """``rule -> number of positions where one of its terms occurs`` (rules without hits omitted)."""
+        counts: Dict[str, int] = {}
+        for match in self._pattern.finditer((text or "").lower()):
+            for name in self._credits[match.group(1)]:
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def hits_batch(self, texts: Sequence[str]) -> List[Dict[str, int]]:
+        """``hits`` for every text, from one scan over the whole batch."""
+        # Lowercase before joining: lower() can change a string's length, which would shift the offsets
+        lowered = [(text or "").lower() for text in texts]
+        joined = _SEPARATOR.join(lowered)
+        starts: List[int] = []
+        offset = 0
+        for text in lowered:
+            starts.append(offset)
+            offset += len(text) + len(_SEPARATOR)
+        results: List[Dict[str, int]] = [{} for _ in texts]
+        for match in self._pattern.finditer(joined):
+            counts = results[bisect.bisect_right(starts, match.start()) - 1]
+            for name in self._credits[match.group(1)]:
+                counts[name] = counts.get(name, 0) + 1
+        return results
+
+    def matched(self, text: str) -> List[str]:
+        """Names of the rules with at least one hit, in rule order."""
+        found = self.hits(text)
+        return [name for name in self.rules if name in found]
+
+
+@dataclass
+class KeywordScorer:
+    """``base`` plus each matched rule's weight (once, however often it matches), plus a long-text bonus.
+
+    The in-worker counterpart of a ``RankProfile``; callable, so it can be
+    passed anywhere a ``scorer(text) -> float`` is expected.
+    """
+
+    weights: Dict[str, Tuple[Sequence[str], float]]
+    base: float = 1.0
+    long_bonus: Tuple[int, float] = (0, 0.0)
+    matcher: KeywordMatcher = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.matcher = KeywordMatcher({name: terms for name, (terms, _) in self.weights.items()})
+
+    def _score(self, text: str, hits: Dict[str, int]) -> float:
+        score = self.base + sum(self.weights[name][1] for name in hits)
+        if self.long_bonus[0] and len(text) > self.long_bonus[0]:
+            score += self.long_bonus[1]
+        return score
+
+    def __call__(self, text: str) -> float:
+        text = text or ""
+        return self._score(text, self.matcher.hits(text))
+
+    def score_batch(self, texts: Iterable[str]) -> List[float]:
+        texts = [text or "" for text in texts]
+        return [self._score(text, hits) for text, hits in zip(texts, self.matcher.hits_batch(texts))]
+
+
+__all__ = ["KeywordMatcher", "KeywordScorer"]
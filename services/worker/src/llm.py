@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+from src.breaker import guarded
+from src.deadline import within
+from src.eventlog import log_event
+from src.metrics import metrics
+from src.prompts import prompt_token_usage
+from src.ratelimit import estimate_tokens, get_limiter
+from src.routing import choose_model
+from src.streaming import consume_stream, streams
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_PREFIX = os.getenv("LLM_CACHE_PREFIX", "llmcache:v1")
+LLM_CACHE_BYPASS_FIELD = "no_cache"
+
+# Kinds whose output is a pure function of the prompt. Safety phrases are left
+# out on purpose: callers ask again precisely to get a different phrase.
+DEFAULT_CACHED_KINDS = frozenset(
+    {
+        "extract_iep",
+        "extract_eob",
+        "prep_iep_diff",
+        "prep_recommendations",
+        "research_summary",
+        "denial_explain",
+        "build_advocacy_outline",
+        "build_one_pager",
+        "goal_smart",
+    }
+)
+
+
+def _parse_kinds(spec: Optional[str], default: FrozenSet[str]) -> FrozenSet[str]:
+    if spec is None:
+        return default
+    return frozenset(kind.strip() for kind in spec.split(",") if kind.strip())
+
+
+LLM_CACHE_KINDS = _parse_kinds(os.getenv("LLM_CACHE_KINDS"), DEFAULT_CACHED_KINDS)
+LLM_CACHE_BYPASS_KINDS = _parse_kinds(os.getenv("LLM_CACHE_BYPASS_KINDS"), frozenset())
+
+
+@dataclass
+class _Content:
+    text: str
+
+
+@dataclass
+class _Output:
+    content: List[_Content]
+
+
+@dataclass
+class CachedResponse:
+    """Stand-in for an OpenAI response replayed from the cache (same ``output[0].content[0].text`` shape)."""
+
+    output: List[_Output]
+    usage: Any = None
+    cached: bool = True
+
+    @classmethod
+    def from_text(cls, text: str, *, usage: Any = None, cached: bool = True) -> "CachedResponse":
+        return cls(output=[_Output(content=[_Content(text=text)])], usage=usage, cached=cached)
+
+
+def response_text(response) -> Optional[str]:
+    if response is None or not getattr(response, "output", None) or not response.output[0].content:
+        return None
+    return response.output[0].content[0].text
+
+
+def request_key(request: Dict[str, Any], prefix: str = LLM_CACHE_PREFIX) -> str:
+    """Hash of everything that determines the answer: model, system + user messages, schema and options."""
+    canonical = json.dumps(
+        request,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return f"{prefix}:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+class ResponseCache:
+    """Redis cache of LLM response texts with a TTL and a total-size bound.
+
+    Every entry is also tracked in a sorted set scored by last use, with its
+    size in a hash. When the tracked total goes over ``max_bytes`` the least
+    recently used entries are deleted, so the cache can share a Redis with
+    the job queues without relying on a global eviction policy.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        *,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        prefix: str = LLM_CACHE_PREFIX,
+        clock=time.time,
+    ) -> None:
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.clock = clock
+        self.index_key = f"{prefix}:lru"
+        self.sizes_key = f"{prefix}:sizes"
+        self.total_key = f"{prefix}:bytes"
+
+    def get(self, key: str) -> Optional[str]:
+        text = self.redis.get(key)
+        if text is None:
+            return None
+        self.redis.zadd(self.index_key, {key: self.clock()}, xx=True)
+        return text.decode() if isinstance(text, bytes) else text
+
+    def put(self, key: str, text: str) -> None:
+        size = len(text.encode())
+        if size > self.max_bytes:
+            return
+        previous = self.redis.hget(self.sizes_key, key)
+        self.redis.set(key, text, ex=self.ttl_seconds)
+        self.redis.zadd(self.index_key, {key: self.clock()})
+        self.redis.hset(self.sizes_key, key, size)
+        total = self.redis.incrby(self.total_key, size - int(previous or 0))
+        if total > self.max_bytes:
+            self._evict()
+
+    def _forget(self, members) -> int:
+        freed = 0
+        for member in members:
+            member = member.decode() if isinstance(member, bytes) else member
+            size = int(self.redis.hget(self.sizes_key, member) or 0)
+            self.redis.delete(member)
+            self.redis.hdel(self.sizes_key, member)
+            self.redis.zrem(self.index_key, member)
+            freed += size
+        if freed:
+            self.redis.incrby(self.total_key, -freed)
+        return freed
+
+    def _evict(self) -> None:
+        # Expired entries first (their keys are already gone), then least recently used
+        expired = self.redis.zrangebyscore(self.index_key, "-inf", self.clock() - self.ttl_seconds)
+        self._forget(expired)
+        evicted = 0
+        total = int(self.redis.get(self.total_key) or 0)
+        while total > self.max_bytes:
+            oldest = self.redis.zrange(self.index_key, 0, 15)
+            if not oldest:
+                self.redis.set(self.total_key, 0)
+                break
+            for member in oldest:
+                total -= self._forget([member])
+                evicted += 1
+                if total <= self.max_bytes:
+                    break
+        if evicted:
+            metrics.increment("llm_cache", "evicted", evicted)
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def _default_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        import redis
+
+        _cache = ResponseCache(redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True))
+    return _cache
+
+
+def _cacheable(kind: str) -> bool:
+    if not LLM_CACHE_ENABLED or kind in LLM_CACHE_BYPASS_KINDS:
+        return False
+    return "*" in LLM_CACHE_KINDS or kind in LLM_CACHE_KINDS
+
+
+def _valid(text: Optional[str], response_format: Any) -> bool:
+    if not text:
+        return False
+    if isinstance(response_format, dict) and response_format.get("type") == "json_schema":
+        try:
+            json.loads(text)
+        except ValueError:
+            return False
+    return True
+
+
+def _record_usage(kind: str, model: str, response: Any) -> None:
+    """Count prompt tokens and the share the provider served from its prompt-prefix cache."""
+    prompt, cached = prompt_token_usage(getattr(response, "usage", None))
+    if prompt is None:
+        return
+    metrics.increment("llm_prompt_tokens", kind, prompt)
+    metrics.increment("llm_cached_prompt_tokens", kind, cached)
+    log_event("llm.usage", kind=kind, model=model, prompt_tokens=prompt, cached_prompt_tokens=cached)
+
+
+def create_response(
+    client,
+    *,
+    kind: str,
+    model: str,
+    input: Any,
+    response_format: Any = None,
+    bypass: bool = False,
+    cache: Optional[ResponseCache] = None,
+    limiter=None,
+    batch_task: Optional[Dict[str, Any]] = None,
+    on_partial: Optional[Callable[[Any], None]] = None,
+    tier: Optional[str] = None,
+    **params: Any,
+):
+    """``client.responses.create`` behind the response cache.
+
+    Only kinds in ``LLM_CACHE_KINDS`` are cached. ``bypass`` (e.g. a task
+    with ``no_cache``) skips the lookup but still stores the fresh answer.
+    Cache failures never fail the call. Calls that reach the API go through
+    the shared rate limiter and the OpenAI circuit breaker, either of which
+    may defer the job (``RateLimited`` / ``DependencyUnavailable``). Inside a
+    job the request timeout is what is left of the job deadline
+    (``DeadlineExceeded`` once it has passed).
+
+    ``batch_task`` is the job payload: when it is marked for the batch lane
+    a cache miss queues the request there and parks the job (``JobParked``);
+    the answer arrives through this cache on the job's next run.
+
+    ``on_partial`` opts a kind in ``LLM_STREAM_KINDS`` into streaming: the
+    call uses the streaming API and the callback receives the partially
+    parsed JSON at bounded intervals. The return value is the same
+    ``output[0].content[0].text`` shape either way.
+
+    ``model`` is the call site's choice; the routing table may swap it per
+    request based on prompt size, kind, the org's ``tier`` and rate-limit
+    headroom (see ``src.routing``). The cache key uses the requested model:
+    headroom changes with load, so the same prompt must find its answer (or
+    its parked batch result) whichever model served it.
+    """
+    limiter = limiter or get_limiter()
+    route = choose_model(kind, model, estimate_tokens(input, 0), tier=tier, limiter=limiter)
+    model = route.model
+    metrics.increment("llm_route", f"{route.name}:{model}")
+    log_event("llm.route", kind=kind, route=route.name, model=model, requested_model=route.requested, tier=tier)
+    request: Dict[str, Any] = {"model": model, "input": input, **params}
+    if response_format is not None:
+        request["response_format"] = response_format
+
+    def call(**options):
+        if on_partial is not None and streams(kind):
+            text, usage = consume_stream(client.responses.create(**request, stream=True, **options), on_partial, kind=kind)
+            return CachedResponse.from_text(text, usage=usage, cached=False)
+        return client.responses.create(**request, **options)
+
+    def send():
+        response = limiter.call(model, estimate_tokens(input), lambda: guarded("openai", lambda: within("openai", call)))
+        _record_usage(kind, model, response)
+        return response
+
+    if not _cacheable(kind):
+        return send()
+
+    key = request_key({**request, "model": route.requested})
+    store = None
+    try:
+        store = cache or _default_cache()
+        if not bypass:
+            text = store.get(key)
+            if text is not None:
+                metrics.increment("llm_cache", "hit")
+                log_event("llm.cache_hit", kind=kind, model=model)
+                return CachedResponse.from_text(text)
+    except Exception as err:
+        store = None
+        metrics.increment("llm_cache", "error")
+        log_event("llm.cache_unavailable", kind=kind, error=str(err))
+
+    metrics.increment("llm_cache", "bypass" if bypass else "miss")
+    # A bypassing job would skip the cache on its rerun too and pay for a sync call anyway
+    if store is not None and batch_task is not None and not bypass:
+        from src.batch import eligible, get_lane
+
+        if eligible(kind, batch_task):
+            get_lane().park(key, request, kind=kind, task=batch_task)
+    response = send()
+    text = response_text(response)
+    if store is not None and _valid(text, response_format):
+        try:
+            store.put(key, text)
+        except Exception as err:
+            log_event("llm.cache_store_failed", kind=kind, error=str(err))
+    return response
+
+
+__all__ = [
+    "CachedResponse",
+    "LLM_CACHE_BYPASS_FIELD",
+    "ResponseCache",
+    "create_response",
+    "request_key",
+    "response_text",
+]
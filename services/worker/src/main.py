@@ -1,19 +1,34 @@
 import os, json, datetime, hashlib, time
 import redis
-from src.ocr import process_pdf
-from src.index import embed_and_store, _patch_job
-from src.extract import extract_iep, extract_eob
+from src.ocr import open_pdf
+from src.index import EMBED_MODEL, check_embedding_dimensions, embed_and_store, get_embedding_provider, _patch_job
+from src.extract import eob_pages, extract_iep, extract_eob
 from src.classify import heuristics, classify_text
 from src.notify import tick as notify_tick
 import psycopg
 from psycopg.types.json import Json
 from openai import OpenAI
 from typing import Dict, Any
-from src.jobs.registry import register_job, dispatch_job, JobFailed, registry
+from src.jobs.registry import register_job, dispatch_job, JobDeferred, JobFailed, registry
 from src.metrics import metrics
-from src.runner import JobRunner
+from src.runner import ENQUEUED_AT_FIELD, JobRunner, stamp_enqueued_at
 from src.state import WorkerState
 from src.httpd import start_health_server
+from src.eventlog import logger as event_logger
+from src.memory import start_tracemalloc
+from src.segments import EOB_PROFILE, IEP_PROFILE, RESEARCH_PROFILE, label_segments, select_ranked_segments
+from src.retrieval import QueryProfile, hybrid_segments
+from src.packing import PROMPT_CANDIDATE_SEGMENTS, pack_for_job
+from src.llm import LLM_CACHE_BYPASS_FIELD, create_response
+from src.segcache import SEGMENT_CACHE_ENABLED, SegmentCache, segment_rows, selection_key
+from src.vectors import EMBED_STORAGE, column_dimensions
+from src.backfill import BACKFILL_BATCH_SIZE, BACKFILL_CONCURRENCY, BACKFILL_SLICE_SECONDS, reembed_spans
+from src.breaker import check_job
+from src.batch import start_batch_lane
+from src.routing import org_tier
+from src.prompts import build_messages
+from src.deadline import DeadlineExceeded, apply_statement_timeout, deadline_for
+from src.keywords import KeywordScorer
 
 def _require_production_env() -> None:
     if os.getenv("NODE_ENV") != "production":
@@ -50,6 +65,8 @@ JOB_STALL_THRESHOLD_SECONDS = float(os.getenv("JOB_STALL_THRESHOLD_SECONDS", "30
 JOB_FAILURE_THRESHOLD = int(os.getenv("JOB_FAILURE_THRESHOLD", "5"))
 JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300"))
 JOB_PROCESSING_QUEUE = os.getenv("JOB_PROCESSING_QUEUE", f"{QUEUE_NAME}:processing")
+JOB_TRACK_MEMORY = os.getenv("JOB_TRACK_MEMORY", "1") not in ("0", "false", "False")
+WORKER_TRACEMALLOC_FRAMES = int(os.getenv("WORKER_TRACEMALLOC_FRAMES", "0"))
 DEFAULT_TZ = "UTC"
 
 JOB_HANDLERS = registry.handlers
@@ -60,15 +77,22 @@ def utc_now_iso() -> str:
 
 
 def log_event(event: str, **fields: Any) -> None:
-    payload = {
-        "ts": utc_now_iso(),
-        "event": event,
-        **fields,
-    }
+    event_logger.emit(event, **fields)
+
+
+def _connect(db_url):
+    """Connection for a handler's main work; statements are capped by the job deadline.
+
+    Error-path connections that record a failed status use ``psycopg.connect``
+    directly so they still run once the deadline has passed.
+    """
+    conn = psycopg.connect(db_url)
     try:
-        print(json.dumps(payload, default=str))
-    except Exception:
-        print({"event": event, **fields})
+        apply_statement_timeout(conn)
+    except BaseException:
+        conn.close()
+        raise
+    return conn
 
 
 def _set_org_context(conn, org_id):
@@ -79,6 +103,19 @@ def _set_org_context(conn, org_id):
     except Exception:
         pass
 
+
+def _write_partial(conn, org_id, sql, params):
+    """Commit one streaming snapshot without putting the job's transaction at risk.
+
+    The write runs in a savepoint: if it fails, only the savepoint is rolled
+    back and the final result can still be stored on ``conn``. The org
+    context is transaction-local, so it is set again after the commit.
+    """
+    with conn.transaction():
+        conn.execute(sql, params)
+    conn.commit()
+    _set_org_context(conn, org_id)
+
 IEP_DIFF_SCHEMA = {
     "name": "IepDiffAnalysis",
     "strict": True,
@@ -182,53 +219,129 @@ IEP_DIFF_SYSTEM_PROMPT = (
 )
 
 
-def _score_span(text):
-    lower = text.lower()
-    score = 1
-    if "minute" in lower or "min" in lower:
-        score += 3
-    if "service" in lower or "therapy" in lower:
-        score += 2
-    if "goal" in lower:
-        score += 2
-    if "accommodation" in lower or "modification" in lower or "support" in lower:
-        score += 2
-    if "frequency" in lower or "per week" in lower:
-        score += 1
-    return score
-
-
-def _select_segments(conn, document_id, prefix, doc_name, limit=60):
-    rows = conn.execute("SELECT id, page, text FROM doc_spans WHERE document_id=%s ORDER BY page ASC LIMIT %s", (document_id, limit * 4)).fetchall()
-    scored = []
-    for row in rows:
-        span_id, page, text = row
-        text = (text or "").strip()
-        if len(text) < 40:
-            continue
-        score = _score_span(text)
-        scored.append((score, str(span_id), page, text))
-    scored.sort(key=lambda item: (-item[0], item[2], item[1]))
-    segments = []
-    used = set()
-    for score, span_id, page, text in scored:
-        if span_id in used:
-            continue
-        label = f"{prefix}{len(segments) + 1:03d}"
-        segments.append({
-            "label": label,
-            "span_id": span_id,
-            "document_id": document_id,
-            "doc_name": doc_name,
-            "page": page,
-            "text": text[:600],
-            "score": score,
-            "which": "latest" if prefix == "L" else "previous"
-        })
-        used.add(span_id)
-        if len(segments) >= limit:
-            break
-    return segments
+# Local fallbacks for IEP_PROFILE / RESEARCH_PROFILE / EOB_PROFILE when Postgres can't rank
+_score_span = KeywordScorer(
+    {
+        "minutes": (("minute", "min"), 3),
+        "services": (("service", "therapy"), 2),
+        "goals": (("goal",), 2),
+        "supports": (("accommodation", "modification", "support"), 2),
+        "frequency": (("frequency", "per week"), 1),
+    }
+)
+
+
+_SEGMENT_CACHE = None
+
+
+def _segment_cache():
+    global _SEGMENT_CACHE
+    if not SEGMENT_CACHE_ENABLED:
+        return None
+    if _SEGMENT_CACHE is None:
+        # Separate client: cached rows are msgpack bytes, not decoded strings
+        _SEGMENT_CACHE = SegmentCache(redis.from_url(REDIS_URL))
+    return _SEGMENT_CACHE
+
+
+def _cached_segments(document_id, selection, load, *, prefix, doc_name, which, limit, include_score=False):
+    """Run ``load`` through the per-document segment cache and relabel for this caller."""
+    cache = _segment_cache()
+    if cache is None or not document_id:
+        return load()
+    rows = cache.get_or_load(str(document_id), selection, lambda: segment_rows(load()))
+    return label_segments(
+        rows,
+        document_id,
+        prefix=prefix,
+        doc_name=doc_name,
+        which=which,
+        limit=limit,
+        include_score=include_score,
+    )
+
+
+def _select_segments(conn, document_id, prefix, doc_name, limit=PROMPT_CANDIDATE_SEGMENTS):
+    which = "latest" if prefix == "L" else "previous"
+    return _cached_segments(
+        document_id,
+        selection_key("ranked", IEP_PROFILE, limit),
+        lambda: select_ranked_segments(
+            conn,
+            document_id,
+            IEP_PROFILE,
+            prefix=prefix,
+            doc_name=doc_name,
+            which=which,
+            limit=limit,
+            fallback_scorer=_score_span,
+            fallback_scan_factor=4,
+            include_score=True,
+        ),
+        prefix=prefix,
+        doc_name=doc_name,
+        which=which,
+        limit=limit,
+        include_score=True,
+    )
+
+
+IEP_DIFF_QUERY = QueryProfile(
+    "iep_diff",
+    "Special education service minutes, frequency and duration; annual goals and objectives; "
+    "accommodations, modifications and supports; placement and related services.",
+    IEP_PROFILE,
+)
+RECOMMENDATIONS_QUERY = QueryProfile(
+    "recommendations",
+    "Student needs and areas of weakness, evaluation results and scores, recommended accommodations, "
+    "services and supports.",
+    IEP_PROFILE,
+)
+ADVOCACY_QUERY = (
+    "{kind}: services the school agreed to or refused, missed or reduced minutes, goals not met, "
+    "communication with the school, requested remedies and deadlines."
+)
+
+_EMBEDDING_PROVIDER = None
+
+
+def _embedding_provider():
+    global _EMBEDDING_PROVIDER
+    if _EMBEDDING_PROVIDER is None:
+        try:
+            _EMBEDDING_PROVIDER = get_embedding_provider(_openai())
+        except Exception as err:
+            log_event("retrieval.provider_unavailable", error=str(err))
+            return None
+    return _EMBEDDING_PROVIDER
+
+
+def _retrieve_segments(conn, document_id, prefix, doc_name, profile: QueryProfile, limit=PROMPT_CANDIDATE_SEGMENTS):
+    """Hybrid (vector + keyword) variant of ``_select_segments`` for the LLM handlers."""
+    which = "latest" if prefix == "L" else "previous"
+    provider = _embedding_provider()
+    return _cached_segments(
+        document_id,
+        selection_key("hybrid", profile, limit, getattr(provider, "name", None), EMBED_STORAGE),
+        lambda: hybrid_segments(
+            conn,
+            document_id,
+            profile,
+            prefix=prefix,
+            doc_name=doc_name,
+            which=which,
+            limit=limit,
+            provider=provider,
+            include_score=True,
+            fallback_scorer=_score_span,
+        ),
+        prefix=prefix,
+        doc_name=doc_name,
+        which=which,
+        limit=limit,
+        include_score=True,
+    )
 
 
 def _render_segments(latest_segments, previous_segments):
@@ -248,6 +361,10 @@ def _render_segments(latest_segments, previous_segments):
     return "\n".join(parts)
 
 
+def _render_cited_excerpt(seg):
+    return f"[{seg['label']}] {seg['doc_name']} (p.{seg['page']})\n{seg['text']}"
+
+
 def _resolve_citations(collection, label_map):
     for item in collection or []:
         resolved = []
@@ -549,43 +666,34 @@ ONE_PAGER_SYSTEM_PROMPT = (
 )
 
 
-def _select_research_segments(conn, document_id: str, doc_name: str, limit: int = 60):
-    rows = conn.execute("SELECT id, page, text FROM doc_spans WHERE document_id=%s ORDER BY page ASC LIMIT %s", (document_id, limit * 3)).fetchall()
-    scored = []
-    for row in rows:
-        span_id, page, text = row
-        text = (text or "").strip()
-        if len(text) < 80:
-            continue
-        lower = text.lower()
-        score = 1
-        if "summary" in lower or "conclusion" in lower:
-            score += 3
-        if "recommend" in lower or "score" in lower or "percentile" in lower:
-            score += 2
-        if "strength" in lower or "need" in lower:
-            score += 1
-        scored.append((score, str(span_id), page, text))
-    scored.sort(key=lambda item: (-item[0], item[2], item[1]))
-    segments = []
-    used = set()
-    for score, span_id, page, text in scored:
-        if span_id in used:
-            continue
-        label = f"R{len(segments) + 1:03d}"
-        segments.append({
-            "label": label,
-            "span_id": span_id,
-            "document_id": document_id,
-            "doc_name": doc_name,
-            "page": page,
-            "text": text[:600],
-            "which": "research"
-        })
-        used.add(span_id)
-        if len(segments) >= limit:
-            break
-    return segments
+_score_research_span = KeywordScorer(
+    {
+        "summary": (("summary", "conclusion"), 3),
+        "findings": (("recommend", "score", "percentile"), 2),
+        "profile": (("strength", "need"), 1),
+    }
+)
+
+
+def _select_research_segments(conn, document_id: str, doc_name: str, limit: int = PROMPT_CANDIDATE_SEGMENTS):
+    return _cached_segments(
+        document_id,
+        selection_key("ranked", RESEARCH_PROFILE, limit),
+        lambda: select_ranked_segments(
+            conn,
+            document_id,
+            RESEARCH_PROFILE,
+            prefix="R",
+            doc_name=doc_name,
+            which="research",
+            limit=limit,
+            fallback_scorer=_score_research_span,
+        ),
+        prefix="R",
+        doc_name=doc_name,
+        which="research",
+        limit=limit,
+    )
 
 
 def _resolve_labels(collection, label_map):
@@ -597,6 +705,13 @@ def _resolve_labels(collection, label_map):
                 resolved.append(seg["span_id"])
         item["citations"] = resolved
 
+
+def _without_citations(items):
+    """Partial items for a streaming snapshot; labels are only resolved on the final write."""
+    return [{k: v for k, v in item.items() if k != "citations"} for item in items or [] if isinstance(item, dict)]
+
+GOAL_SMART_SYSTEM_PROMPT = "You are Joslyn, a special education advocate. Provide concise, actionable output."
+
 DENIAL_TRANSLATE_SYSTEM_PROMPT = (
     "You are Joslyn, a special education and insurance advocate helping caregivers understand denial letters. "
     "Using only the data and excerpts provided, explain the denial in plain language. Summarize the key codes, the insurer's stated reason, and practical next steps. "
@@ -604,62 +719,46 @@ DENIAL_TRANSLATE_SYSTEM_PROMPT = (
 )
 
 
-def _score_eob_span(text: str) -> int:
-    lower = (text or "").lower()
-    score = 1
-    if "denial" in lower or "denied" in lower:
-        score += 3
-    if "code" in lower or "reason" in lower:
-        score += 2
-    if "appeal" in lower or "next step" in lower:
-        score += 2
-    if "benefit" in lower or "coverage" in lower:
-        score += 1
-    if len(lower) > 120:
-        score += 1
-    return score
-
-
-def _select_eob_segments(conn, document_id: str, doc_name: str, limit: int = 40):
-    rows = conn.execute("SELECT id, page, text FROM doc_spans WHERE document_id=%s ORDER BY page ASC LIMIT %s", (document_id, limit * 3)).fetchall()
-    scored = []
-    for row in rows:
-        span_id, page, text = row
-        text = (text or "").strip()
-        if len(text) < 40:
-            continue
-        score = _score_eob_span(text)
-        scored.append((score, str(span_id), page, text))
-    scored.sort(key=lambda item: (-item[0], item[2], item[1]))
-    segments = []
-    used = set()
-    for score, span_id, page, text in scored:
-        if span_id in used:
-            continue
-        label = f"D{len(segments) + 1:03d}"
-        segments.append({
-            "label": label,
-            "span_id": span_id,
-            "document_id": document_id,
-            "doc_name": doc_name,
-            "page": page,
-            "text": text[:600],
-            "which": "denial"
-        })
-        used.add(span_id)
-        if len(segments) >= limit:
-            break
-    return segments
+_score_eob_span = KeywordScorer(
+    {
+        "denial": (("denial", "denied"), 3),
+        "reason": (("code", "reason"), 2),
+        "appeal": (("appeal", "next step"), 2),
+        "coverage": (("benefit", "coverage"), 1),
+    },
+    long_bonus=(120, 1),
+)
+
+
+def _select_eob_segments(conn, document_id: str, doc_name: str, limit: int = PROMPT_CANDIDATE_SEGMENTS):
+    return _cached_segments(
+        document_id,
+        selection_key("ranked", EOB_PROFILE, limit),
+        lambda: select_ranked_segments(
+            conn,
+            document_id,
+            EOB_PROFILE,
+            prefix="D",
+            doc_name=doc_name,
+            which="denial",
+            limit=limit,
+            fallback_scorer=_score_eob_span,
+        ),
+        prefix="D",
+        doc_name=doc_name,
+        which="denial",
+        limit=limit,
+    )
 
 
 def _render_denial_prompt(parsed: dict, segments: list[dict]) -> str:
-    parts = ["Denial data extracted:", json.dumps(parsed or {}, ensure_ascii=False, indent=2)]
-    parts.append("\nDocument excerpts (cite with the bracketed labels):")
+    parts = ["Document excerpts (cite with the bracketed labels):"]
     if segments:
         for seg in segments:
             parts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
     else:
         parts.append("[No readable excerpts found]")
+    parts.extend(["\nDenial data extracted:", json.dumps(parsed or {}, ensure_ascii=False, indent=2)])
     return "\n".join(parts)
 
 
@@ -673,79 +772,84 @@ def handle_ingest_pdf(task: Dict[str, Any]) -> None:
         patch_job = lambda *args, **kwargs: None  # noqa: E731
 
     _patch_job(job_id, "ocr", "processing", org_id)
-    task = process_pdf(task)
-    _patch_job(job_id, "ocr", "done", org_id)
-
-    filename = task.get("filename", "")
-    first_page_text = (task.get("pages") or [{"text": ""}])[0]["text"]
-    classification = heuristics(filename, first_page_text)
-    if not classification.get("doc_type"):
-        try:
-            classification = classify_text(first_page_text, filename)
-        except Exception:
-            classification = classification or {"doc_type": None, "domains": []}
-
-    doc_type_guess = classification.get("doc_type")
-    doc_domains = classification.get("domains") or []
-    doc_type_final = doc_type_guess or None
-    doc_child_id = task.get("child_id")
-    doc_version = None
-    doc_tags = []
-
-    db_url = os.getenv("DATABASE_URL")
-    if db_url:
-        try:
-            with psycopg.connect(db_url) as conn:
-                _set_org_context(conn, org_id)
-                info = conn.execute(
-                    "SELECT type, child_id, version FROM documents WHERE id=%s",
-                    (task.get("document_id"),)
-                ).fetchone()
-                existing_type = info[0] if info else None
-                if info and info[1]:
-                    doc_child_id = info[1]
-                if info:
-                    doc_version = info[2]
-
-                doc_type_final = doc_type_guess or existing_type or "other"
-                tags_buffer = []
-                if doc_type_final:
-                    tags_buffer.append(doc_type_final)
-                tags_buffer.extend(f"domain:{d}" for d in doc_domains)
-                if doc_version is not None:
-                    try:
-                        tags_buffer.append(f"version:{int(doc_version)}")
-                    except Exception:
-                        pass
-                doc_tags = sorted(set(filter(None, tags_buffer))) or ["other"]
+    with open_pdf(task) as pdf:
+        _patch_job(job_id, "ocr", "done", org_id)
 
-                conn.execute(
-                    "UPDATE documents SET doc_tags=%s WHERE id=%s",
-                    (doc_tags, task.get("document_id"))
-                )
+        filename = task.get("filename", "")
+        first_page_text = pdf.page_text(0)
+        classification = heuristics(filename, first_page_text)
+        if not classification.get("doc_type"):
+            try:
+                classification = classify_text(first_page_text, filename)
+            except Exception:
+                classification = classification or {"doc_type": None, "domains": []}
+
+        doc_type_guess = classification.get("doc_type")
+        doc_domains = classification.get("domains") or []
+        doc_type_final = doc_type_guess or None
+        doc_child_id = task.get("child_id")
+        doc_version = None
+        doc_tags = []
+
+        db_url = os.getenv("DATABASE_URL")
+        if db_url:
+            try:
+                with _connect(db_url) as conn:
+                    _set_org_context(conn, org_id)
+                    info = conn.execute(
+                        "SELECT type, child_id, version FROM documents WHERE id=%s",
+                        (task.get("document_id"),)
+                    ).fetchone()
+                    existing_type = info[0] if info else None
+                    if info and info[1]:
+                        doc_child_id = info[1]
+                    if info:
+                        doc_version = info[2]
+
+                    doc_type_final = doc_type_guess or existing_type or "other"
+                    tags_buffer = []
+                    if doc_type_final:
+                        tags_buffer.append(doc_type_final)
+                    tags_buffer.extend(f"domain:{d}" for d in doc_domains)
+                    if doc_version is not None:
+                        try:
+                            tags_buffer.append(f"version:{int(doc_version)}")
+                        except Exception:
+                            pass
+                    doc_tags = sorted(set(filter(None, tags_buffer))) or ["other"]
 
-                if doc_type_guess and (not existing_type or existing_type in ("", "other")):
                     conn.execute(
-                        "UPDATE documents SET type=%s WHERE id=%s",
-                        (doc_type_guess, task.get("document_id"))
+                        "UPDATE documents SET doc_tags=%s WHERE id=%s",
+                        (doc_tags, task.get("document_id"))
                     )
-                    doc_type_final = doc_type_guess
 
-                conn.commit()
-        except Exception as e:
-            print("[WORKER] update document metadata failed:", e)
-    else:
-        doc_type_final = doc_type_final or "other"
-        doc_tags = sorted(set([doc_type_final] + [f"domain:{d}" for d in doc_domains])) or ["other"]
-
-    _patch_job(job_id, "index", "processing", org_id)
-    embed_and_store(task)
-    _patch_job(job_id, "index", "done", org_id)
-
-    if doc_type_final and isinstance(doc_type_final, str) and "eob" in doc_type_final.lower():
-        _patch_job(job_id, "extract", "processing", org_id)
-        extract_eob(task)
-        _patch_job(job_id, "extract", "done", org_id)
+                    if doc_type_guess and (not existing_type or existing_type in ("", "other")):
+                        conn.execute(
+                            "UPDATE documents SET type=%s WHERE id=%s",
+                            (doc_type_guess, task.get("document_id"))
+                        )
+                        doc_type_final = doc_type_guess
+
+                    conn.commit()
+            except Exception as e:
+                log_event("ingest_pdf.metadata_update_failed", document_id=task.get("document_id"), error=str(e))
+        else:
+            doc_type_final = doc_type_final or "other"
+            doc_tags = sorted(set([doc_type_final] + [f"domain:{d}" for d in doc_domains])) or ["other"]
+
+        _patch_job(job_id, "index", "processing", org_id)
+        # Pages stream straight from the open PDF into chunking/embedding/DB writes
+        embed_and_store(task, pages=pdf.iter_pages(), pdf_doc=pdf.doc)
+        cache = _segment_cache()
+        if cache is not None and task.get("document_id"):
+            cache.invalidate(str(task["document_id"]))
+        _patch_job(job_id, "index", "done", org_id)
+
+        if doc_type_final and isinstance(doc_type_final, str) and "eob" in doc_type_final.lower():
+            _patch_job(job_id, "extract", "processing", org_id)
+            task["pages"] = eob_pages(pdf.iter_pages())
+            extract_eob(task)
+            _patch_job(job_id, "extract", "done", org_id)
 
     followups = []
     if db_url and doc_child_id:
@@ -773,9 +877,9 @@ def handle_ingest_pdf(task: Dict[str, Any]) -> None:
             })
     for payload in followups:
         try:
-            r.rpush(QUEUE_NAME, json.dumps(payload))
+            r.rpush(QUEUE_NAME, json.dumps(stamp_enqueued_at(payload)))
         except Exception as enqueue_err:
-            print("[WORKER] enqueue followup failed:", enqueue_err)
+            log_event("ingest_pdf.enqueue_followup_failed", kind=payload.get("kind"), error=str(enqueue_err))
 
 
 @register_job("extract_iep")
@@ -797,7 +901,7 @@ def handle_prep_iep_diff(task: Dict[str, Any]) -> None:
     latest_document_id = task.get("document_id")
     org_id = task.get("org_id")
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             latest_info = conn.execute(
                 "SELECT original_name, type FROM documents WHERE id=%s",
@@ -855,8 +959,10 @@ def handle_prep_iep_diff(task: Dict[str, Any]) -> None:
                 conn.commit()
                 return
 
-            latest_segments = _select_segments(conn, latest_document_id, "L", latest_doc_name or "IEP", limit=60)
-            previous_segments = _select_segments(conn, previous_document_id, "P", previous_doc_name or "Previous IEP", limit=60)
+            latest_segments = _retrieve_segments(conn, latest_document_id, "L", latest_doc_name or "IEP", IEP_DIFF_QUERY)
+            previous_segments = _retrieve_segments(
+                conn, previous_document_id, "P", previous_doc_name or "Previous IEP", IEP_DIFF_QUERY
+            )
 
             if not latest_segments:
                 payload = {
@@ -874,7 +980,12 @@ def handle_prep_iep_diff(task: Dict[str, Any]) -> None:
                 conn.commit()
                 return
 
-            label_map = {seg["label"]: seg for seg in latest_segments + previous_segments}
+            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+            latest_pack, previous_pack = pack_for_job(
+                "prep_iep_diff", model, [latest_segments, previous_segments], shares=[0.6]
+            )
+            latest_segments, previous_segments = latest_pack.segments, previous_pack.segments
+            label_map = {**latest_pack.label_map, **previous_pack.label_map}
             prompt = _render_segments(latest_segments, previous_segments)
 
             api_key = os.getenv("OPENAI_API_KEY")
@@ -895,13 +1006,13 @@ def handle_prep_iep_diff(task: Dict[str, Any]) -> None:
                 return
 
             client = _openai()
-            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
-            response = client.responses.create(
+            response = create_response(
+                client,
+                kind="prep_iep_diff",
+                bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+                tier=org_tier(conn, org_id),
                 model=model,
-                input=[
-                    {"role": "system", "content": IEP_DIFF_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
+                input=build_messages(IEP_DIFF_SYSTEM_PROMPT, documents=[prompt]),
                 response_format={"type": "json_schema", "json_schema": IEP_DIFF_SCHEMA}
             )
             raw = (response.output[0].content[0].text if response.output and response.output[0].content else None)
@@ -928,8 +1039,10 @@ def handle_prep_iep_diff(task: Dict[str, Any]) -> None:
                 (Json(diff_payload), Json(risk_flags), Json(citations_json), diff_id)
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as e:
-        print("[WORKER] prep_iep_diff failed:", e)
+        log_event("prep_iep_diff.failed", error=str(e))
         if db_url and latest_document_id:
             try:
                 with psycopg.connect(db_url) as conn2:
@@ -940,7 +1053,9 @@ def handle_prep_iep_diff(task: Dict[str, Any]) -> None:
                     )
                     conn2.commit()
             except Exception as inner:
-                print("[WORKER] unable to mark diff error:", inner)
+                log_event("prep_iep_diff.error_mark_failed", error=str(inner))
+        if isinstance(e, DeadlineExceeded):
+            raise
 
 
 @register_job("denial_explain")
@@ -955,7 +1070,7 @@ def handle_denial_explain(task: Dict[str, Any]) -> None:
     if not eob_id or not document_id:
         return
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             eob_row = conn.execute(
                 "SELECT parsed_json FROM eobs WHERE id=%s",
@@ -988,18 +1103,19 @@ def handle_denial_explain(task: Dict[str, Any]) -> None:
                 conn.commit()
                 return
 
-            segments = _select_eob_segments(conn, document_id, doc_name, limit=40)
-            label_map = {seg["label"]: seg for seg in segments}
+            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+            [packed] = pack_for_job("denial_explain", model, [_select_eob_segments(conn, document_id, doc_name)])
+            segments, label_map = packed.segments, packed.label_map
             prompt = _render_denial_prompt(parsed, segments)
 
             client = _openai()
-            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
-            response = client.responses.create(
+            response = create_response(
+                client,
+                kind="denial_explain",
+                bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+                tier=org_tier(conn, org_id),
                 model=model,
-                input=[
-                    {"role": "system", "content": DENIAL_TRANSLATE_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
+                input=build_messages(DENIAL_TRANSLATE_SYSTEM_PROMPT, documents=[prompt]),
                 response_format={"type": "json_schema", "json_schema": DENIAL_TRANSLATE_SCHEMA}
             )
             raw = (response.output[0].content[0].text if response.output and response.output[0].content else None)
@@ -1041,8 +1157,12 @@ def handle_denial_explain(task: Dict[str, Any]) -> None:
                 (org_id, child_id, eob_id, document_id, Json(explanation_json), Json(next_steps_json), Json(citations_json))
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as e:
-        print("[WORKER] denial_explain failed:", e)
+        log_event("denial_explain.failed", error=str(e))
+        if isinstance(e, DeadlineExceeded):
+            raise
 
 
 @register_job("research_summary")
@@ -1056,7 +1176,7 @@ def handle_research_summary(task: Dict[str, Any]) -> None:
     if not document_id:
         return
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             doc = conn.execute(
                 "SELECT original_name, type FROM documents WHERE id=%s",
@@ -1066,24 +1186,29 @@ def handle_research_summary(task: Dict[str, Any]) -> None:
             if doc:
                 doc_name = doc[0] or doc[1]
             doc_name = doc_name or "Report"
-            segments = _select_research_segments(conn, document_id, doc_name, limit=60)
-            prompt_parts = [
-                "Summarize this report for families:",
-            ]
+            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+            [packed] = pack_for_job("research_summary", model, [_select_research_segments(conn, document_id, doc_name)])
+            segments = packed.segments
+            excerpts = []
             if segments:
-                prompt_parts.append("Excerpts (cite labels):")
+                excerpts.append("Excerpts (cite labels):")
                 for seg in segments:
-                    prompt_parts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
-            prompt = "\n".join(prompt_parts)
+                    excerpts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
+            messages = build_messages(
+                RESEARCH_SUMMARY_SYSTEM_PROMPT,
+                instructions=["Summarize this report for families:"],
+                documents=excerpts,
+            )
 
             client = _openai()
-            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
-            response = client.responses.create(
+            response = create_response(
+                client,
+                kind="research_summary",
+                bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+                tier=org_tier(conn, org_id),
+                batch_task=task,
                 model=model,
-                input=[
-                    {"role": "system", "content": RESEARCH_SUMMARY_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
+                input=messages,
                 response_format={"type": "json_schema", "json_schema": RESEARCH_SUMMARY_SCHEMA}
             )
             raw = response.output[0].content[0].text if response.output and response.output[0].content else None
@@ -1098,7 +1223,7 @@ def handle_research_summary(task: Dict[str, Any]) -> None:
                 "citations": data.get("citations") or []
             }
             reading_level = data.get("reading_level")
-            label_map = {seg["label"]: seg for seg in segments}
+            label_map = packed.label_map
             _resolve_labels([summary], label_map)
             citations_json = _build_citation_entries(label_map, set(summary.get("citations") or []))
 
@@ -1121,8 +1246,12 @@ def handle_research_summary(task: Dict[str, Any]) -> None:
                 }), Json(summary.get("glossary") or []), Json(citations_json), reading_level)
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as e:
-        print("[WORKER] research_summary failed:", e)
+        log_event("research_summary.failed", error=str(e))
+        if isinstance(e, DeadlineExceeded):
+            raise
 
 
 @register_job("build_advocacy_outline")
@@ -1138,7 +1267,7 @@ def handle_build_advocacy_outline(task: Dict[str, Any]) -> None:
     if not outline_id or not child_id:
         return
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             row = conn.execute(
                 "SELECT outline_json FROM advocacy_outlines WHERE id=%s",
@@ -1158,7 +1287,15 @@ def handle_build_advocacy_outline(task: Dict[str, Any]) -> None:
                     doc_name = doc_info[0] or doc_info[1] or doc_name
             segments = []
             if source_document_id:
-                segments = _select_segments(conn, source_document_id, "O", doc_name, limit=60)
+                profile = QueryProfile(
+                    f"advocacy_{outline_kind}",
+                    ADVOCACY_QUERY.format(kind=outline_kind.replace("_", " ")),
+                    IEP_PROFILE,
+                )
+                segments = _retrieve_segments(conn, source_document_id, "O", doc_name, profile)
+            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+            [packed] = pack_for_job("build_advocacy_outline", model, [segments])
+            segments = packed.segments
             if not segments:
                 payload = {
                     "document_id": source_document_id,
@@ -1176,27 +1313,51 @@ def handle_build_advocacy_outline(task: Dict[str, Any]) -> None:
                 )
                 conn.commit()
                 return
-            label_map = {seg["label"]: seg for seg in segments}
-            prompt_parts = [
-                "Draft a mediation or complaint outline for a caregiver.",
-                f"Outline kind: {outline_kind}.",
-                "Organize the outline into background facts, previous attempts, requested remedies, and next steps.",
-                "Use only the provided excerpts and cite them with their labels (e.g., [O001]).",
-                "Return JSON that matches the schema."
-            ]
-            prompt_parts.append("Excerpts:")
+            label_map = packed.label_map
+            excerpts = ["Excerpts:"]
             for seg in segments:
-                prompt_parts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
-            prompt = "\n".join(prompt_parts)
+                excerpts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
+            messages = build_messages(
+                ADVOCACY_OUTLINE_SYSTEM_PROMPT,
+                instructions=[
+                    "Draft a mediation or complaint outline for a caregiver.",
+                    "Organize the outline into background facts, previous attempts, requested remedies, and next steps.",
+                    "Use only the provided excerpts and cite them with their labels (e.g., [O001]).",
+                    "Return JSON that matches the schema."
+                ],
+                documents=excerpts,
+                request=[f"Outline kind: {outline_kind}."],
+            )
+
+            def _write_snapshot(partial):
+                if not isinstance(partial, dict):
+                    return
+                snapshot = {
+                    "document_id": source_document_id,
+                    "outline_kind": outline_kind,
+                    "summary": partial.get("summary") or "",
+                    "facts": _without_citations(partial.get("facts")),
+                    "attempts": _without_citations(partial.get("attempts")),
+                    "remedies": _without_citations(partial.get("remedies")),
+                    "next_steps": _without_citations(partial.get("next_steps")),
+                    "closing": partial.get("closing") or ""
+                }
+                _write_partial(
+                    conn,
+                    org_id,
+                    "UPDATE advocacy_outlines SET outline_json=%s, status='streaming', updated_at=NOW() WHERE id=%s",
+                    (Json(snapshot), outline_id)
+                )
 
             client = _openai()
-            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
-            response = client.responses.create(
+            response = create_response(
+                client,
+                kind="build_advocacy_outline",
+                bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+                tier=org_tier(conn, org_id),
+                on_partial=_write_snapshot,
                 model=model,
-                input=[
-                    {"role": "system", "content": ADVOCACY_OUTLINE_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
+                input=messages,
                 response_format={"type": "json_schema", "json_schema": ADVOCACY_OUTLINE_SCHEMA}
             )
             raw = response.output[0].content[0].text if response.output and response.output[0].content else None
@@ -1231,8 +1392,10 @@ def handle_build_advocacy_outline(task: Dict[str, Any]) -> None:
                 (Json(outline_payload), Json(citations_json), status_value, outline_id)
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as e:
-        print("[WORKER] build_advocacy_outline failed:", e)
+        log_event("build_advocacy_outline.failed", error=str(e))
         try:
             if db_url:
                 with psycopg.connect(db_url) as conn2:
@@ -1240,7 +1403,9 @@ def handle_build_advocacy_outline(task: Dict[str, Any]) -> None:
                     conn2.execute("UPDATE advocacy_outlines SET status='error', updated_at=NOW() WHERE id=%s", (outline_id,))
                     conn2.commit()
         except Exception as inner:
-            print("[WORKER] build_advocacy_outline error mark failed:", inner)
+            log_event("build_advocacy_outline.error_mark_failed", error=str(inner))
+        if isinstance(e, DeadlineExceeded):
+            raise
 
 
 @register_job("seed_safety_phrases")
@@ -1251,7 +1416,7 @@ def handle_seed_safety_phrases(task: Dict[str, Any]) -> None:
     phrases = task.get("phrases")
     org_id = task.get("org_id")
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             if isinstance(phrases, list):
                 for phrase in phrases:
@@ -1271,7 +1436,7 @@ def handle_seed_safety_phrases(task: Dict[str, Any]) -> None:
                     )
             conn.commit()
     except Exception as e:
-        print("[WORKER] seed_safety_phrases failed:", e)
+        log_event("seed_safety_phrases.failed", error=str(e))
 
 
 @register_job("generate_safety_phrase")
@@ -1284,7 +1449,7 @@ def handle_generate_safety_phrase(task: Dict[str, Any]) -> None:
     tag = task.get("tag") or "general"
     doc_id = task.get("document_id")
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             doc_name = "Document"
             segments = []
@@ -1295,28 +1460,31 @@ def handle_generate_safety_phrase(task: Dict[str, Any]) -> None:
                 ).fetchone()
                 if doc_info:
                     doc_name = doc_info[0] or doc_name
-                segments = _select_segments(conn, doc_id, "S", doc_name, limit=30)
-            prompt_parts = [
+                segments = _select_segments(conn, doc_id, "S", doc_name)
+            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+            [packed] = pack_for_job("generate_safety_phrase", model, [segments], render=_render_cited_excerpt)
+            segments = packed.segments
+            excerpts = []
+            if segments:
+                excerpts.append("Excerpts (cite labels):")
+                excerpts.extend(_render_cited_excerpt(seg) for seg in segments)
+            details = [
                 f"Tag: {tag}",
                 f"Child ID: {child_id}",
                 "Context cues:",
             ]
             for context in (task.get("contexts") or []):
-                prompt_parts.append(f"- {context}")
-            if segments:
-                prompt_parts.append("Excerpts (cite labels):")
-                for seg in segments:
-                    prompt_parts.append(f"[{seg['label']}] {seg['doc_name']} (p.{seg['page']})\n{seg['text']}")
-            prompt = "\n\n".join(prompt_parts)
+                details.append(f"- {context}")
+            messages = build_messages(SAFETY_PHRASE_SYSTEM_PROMPT, documents=excerpts, request=details, joiner="\n\n")
 
             client = _openai()
-            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
-            response = client.responses.create(
+            response = create_response(
+                client,
+                kind="generate_safety_phrase",
+                bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+                tier=org_tier(conn, org_id),
                 model=model,
-                input=[
-                    {"role": "system", "content": SAFETY_PHRASE_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
+                input=messages,
                 response_format={
                     "type": "json_schema",
                     "json_schema": {
@@ -1349,8 +1517,10 @@ def handle_generate_safety_phrase(task: Dict[str, Any]) -> None:
                 (org_id, tag, task.get("contexts") or [], Json(content), "active"),
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as e:
-        print("[WORKER] generate_safety_phrase failed:", e)
+        log_event("generate_safety_phrase.failed", error=str(e))
         try:
             with psycopg.connect(db_url) as conn2:
                 _set_org_context(conn2, org_id)
@@ -1365,7 +1535,9 @@ def handle_generate_safety_phrase(task: Dict[str, Any]) -> None:
                 )
                 conn2.commit()
         except Exception as inner:
-            print("[WORKER] generate_safety_phrase fallback failed:", inner)
+            log_event("generate_safety_phrase.fallback_failed", error=str(inner))
+        if isinstance(e, DeadlineExceeded):
+            raise
 
 
 @register_job("build_one_pager")
@@ -1383,7 +1555,7 @@ def handle_build_one_pager(task: Dict[str, Any]) -> None:
     if not one_pager_id or not child_id:
         return
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             row = conn.execute(
                 "SELECT language_primary, language_secondary FROM one_pagers WHERE id=%s",
@@ -1425,35 +1597,35 @@ def handle_build_one_pager(task: Dict[str, Any]) -> None:
                 if cite.get("span_id"):
                     span_ids.add(str(cite["span_id"]))
             segments = []
-            label_map = {}
             if span_ids:
                 span_rows = conn.execute(
                     "SELECT ds.id::text, ds.page, ds.text, ds.document_id, d.original_name FROM doc_spans ds JOIN documents d ON d.id = ds.document_id WHERE ds.id = ANY(%s)",
                     (list(span_ids),)
                 ).fetchall()
                 for idx, span in enumerate(span_rows, start=1):
-                    label = f"W{idx:03d}"
-                    segment = {
-                        "label": label,
+                    segments.append({
+                        "label": f"W{idx:03d}",
                         "span_id": span[0],
                         "page": span[1],
-                        "text": (span[2] or "").strip()[:600],
+                        "text": (span[2] or "").strip(),
                         "document_id": span[3],
                         "doc_name": span[4] or "Document"
-                    }
-                    segments.append(segment)
-                    label_map[label] = segment
+                    })
             if not segments and document_id:
-                doc_segments = _select_segments(conn, document_id, "W", document_name, limit=40)
-                for seg in doc_segments:
-                    label_map[seg["label"]] = seg
-                segments = doc_segments
+                segments = _select_segments(conn, document_id, "W", document_name)
+            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+            [packed] = pack_for_job("build_one_pager", model, [segments], render=_render_cited_excerpt)
+            segments, label_map = packed.segments, packed.label_map
             if not document_id and segments:
                 document_id = segments[0].get("document_id")
             strengths = profile_json.get("strengths") or []
             sensory = profile_json.get("sensory_supports") or []
             communications = profile_json.get("communication") or profile_json.get("communication_notes") or []
-            prompt_parts = [
+            excerpts = []
+            if segments:
+                excerpts.append("Document excerpts (cite labels):")
+                excerpts.extend(_render_cited_excerpt(seg) for seg in segments)
+            details = [
                 f"Child: {child_name}",
                 f"Audience: {audience}",
                 f"Primary language: {language_primary}",
@@ -1461,30 +1633,50 @@ def handle_build_one_pager(task: Dict[str, Any]) -> None:
                 "Strengths:",
             ]
             for strength in strengths:
-                prompt_parts.append(f"- {strength}")
-            prompt_parts.append("Sensory supports:")
+                details.append(f"- {strength}")
+            details.append("Sensory supports:")
             for item in sensory:
-                prompt_parts.append(f"- {item}")
-            prompt_parts.append("Communication preferences:")
+                details.append(f"- {item}")
+            details.append("Communication preferences:")
             for item in communications:
-                prompt_parts.append(f"- {item}")
-            prompt_parts.append("Recommendations:")
+                details.append(f"- {item}")
+            details.append("Recommendations:")
             for item in recommendations or []:
-                prompt_parts.append(f"- {item.get('title')}: {item.get('recommendation')}")
-            if segments:
-                prompt_parts.append("Document excerpts (cite labels):")
-                for seg in segments:
-                    prompt_parts.append(f"[{seg['label']}] {seg['doc_name']} (p.{seg['page']})\n{seg['text']}")
-            prompt = "\n\n".join(prompt_parts)
+                details.append(f"- {item.get('title')}: {item.get('recommendation')}")
+            messages = build_messages(ONE_PAGER_SYSTEM_PROMPT, documents=excerpts, request=details, joiner="\n\n")
+
+            def _write_snapshot(partial):
+                if not isinstance(partial, dict):
+                    return
+                snapshot = {
+                    "title": partial.get("title") or f"{child_name} support snapshot",
+                    "intro_en": partial.get("intro_en") or "",
+                    "intro_es": partial.get("intro_es") or "",
+                    "sections": _without_citations(partial.get("sections")),
+                    "strategies": _without_citations(partial.get("strategies")),
+                    "closing_en": partial.get("closing_en") or "",
+                    "closing_es": partial.get("closing_es") or "",
+                    "audience": audience,
+                    "document_id": document_id,
+                    "language_primary": language_primary,
+                    "language_secondary": language_secondary
+                }
+                _write_partial(
+                    conn,
+                    org_id,
+                    "UPDATE one_pagers SET content_json=%s, status='streaming', updated_at=NOW() WHERE id=%s",
+                    (Json(snapshot), one_pager_id)
+                )
 
             client = _openai()
-            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
-            response = client.responses.create(
+            response = create_response(
+                client,
+                kind="build_one_pager",
+                bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+                tier=org_tier(conn, org_id),
+                on_partial=_write_snapshot,
                 model=model,
-                input=[
-                    {"role": "system", "content": ONE_PAGER_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
+                input=messages,
                 response_format={"type": "json_schema", "json_schema": ONE_PAGER_SCHEMA}
             )
             raw = response.output[0].content[0].text if response.output and response.output[0].content else None
@@ -1529,8 +1721,10 @@ def handle_build_one_pager(task: Dict[str, Any]) -> None:
                 (Json(content), Json(citations_json), status_value, language_primary, language_secondary, one_pager_id)
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as e:
-        print("[WORKER] build_one_pager failed:", e)
+        log_event("build_one_pager.failed", error=str(e))
         try:
             if db_url:
                 with psycopg.connect(db_url) as conn2:
@@ -1541,7 +1735,9 @@ def handle_build_one_pager(task: Dict[str, Any]) -> None:
                     )
                     conn2.commit()
         except Exception as inner:
-            print("[WORKER] build_one_pager error mark failed:", inner)
+            log_event("build_one_pager.error_mark_failed", error=str(inner))
+        if isinstance(e, DeadlineExceeded):
+            raise
 
 
 @register_job("goal_smart")
@@ -1557,26 +1753,35 @@ def handle_goal_smart(task: Dict[str, Any]) -> None:
     if not goal_text or not goal_identifier:
         return
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             segments = []
             if document_id:
-                segments = _select_segments(conn, document_id, "G", "IEP Goal", limit=30)
-            prompt_parts = [
-                "Original goal:",
-                goal_text,
-                "",
-                "Evaluate the goal using SMART criteria (Specific, Measurable, Attainable, Relevant, Time-bound).",
-                "Return a table of ratings plus a rewritten goal that is measurable and includes baseline/progress monitoring plan.",
-            ]
+                profile = QueryProfile(
+                    "goal_smart",
+                    f"{goal_text[:500]}\nBaseline, measurable criteria, progress monitoring.",
+                    IEP_PROFILE,
+                )
+                segments = _retrieve_segments(conn, document_id, "G", "IEP Goal", profile)
+            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+            [packed] = pack_for_job("goal_smart", model, [segments])
+            segments = packed.segments
+            excerpts = []
             if segments:
-                prompt_parts.append("Supporting excerpts:")
+                excerpts.append("Supporting excerpts:")
                 for seg in segments:
-                    prompt_parts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
-            prompt = "\n".join(prompt_parts)
+                    excerpts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
+            messages = build_messages(
+                GOAL_SMART_SYSTEM_PROMPT,
+                instructions=[
+                    "Evaluate the goal using SMART criteria (Specific, Measurable, Attainable, Relevant, Time-bound).",
+                    "Return a table of ratings plus a rewritten goal that is measurable and includes baseline/progress monitoring plan.",
+                ],
+                documents=excerpts,
+                request=["", "Original goal:", goal_text],
+            )
 
             client = _openai()
-            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
             schema = {
                 "name": "GoalSmartRewrite",
                 "strict": True,
@@ -1610,12 +1815,13 @@ def handle_goal_smart(task: Dict[str, Any]) -> None:
                 }
             }
 
-            response = client.responses.create(
+            response = create_response(
+                client,
+                kind="goal_smart",
+                bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+                tier=org_tier(conn, org_id),
                 model=model,
-                input=[
-                    {"role": "system", "content": "You are Joslyn, a special education advocate. Provide concise, actionable output."},
-                    {"role": "user", "content": prompt}
-                ],
+                input=messages,
                 response_format={"type": "json_schema", "json_schema": schema}
             )
             raw = response.output[0].content[0].text if response.output and response.output[0].content else None
@@ -1630,7 +1836,7 @@ def handle_goal_smart(task: Dict[str, Any]) -> None:
                 "citations": data.get("citations") or []
             }
 
-            label_map = {seg["label"]: seg for seg in segments}
+            label_map = packed.label_map
             _resolve_citations([rewrite_json], label_map)
             citations_json = _build_citation_entries(label_map, set(rewrite_json.get("citations") or []))
 
@@ -1648,8 +1854,10 @@ def handle_goal_smart(task: Dict[str, Any]) -> None:
                 (org_id, child_id, document_id, goal_identifier, Json(rewrite_json.get("rubric") or []), Json(rewrite_json), Json(citations_json))
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as e:
-        print("[WORKER] goal_smart failed:", e)
+        log_event("goal_smart.failed", error=str(e))
         if db_url:
             try:
                 with psycopg.connect(db_url) as conn2:
@@ -1665,7 +1873,9 @@ def handle_goal_smart(task: Dict[str, Any]) -> None:
                     )
                     conn2.commit()
             except Exception as inner:
-                print("[WORKER] goal_smart fallback failed:", inner)
+                log_event("goal_smart.fallback_failed", error=str(inner))
+        if isinstance(e, DeadlineExceeded):
+            raise
 
 
 @register_job("build_appeal_kit")
@@ -1677,7 +1887,7 @@ def handle_build_appeal_kit(task: Dict[str, Any]) -> None:
     child_id = task.get("child_id")
     org_id = task.get("org_id")
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             kit = conn.execute(
                 "SELECT id, child_id, org_id, denial_id, deadline_date, metadata_json FROM appeal_kits WHERE id=%s",
@@ -1757,7 +1967,7 @@ def handle_build_appeal_kit(task: Dict[str, Any]) -> None:
             )
             conn.commit()
     except Exception as e:
-        print("[WORKER] build_appeal_kit failed:", e)
+        log_event("build_appeal_kit.failed", error=str(e))
 
 @register_job("prep_recommendations")
 def handle_prep_recommendations(task: Dict[str, Any]) -> None:
@@ -1772,7 +1982,7 @@ def handle_prep_recommendations(task: Dict[str, Any]) -> None:
         return
     request_hash = hashlib.sha1(f"{child_id}:{source_kind}:{document_id or ''}".encode("utf-8")).hexdigest()
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             conn.execute(
                 """
@@ -1796,11 +2006,11 @@ def handle_prep_recommendations(task: Dict[str, Any]) -> None:
             )
             conn.commit()
     except Exception as mark_err:
-        print("[WORKER] prep_recommendations pending mark failed:", mark_err)
+        log_event("prep_recommendations.pending_mark_failed", error=str(mark_err))
     if not document_id:
         return
     try:
-        with psycopg.connect(db_url) as conn:
+        with _connect(db_url) as conn:
             _set_org_context(conn, org_id)
             doc_row = conn.execute(
                 "SELECT original_name, type FROM documents WHERE id=%s",
@@ -1810,7 +2020,11 @@ def handle_prep_recommendations(task: Dict[str, Any]) -> None:
             if doc_row:
                 doc_name = doc_row[0] or doc_row[1]
             doc_name = doc_name or "Document"
-            segments = _select_segments(conn, document_id, "R", doc_name, limit=60)
+            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+            [packed] = pack_for_job(
+                "prep_recommendations", model, [_retrieve_segments(conn, document_id, "R", doc_name, RECOMMENDATIONS_QUERY)]
+            )
+            segments = packed.segments
             if not segments:
                 conn.execute(
                     "UPDATE recommendations SET recommendations_json=%s, citations_json=%s, locale=%s, status='empty', updated_at=NOW() WHERE child_id=%s AND source_kind=%s",
@@ -1818,24 +2032,28 @@ def handle_prep_recommendations(task: Dict[str, Any]) -> None:
                 )
                 conn.commit()
                 return
-            label_map = {seg["label"]: seg for seg in segments}
-            prompt_parts = [
-                "Produce 3-5 specific accommodations or services that match the student's needs.",
-                "Use only the provided excerpts and cite each recommendation using the excerpt labels (e.g., [R001]).",
-                "Return bilingual output so families can share in English and Spanish."
-            ]
-            prompt_parts.append("Excerpts:")
+            label_map = packed.label_map
+            excerpts = ["Excerpts:"]
             for seg in segments:
-                prompt_parts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
-            prompt = "\n".join(prompt_parts)
+                excerpts.append(f"[{seg['label']}] (page {seg['page']}) {seg['text']}")
+            messages = build_messages(
+                RECOMMENDATIONS_SYSTEM_PROMPT,
+                instructions=[
+                    "Produce 3-5 specific accommodations or services that match the student's needs.",
+                    "Use only the provided excerpts and cite each recommendation using the excerpt labels (e.g., [R001]).",
+                    "Return bilingual output so families can share in English and Spanish."
+                ],
+                documents=excerpts,
+            )
             client = _openai()
-            model = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
-            response = client.responses.create(
+            response = create_response(
+                client,
+                kind="prep_recommendations",
+                bypass=bool(task.get(LLM_CACHE_BYPASS_FIELD)),
+                tier=org_tier(conn, org_id),
+                batch_task=task,
                 model=model,
-                input=[
-                    {"role": "system", "content": RECOMMENDATIONS_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
+                input=messages,
                 response_format={"type": "json_schema", "json_schema": RECOMMENDATIONS_SCHEMA}
             )
             raw = response.output[0].content[0].text if response.output and response.output[0].content else None
@@ -1876,8 +2094,10 @@ def handle_prep_recommendations(task: Dict[str, Any]) -> None:
                 (Json(items), Json(citations_json), "en", status_value, child_id, source_kind)
             )
             conn.commit()
+    except JobDeferred:
+        raise
     except Exception as e:
-        print("[WORKER] prep_recommendations failed:", e)
+        log_event("prep_recommendations.failed", error=str(e))
         try:
             with psycopg.connect(db_url) as conn:
                 _set_org_context(conn, org_id)
@@ -1887,8 +2107,90 @@ def handle_prep_recommendations(task: Dict[str, Any]) -> None:
                 )
                 conn.commit()
         except Exception as inner:
-            print("[WORKER] prep_recommendations error mark failed:", inner)
+            log_event("prep_recommendations.error_mark_failed", error=str(inner))
+        if isinstance(e, DeadlineExceeded):
+            raise
+
+
+@register_job("reindex_document")
+def handle_reindex_document(task: Dict[str, Any]) -> None:
+    """Re-run ``ingest_pdf`` on a stored document as a re-index.
+
+    ``embed_and_store`` then keeps spans whose chunk hash is unchanged, so
+    only what a better OCR pass or chunker change actually moved is
+    re-embedded (and citations to unchanged spans survive).
+    """
+    db_url = os.getenv("DATABASE_URL")
+    document_id = task.get("document_id")
+    if not db_url or not document_id:
+        return
+    with _connect(db_url) as conn:
+        _set_org_context(conn, task.get("org_id"))
+        row = conn.execute(
+            "SELECT storage_uri, original_name, child_id, org_id FROM documents WHERE id=%s",
+            (document_id,)
+        ).fetchone()
+    if not row or not row[0]:
+        log_event("reindex_document.not_found", document_id=document_id)
+        return
+    storage_uri, original_name, child_id, org_id = row
+    payload = {
+        "kind": "ingest_pdf",
+        "document_id": document_id,
+        "s3_key": storage_uri,
+        "filename": original_name or "",
+        "child_id": child_id,
+        "org_id": org_id,
+        "reindex": True,
+    }
+    r.rpush(QUEUE_NAME, json.dumps(stamp_enqueued_at(payload), default=str))
+    log_event("reindex_document.enqueued", document_id=document_id)
+
+
+@register_job("reembed_spans")
+def handle_reembed_spans(task: Dict[str, Any]) -> None:
+    """Re-embed spans onto ``model`` in time-boxed slices, re-enqueueing until done."""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        log_event("reembed_spans.skipped", reason="no_database_url")
+        return
+    model = (task.get("model") or EMBED_MODEL).strip()
+    with _connect(db_url) as conn:
+        summary = reembed_spans(
+            conn,
+            _openai(),
+            model=model,
+            redis_client=r,
+            batch_size=int(task.get("batch_size") or BACKFILL_BATCH_SIZE),
+            concurrency=int(task.get("concurrency") or BACKFILL_CONCURRENCY),
+            max_seconds=float(task.get("max_seconds") or BACKFILL_SLICE_SECONDS),
+            dimensions=task.get("dimensions"),
+            segment_cache=_segment_cache(),
+        )
+    if summary["done"]:
+        log_event("reembed_spans.done", model=model, processed=summary["processed"])
+        return
+    # Hand the rest back to the queue so other jobs get a turn between slices
+    continuation = {k: v for k, v in task.items() if k != ENQUEUED_AT_FIELD}
+    r.rpush(QUEUE_NAME, json.dumps(stamp_enqueued_at(continuation)))
+
+
+def _check_embedding_column() -> None:
+    """Refuse to start when EMBED_DIMENSIONS / EMBED_STORAGE don't fit doc_spans; a DB that's down is only logged."""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        return
+    try:
+        with psycopg.connect(db_url) as conn:
+            declared = column_dimensions(conn)
+    except Exception as err:
+        log_event("worker.embedding_column_check_failed", error=str(err))
+        return
+    check_embedding_dimensions(declared)
+
+
 def run():
+    _check_embedding_column()
     log_event(
         "worker.start",
         queue=QUEUE_NAME,
@@ -1899,7 +2201,10 @@ def run():
         stall_threshold_seconds=JOB_STALL_THRESHOLD_SECONDS,
         failure_threshold=JOB_FAILURE_THRESHOLD,
     )
+    if WORKER_TRACEMALLOC_FRAMES > 0:
+        start_tracemalloc(WORKER_TRACEMALLOC_FRAMES)
     start_health_server(state)
+    start_batch_lane()
     runner = JobRunner(
         redis_client=r,
         state=state,
@@ -1913,7 +2218,10 @@ def run():
         queue_poll_timeout=QUEUE_POLL_TIMEOUT,
         queue_log_interval=QUEUE_HEALTH_LOG_INTERVAL,
         failure_sleep_seconds=JOB_RUNNER_FAILURE_SLEEP,
+        track_memory=JOB_TRACK_MEMORY,
         dispatch_fn=dispatch_job,
+        gate_fn=check_job,
+        deadline_fn=deadline_for,
         patch_job_fn=_patch_job,
         notify_fn=notify_tick,
         log_fn=log_event,
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_STATM_PATH = "/proc/self/statm"
+_STATUS_PATH = "/proc/self/status"
+_CLEAR_REFS_PATH = "/proc/self/clear_refs"
+
+
+def _maxrss_bytes() -> int:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return int(usage) if sys.platform == "darwin" else int(usage) * 1024
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, falling back to the lifetime peak."""
+    try:
+        with open(_STATM_PATH, "r", encoding="ascii") as fh:
+            fields = fh.read().split()
+        return int(fields[1]) * _PAGE_SIZE
+    except Exception:
+        return _maxrss_bytes()
+
+
+def _read_hwm_bytes() -> Optional[int]:
+    try:
+        with open(_STATUS_PATH, "r", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        return None
+    return None
+
+
+def _reset_hwm() -> bool:
+    # Writing "5" resets VmHWM to the current RSS (Linux >= 4.0).
+    try:
+        with open(_CLEAR_REFS_PATH, "w", encoding="ascii") as fh:
+            fh.write("5")
+        return True
+    except Exception:
+        return False
+
+
+class JobMemoryWatch:
+    """Tracks RSS before/after a job and the peak reached while it ran.
+
+    Prefers the kernel high-water mark (reset per job through clear_refs);
+    when that is unavailable a daemon thread samples RSS instead.
+    """
+
+    def __init__(self, *, sample_interval: float = 0.05) -> None:
+        self.sample_interval = max(0.005, sample_interval)
+        self.rss_before = 0
+        self.rss_after = 0
+        self.peak = 0
+        self._use_hwm = False
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> "JobMemoryWatch":
+        self.rss_before = current_rss_bytes()
+        self.peak = self.rss_before
+        self._use_hwm = _reset_hwm() and _read_hwm_bytes() is not None
+        if not self._use_hwm:
+            self._sampler = threading.Thread(target=self._sample, name="job-memory-sampler", daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self) -> "JobMemoryWatch":
+        self.rss_after = current_rss_bytes()
+        if self._use_hwm:
+            self.peak = max(self.peak, _read_hwm_bytes() or 0)
+        else:
+            self._stop.set()
+            if self._sampler:
+                self._sampler.join(timeout=1.0)
+        self.peak = max(self.peak, self.rss_before, self.rss_after)
+        return self
+
+    @property
+    def retained(self) -> int:
+        return self.rss_after - self.rss_before
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            rss = current_rss_bytes()
+            if rss > self.peak:
+                self.peak = rss
+
+
+# ---- tracemalloc -------------------------------------------------------------
+
+_tracemalloc_lock = threading.Lock()
+
+
+def tracemalloc_status() -> Dict[str, Any]:
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "rss_bytes": current_rss_bytes(),
+    }
+
+
+def start_tracemalloc(frames: int = 1) -> Dict[str, Any]:
+    with _tracemalloc_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, min(int(frames), 64)))
+    return tracemalloc_status()
+
+
+def stop_tracemalloc() -> Dict[str, Any]:
+    with _tracemalloc_lock:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+    return tracemalloc_status()
+
+
+def top_allocations(limit: int = 25, group_by: str = "lineno") -> Dict[str, Any]:
+    """Return the largest allocation sites recorded by tracemalloc."""
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise ValueError("group_by must be lineno, filename or traceback")
+    with _tracemalloc_lock:
+        if not tracemalloc.is_tracing():
+            return {**tracemalloc_status(), "top": []}
+        snapshot = tracemalloc.take_snapshot()
+    snapshot = snapshot.filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )
+    )
+    stats = snapshot.statistics(group_by)
+    top: List[Dict[str, Any]] = []
+    for stat in stats[: max(1, int(limit))]:
+        top.append(
+            {
+                "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+        )
+    return {**tracemalloc_status(), "top": top}
+
+
+__all__ = [
+    "JobMemoryWatch",
+    "current_rss_bytes",
+    "start_tracemalloc",
+    "stop_tracemalloc",
+    "top_allocations",
+    "tracemalloc_status",
+]
@@ -4,6 +4,47 @@ import threading
 from collections import defaultdict
 from typing import Dict, Iterable, Tuple
 
+_MIB = 1024 * 1024
+MEMORY_BUCKETS_BYTES: Tuple[float, ...] = tuple(
+    float(mib * _MIB) for mib in (64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 3072, 4096)
+)
+MEMORY_DELTA_BUCKETS_BYTES: Tuple[float, ...] = tuple(
+    float(mib * _MIB) for mib in (-256, -64, -16, 0, 1, 4, 16, 64, 256, 1024)
+)
+
+QUEUE_WAIT_BUCKETS_SECONDS: Tuple[float, ...] = (
+    0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0,
+)
+
+
+class _Histogram:
+    """Cumulative bucket histogram (Prometheus-style ``le`` semantics)."""
+
+    def __init__(self, buckets: Iterable[float]) -> None:
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max: float | None = None
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+
+    def as_dict(self) -> Dict[str, object]:
+        buckets = {_format_bound(bound): count for bound, count in zip(self.buckets, self.counts)}
+        buckets["+Inf"] = self.count
+        return {"buckets": buckets, "count": self.count, "sum": self.total, "max": self.max}
+
+
+def _format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else repr(bound)
+
 
 class MetricsRecorder:
     def __init__(self) -> None:
@@ -11,6 +52,9 @@ class MetricsRecorder:
         self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
         self._latency: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
         self._queue_depths: Dict[str, int] = {}
+        self._queue_ages: Dict[str, float] = {}
+        self._histograms: Dict[str, Dict[str, _Histogram]] = defaultdict(dict)
+        self._gauges: Dict[str, float] = {}
 
     def record_attempt(self, kind: str) -> None:
         with self._lock:
@@ -28,6 +72,10 @@ class MetricsRecorder:
         with self._lock:
             self._counters["failure"][kind] += 1
 
+    def increment(self, section: str, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[section][key] += amount
+
     def record_duration(self, kind: str, duration_seconds: float) -> None:
         with self._lock:
             entry = self._latency[kind]
@@ -40,6 +88,35 @@ class MetricsRecorder:
         with self._lock:
             self._queue_depths[queue] = depth
 
+    def record_queue_age(self, queue: str, oldest_age_seconds: float) -> None:
+        with self._lock:
+            self._queue_ages[queue] = oldest_age_seconds
+
+    def record_queue_wait(self, kind: str, wait_seconds: float) -> None:
+        self.observe("queue_wait_seconds", kind, max(0.0, wait_seconds), buckets=QUEUE_WAIT_BUCKETS_SECONDS)
+
+    def observe(self, name: str, kind: str, value: float, *, buckets: Iterable[float]) -> None:
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(kind)
+            if histogram is None:
+                histogram = series[kind] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def record_job_memory(self, kind: str, rss_before: int, rss_after: int, peak: int) -> None:
+        self.observe("job_peak_rss_bytes", kind, float(peak), buckets=MEMORY_BUCKETS_BYTES)
+        self.observe(
+            "job_retained_rss_bytes",
+            kind,
+            float(rss_after - rss_before),
+            buckets=MEMORY_DELTA_BUCKETS_BYTES,
+        )
+        self.set_gauge("rss_bytes", float(rss_after))
+
     def snapshot(self) -> Dict[str, object]:
         with self._lock:
             counters = {section: dict(values) for section, values in self._counters.items()}
@@ -52,13 +129,29 @@ class MetricsRecorder:
                 for kind, data in self._latency.items()
             }
             depths = dict(self._queue_depths)
-        return {"counters": counters, "latency_seconds": latency, "queue_depths": depths}
+            ages = dict(self._queue_ages)
+            histograms = {
+                name: {kind: histogram.as_dict() for kind, histogram in series.items()}
+                for name, series in self._histograms.items()
+            }
+            gauges = dict(self._gauges)
+        return {
+            "counters": counters,
+            "latency_seconds": latency,
+            "queue_depths": depths,
+            "queue_oldest_age_seconds": ages,
+            "histograms": histograms,
+            "gauges": gauges,
+        }
 
     def reset(self) -> None:
         with self._lock:
             self._counters.clear()
             self._latency.clear()
             self._queue_depths.clear()
+            self._queue_ages.clear()
+            self._histograms.clear()
+            self._gauges.clear()
 
 
 metrics = MetricsRecorder()
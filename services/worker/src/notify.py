@@ -2,6 +2,8 @@
 import psycopg
 from email.message import EmailMessage
 
+from src.eventlog import log_event
+
 DB_URL = os.getenv("DATABASE_URL")
 MAIL_HOST = os.getenv("MAIL_HOST", "mailhog")
 MAIL_PORT = int(os.getenv("MAIL_PORT", "1025"))
@@ -40,7 +42,7 @@ def tick():
           if org_id:
             orgs_processed.add(org_id)
         except Exception as e:
-          print("[NOTIFY] send failed:", e)
+          log_event("notify.send_failed", notification_id=nid, error=str(e))
         finally:
           _set_org_context(conn, None)
       # retention purge per org that had activity
@@ -52,9 +54,9 @@ def tick():
           conn.execute("DELETE FROM notifications WHERE created_at < NOW() - INTERVAL '%s days'", (days,))
           conn.commit()
         except Exception as purge_err:
-          print("[NOTIFY] purge failed:", purge_err)
+          log_event("notify.purge_failed", org_id=org_id, error=str(purge_err))
         finally:
           _set_org_context(conn, None)
   except Exception as e:
-    print("[NOTIFY] tick error:", e)
+    log_event("notify.tick_error", error=str(e))
 
@@ -1,7 +1,14 @@
 import os, tempfile, subprocess
+from contextlib import contextmanager
+from typing import Iterator
+
 import boto3
+from botocore.config import Config
 import fitz  # PyMuPDF
 
+from src.breaker import guarded
+from src.deadline import run, timeout, within
+
 def _trim_env(name: str):
     v = os.environ.get(name)
     if v is None:
@@ -17,15 +24,55 @@ S3_ACCESS_KEY_ID = _trim_env("S3_ACCESS_KEY_ID")
 S3_SECRET_ACCESS_KEY = _trim_env("S3_SECRET_ACCESS_KEY")
 
 def _download_from_s3(key: str, path: str):
+    # Per-read socket timeouts from the job deadline (boto3 has no per-call total timeout)
+    limit = timeout("s3", 60)
     s3 = boto3.client(
         "s3",
         endpoint_url=S3_ENDPOINT,
         aws_access_key_id=S3_ACCESS_KEY_ID,
         aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+        config=Config(connect_timeout=min(limit, 10), read_timeout=limit),
     )
-    s3.download_file(S3_BUCKET, key, path)
+    guarded("s3", lambda: within("s3", lambda **_: s3.download_file(S3_BUCKET, key, path)))
 
-def process_pdf(task: dict) -> dict:
+class PdfSource:
+    """An opened (and OCR'd when needed) PDF whose page text is read lazily."""
+
+    def __init__(self, path: str, doc):
+        self.path = path
+        self.doc = doc
+
+    @property
+    def page_count(self) -> int:
+        return len(self.doc)
+
+    def page_text(self, index: int) -> str:
+        if index < 0 or index >= len(self.doc):
+            return ""
+        return self.doc[index].get_text("text") or ""
+
+    def iter_pages(self, limit: int | None = None) -> Iterator[dict]:
+        total = len(self.doc) if limit is None else min(limit, len(self.doc))
+        for i in range(total):
+            yield {"page": i + 1, "text": self.page_text(i)}
+
+
+def _has_text_layer(path: str) -> bool:
+    try:
+        d = fitz.open(path)
+    except Exception:
+        return False
+    try:
+        return any(p.get_text().strip() for p in d)
+    except Exception:
+        return False
+    finally:
+        d.close()
+
+
+@contextmanager
+def open_pdf(task: dict) -> Iterator[PdfSource]:
+    """Download the task's PDF, OCR it if it has no text layer, and keep it open."""
     key = task["s3_key"]
     with tempfile.TemporaryDirectory() as td:
         src = os.path.join(td, "in.pdf")
@@ -33,29 +80,26 @@ def process_pdf(task: dict) -> dict:
         _download_from_s3(key, src)
 
         # If text layer exists, skip OCR
-        try:
-            d = fitz.open(src)
-            has_text = any(p.get_text().strip() for p in d)
-        except Exception:
-            has_text = False
-
         pdf_path = src
-        if not has_text:
+        if not _has_text_layer(src):
             try:
-                subprocess.run(
+                run(
                     ["ocrmypdf", "--skip-text", "--fast-web-view", src, dst],
-                    check=True, capture_output=True
+                    what="ocrmypdf", check=True, capture_output=True
                 )
                 pdf_path = dst
             except subprocess.CalledProcessError:
                 pdf_path = src
 
-        # Quick page-level text for chunking
-        pages = []
         doc = fitz.open(pdf_path)
-        for i, page in enumerate(doc):
-            text = page.get_text("text") or ""
-            pages.append({"page": i + 1, "text": text})
+        try:
+            yield PdfSource(pdf_path, doc)
+        finally:
+            doc.close()
 
-        task["pages"] = pages
-        return task
+
+def process_pdf(task: dict) -> dict:
+    """Materialize every page's text into ``task["pages"]`` (small documents only)."""
+    with open_pdf(task) as pdf:
+        task["pages"] = list(pdf.iter_pages())
+    return task
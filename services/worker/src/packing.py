@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from src.chunking import count_tokens
+from src.eventlog import log_event
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+PROMPT_CANDIDATE_SEGMENTS = int(os.getenv("PROMPT_CANDIDATE_SEGMENTS", "80"))
+PACK_SEGMENT_MAX_TOKENS = int(os.getenv("PACK_SEGMENT_MAX_TOKENS", "300"))
+PACK_DEDUPE_THRESHOLD = float(os.getenv("PACK_DEDUPE_THRESHOLD", "0.8"))
+
+# Excerpt budgets per job kind, sized to what each prompt actually needs.
+DEFAULT_BUDGETS: Dict[str, int] = {
+    "prep_iep_diff": 9000,
+    "extract_iep": 10000,
+    "extract_eob": 24000,
+    "research_summary": 6000,
+    "denial_explain": 4000,
+    "build_advocacy_outline": 6000,
+    "prep_recommendations": 5000,
+    "goal_smart": 2500,
+    "generate_safety_phrase": 2000,
+    "build_one_pager": 4000,
+}
+
+_LABEL_RE = re.compile(r"^(.*?)\d+$")
+_WORD_RE = re.compile(r"\S+\s*")
+_NORMALIZE_RE = re.compile(r"[^a-z0-9]+")
+_SHINGLE_SIZE = 3
+
+Render = Callable[[Dict[str, Any]], str]
+TokenCounter = Callable[[str], int]
+
+
+def parse_budgets(spec: Optional[str]) -> Dict[str, int]:
+    """Parse ``kind=tokens`` or ``model:kind=tokens`` pairs, e.g. ``prep_iep_diff=12000,gpt-5:goal_smart=4000``."""
+    budgets: Dict[str, int] = {}
+    for chunk in (spec or "").split(","):
+        name, sep, value = chunk.partition("=")
+        name = name.strip()
+        if not name or not sep:
+            continue
+        try:
+            budgets[name] = max(0, int(value))
+        except ValueError:
+            continue
+    return budgets
+
+
+PROMPT_TOKEN_BUDGETS = parse_budgets(os.getenv("PROMPT_TOKEN_BUDGETS"))
+
+
+def budget_for(kind: str, model: Optional[str] = None, overrides: Optional[Dict[str, int]] = None) -> int:
+    """Excerpt token budget for ``kind`` on ``model``.
+
+    Lookup order: ``model:kind`` override, ``kind`` override, built-in default
+    for the kind, then ``PROMPT_TOKEN_BUDGET``.
+    """
+    overrides = PROMPT_TOKEN_BUDGETS if overrides is None else overrides
+    if model and f"{model}:{kind}" in overrides:
+        return overrides[f"{model}:{kind}"]
+    if kind in overrides:
+        return overrides[kind]
+    return DEFAULT_BUDGETS.get(kind, PROMPT_TOKEN_BUDGET)
+
+
+def render_excerpt(segment: Dict[str, Any]) -> str:
+    return f"[{segment['label']}] (page {segment['page']}) {segment['text']}"
+
+
+def trim_to_tokens(text: str, max_tokens: int, counter: TokenCounter = count_tokens) -> str:
+    """Longest word-boundary prefix of ``text`` that fits in ``max_tokens``."""
+    text = (text or "").strip()
+    if max_tokens <= 0:
+        return ""
+    if counter(text) <= max_tokens:
+        return text
+    words = _WORD_RE.findall(text)
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if counter("".join(words[:mid])) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return "".join(words[:lo]).rstrip()
+
+
+def _shingles(text: str) -> frozenset:
+    words = _NORMALIZE_RE.sub(" ", text.lower()).split()
+    if len(words) <= _SHINGLE_SIZE:
+        return frozenset([" ".join(words)]) if words else frozenset()
+    return frozenset(
+        hashlib.blake2b(" ".join(words[i : i + _SHINGLE_SIZE]).encode(), digest_size=8).digest()
+        for i in range(len(words) - _SHINGLE_SIZE + 1)
+    )
+
+
+def _similar(a: frozenset, b: frozenset, threshold: float) -> bool:
+    if not a or not b:
+        return a == b
+    smaller, larger = (a, b) if len(a) <= len(b) else (b, a)
+    # Containment rather than Jaccard, so a span repeated inside a longer one also counts as a duplicate
+    return len(smaller & larger) / len(smaller) >= threshold
+
+
+@dataclass
+class PackedSegments:
+    segments: List[Dict[str, Any]]
+    budget: int
+    tokens_used: int = 0
+    dropped: int = 0
+    duplicates: int = 0
+    trimmed: int = 0
+    label_map: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def render(self, render: Render = render_excerpt) -> List[str]:
+        return [render(seg) for seg in self.segments]
+
+
+def pack_segments(
+    segments: Sequence[Dict[str, Any]],
+    budget: int,
+    *,
+    render: Render = render_excerpt,
+    max_segment_tokens: int = PACK_SEGMENT_MAX_TOKENS,
+    dedupe_threshold: float = PACK_DEDUPE_THRESHOLD,
+    counter: TokenCounter = count_tokens,
+) -> PackedSegments:
+    """Greedily fit ranked ``segments`` into ``budget`` tokens of rendered excerpts.
+
+    Segments are taken in the given (rank) order. Each one is trimmed to
+    ``max_segment_tokens``; near-duplicates of an already packed segment are
+    skipped, as is anything that no longer fits (a later, shorter segment may
+    still fit). Kept segments are copied and relabelled consecutively per
+    label prefix, so ``label_map`` matches exactly what the model is shown.
+    """
+    packed = PackedSegments(segments=[], budget=budget)
+    fingerprints: List[frozenset] = []
+    counters: Dict[str, int] = {}
+    for original in segments:
+        text = (original.get("text") or "").strip()
+        if not text:
+            packed.dropped += 1
+            continue
+        fingerprint = _shingles(text)
+        if any(_similar(fingerprint, seen, dedupe_threshold) for seen in fingerprints):
+            packed.duplicates += 1
+            continue
+        trimmed = trim_to_tokens(text, max_segment_tokens, counter) if max_segment_tokens > 0 else text
+        if not trimmed:
+            packed.dropped += 1
+            continue
+
+        match = _LABEL_RE.match(str(original.get("label") or ""))
+        prefix = match.group(1) if match else ""
+        segment = dict(original)
+        segment["text"] = trimmed
+        segment["label"] = f"{prefix}{counters.get(prefix, 0) + 1:03d}"
+        # +1 for the newline joining this excerpt to the prompt
+        cost = counter(render(segment)) + 1
+        if packed.tokens_used + cost > budget:
+            packed.dropped += 1
+            continue
+
+        counters[prefix] = counters.get(prefix, 0) + 1
+        packed.trimmed += trimmed != text
+        packed.tokens_used += cost
+        packed.segments.append(segment)
+        packed.label_map[segment["label"]] = segment
+        fingerprints.append(fingerprint)
+
+    return packed
+
+
+def split_windows(
+    segments: Sequence[Dict[str, Any]],
+    budget: int,
+    *,
+    render: Render = render_excerpt,
+    counter: TokenCounter = count_tokens,
+) -> List[PackedSegments]:
+    """Cut ``segments`` (in document order) into consecutive windows of at most ``budget`` tokens.
+
+    Unlike ``pack_segments`` nothing is dropped, deduplicated or relabelled:
+    every non-empty segment lands in exactly one window, so labels stay
+    unique across the whole document. A segment too large for a window on
+    its own is trimmed to the budget.
+    """
+    windows: List[PackedSegments] = []
+    current = PackedSegments(segments=[], budget=budget)
+    for original in segments:
+        text = (original.get("text") or "").strip()
+        if not text:
+            continue
+        segment = dict(original)
+        cost = counter(render(segment)) + 1
+        if cost > budget:
+            segment["text"] = trim_to_tokens(text, max(1, budget - (cost - counter(text))), counter)
+            cost = counter(render(segment)) + 1
+            current.trimmed += 1
+        if current.segments and current.tokens_used + cost > budget:
+            windows.append(current)
+            current = PackedSegments(segments=[], budget=budget)
+        current.segments.append(segment)
+        current.tokens_used += cost
+        current.label_map[segment["label"]] = segment
+    if current.segments:
+        windows.append(current)
+    return windows
+
+
+def pack_for_job(
+    kind: str,
+    model: Optional[str],
+    groups: Iterable[Sequence[Dict[str, Any]]],
+    *,
+    render: Render = render_excerpt,
+    budget: Optional[int] = None,
+    shares: Optional[Sequence[float]] = None,
+) -> List[PackedSegments]:
+    """Pack one or more ranked segment groups against a single job budget.
+
+    ``shares`` reserves a fraction of the budget for each group (e.g. latest
+    vs previous IEP); whatever a group leaves unused rolls over to the next.
+    Emits a single ``prompt.packed`` event with the totals.
+    """
+    groups = [list(group) for group in groups]
+    total = budget_for(kind, model) if budget is None else budget
+    shares = list(shares or [])
+    remaining = total
+    carry = 0
+    results: List[PackedSegments] = []
+    for index, group in enumerate(groups):
+        if index == len(groups) - 1:
+            allowance = remaining
+        elif index < len(shares):
+            allowance = min(remaining, int(total * shares[index]) + carry)
+        else:
+            allowance = remaining // (len(groups) - index)
+        result = pack_segments(group, max(0, allowance), render=render)
+        carry = allowance - result.tokens_used
+        remaining -= result.tokens_used
+        results.append(result)
+
+    log_event(
+        "prompt.packed",
+        kind=kind,
+        model=model,
+        budget=total,
+        tokens_used=sum(r.tokens_used for r in results),
+        segments=sum(len(r.segments) for r in results),
+        dropped=sum(r.dropped for r in results),
+        duplicates=sum(r.duplicates for r in results),
+        trimmed=sum(r.trimmed for r in results),
+    )
+    return results
+
+
+__all__ = [
+    "DEFAULT_BUDGETS",
+    "PROMPT_CANDIDATE_SEGMENTS",
+    "PackedSegments",
+    "budget_for",
+    "pack_for_job",
+    "pack_segments",
+    "parse_budgets",
+    "render_excerpt",
+    "split_windows",
+    "trim_to_tokens",
+]
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from types import FrameType
+from typing import Dict, Iterable, List, Optional
+
+MAX_PROFILE_SECONDS = 60.0
+DEFAULT_SAMPLE_INTERVAL = 0.01
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a sampling session is already running in this process."""
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or code.co_filename
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    labels: List[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _thread_names() -> Dict[int, str]:
+    return {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+
+
+def sample_stacks(
+    seconds: float,
+    *,
+    interval: float = DEFAULT_SAMPLE_INTERVAL,
+    include_idle: bool = False,
+) -> str:
+    """Sample every thread's stack for ``seconds`` and return collapsed stacks.
+
+    The output uses the ``frame;frame;frame count`` format understood by
+    flamegraph.pl and speedscope. Stacks are prefixed with the thread name so
+    the job loop can be told apart from the health server threads.
+    """
+    duration = max(0.0, min(float(seconds), MAX_PROFILE_SECONDS))
+    interval = max(0.001, float(interval))
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("profile_in_progress")
+    try:
+        own_ident = threading.get_ident()
+        counts: Counter[str] = Counter()
+        deadline = time.monotonic() + duration
+        while True:
+            names = _thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = _collapse(frame)
+                if not include_idle and _is_idle(stack):
+                    continue
+                counts[f"{names.get(ident, ident)};{stack}"] += 1
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+    return render_collapsed(counts.items())
+
+
+def _is_idle(stack: str) -> bool:
+    leaf = stack.rsplit(";", 1)[-1]
+    return any(marker in leaf for marker in (":wait:", ":select:", ":_wait_for_tstate_lock:", ":accept:", ":poll:"))
+
+
+def render_collapsed(entries: Iterable[tuple[str, int]]) -> str:
+    lines = [f"{stack} {count}" for stack, count in sorted(entries, key=lambda item: -item[1])]
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+def dump_thread_stacks() -> str:
+    """Return a plain-text dump of every live thread's current stack."""
+    names = _thread_names()
+    parts: List[str] = []
+    for ident, frame in sys._current_frames().items():
+        parts.append(f'Thread "{names.get(ident, "unknown")}" (ident={ident}):')
+        parts.extend(line.rstrip("\n") for line in traceback.format_stack(frame))
+        parts.append("")
+    return "\n".join(parts)
+
+
+__all__ = [
+    "MAX_PROFILE_SECONDS",
+    "ProfilerBusy",
+    "dump_thread_stacks",
+    "render_collapsed",
+    "sample_stacks",
+]
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+def _lines(parts: Iterable[Optional[str]]) -> List[str]:
+    return [part for part in parts if part is not None]
+
+
+def build_messages(
+    system: str,
+    *,
+    instructions: Sequence[Optional[str]] = (),
+    documents: Sequence[Optional[str]] = (),
+    request: Sequence[Optional[str]] = (),
+    joiner: str = "\n",
+) -> List[Dict[str, str]]:
+    """System + user messages laid out from most to least stable content.
+
+    The provider caches the longest prompt prefix it has seen recently (the
+    schema travels with the request and is fixed per kind), so the user
+    message starts with the kind's static ``instructions``, then the
+    per-document ``documents`` (excerpts, extracted data), and ends with the
+    per-request ``request`` details (child, audience, tag, window number).
+    Anything that changes between two jobs of the same kind therefore sits
+    after everything they share. ``None`` entries are dropped.
+    """
+    sections = [_lines(instructions), _lines(documents), _lines(request)]
+    content = joiner.join(line for section in sections for line in section)
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": content},
+    ]
+
+
+def _field(obj: Any, name: str) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def prompt_token_usage(usage: Any) -> Tuple[Optional[int], int]:
+    """``(prompt_tokens, cached_prompt_tokens)`` from a Responses or Chat Completions ``usage``."""
+    if usage is None:
+        return None, 0
+    prompt = _field(usage, "input_tokens")
+    if prompt is None:
+        prompt = _field(usage, "prompt_tokens")
+    details = _field(usage, "input_tokens_details") or _field(usage, "prompt_tokens_details")
+    cached = _field(details, "cached_tokens") if details is not None else None
+    prompt = int(prompt) if isinstance(prompt, (int, float)) else None
+    return prompt, int(cached) if isinstance(cached, (int, float)) else 0
+
+
+__all__ = ["build_messages", "prompt_token_usage"]
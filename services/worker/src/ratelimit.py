@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from src.chunking import count_tokens
+from src.eventlog import log_event
+from src.jobs.registry import JobDeferred
+from src.metrics import metrics
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") not in ("0", "false", "False")
+OPENAI_DEFAULT_RPM = int(os.getenv("OPENAI_DEFAULT_RPM", "3000"))
+OPENAI_DEFAULT_TPM = int(os.getenv("OPENAI_DEFAULT_TPM", "1000000"))
+# Aim slightly under the provider's published limits so bursts don't end in 429s
+RATE_LIMIT_HEADROOM = float(os.getenv("RATE_LIMIT_HEADROOM", "0.9"))
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "20"))
+RATE_LIMIT_PREFIX = os.getenv("RATE_LIMIT_PREFIX", "ratelimit")
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "1500"))
+
+# Both buckets refill continuously at limit/60 per second, hold at most one
+# minute of budget, and are debited together or not at all. Time comes from
+# the Redis server so replicas with skewed clocks share one view.
+_TAKE_LUA = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local wait = 0
+local levels = {}
+for i = 1, 2 do
+  local capacity = tonumber(ARGV[i * 2 - 1])
+  local cost = tonumber(ARGV[i * 2])
+  local rate = capacity / 60
+  local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local level = tonumber(state[1]) or capacity
+  local ts = tonumber(state[2]) or now
+  level = math.min(capacity, level + math.max(0, now - ts) * rate)
+  levels[i] = level
+  if cost > level then
+    wait = math.max(wait, (cost - level) / rate)
+  end
+end
+if wait > 0 then
+  return {0, tostring(wait)}
+end
+for i = 1, 2 do
+  redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - tonumber(ARGV[i * 2])), 'ts', tostring(now))
+  redis.call('EXPIRE', KEYS[i], 120)
+end
+return {1, '0'}
+"""
+
+# Credit back (or charge) the difference between the estimate and the
+# tokens the API actually reported. The level may go negative: that debt
+# simply delays the next caller.
+_RECONCILE_LUA = """
+local capacity = tonumber(ARGV[1])
+local delta = tonumber(ARGV[2])
+local level = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if not level then
+  return 0
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(capacity, level + delta)))
+return 1
+"""
+
+
+class RateLimited(JobDeferred):
+    """Over the shared budget for longer than callers are willing to block."""
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, Tuple[int, int]]:
+    """Parse ``model=rpm:tpm`` pairs, e.g. ``gpt-5-mini=5000:4000000,text-embedding-3-small=3000:1000000``."""
+    limits: Dict[str, Tuple[int, int]] = {}
+    for chunk in (spec or "").split(","):
+        name, sep, value = chunk.partition("=")
+        rpm, colon, tpm = value.partition(":")
+        name = name.strip()
+        if not name or not sep or not colon:
+            continue
+        try:
+            limits[name] = (int(rpm), int(tpm))
+        except ValueError:
+            continue
+    return limits
+
+
+OPENAI_RATE_LIMITS = parse_limits(os.getenv("OPENAI_RATE_LIMITS"))
+
+
+def is_rate_limited(err: Exception) -> bool:
+    if isinstance(err, RateLimited):
+        return True
+    status = getattr(err, "status_code", None) or getattr(getattr(err, "response", None), "status_code", None)
+    return status == 429 or type(err).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(err: Exception, default: float = 10.0) -> float:
+    headers = getattr(getattr(err, "response", None), "headers", None) or {}
+    try:
+        return max(1.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return default
+
+
+def estimate_tokens(messages: Any, expected_output: int = LLM_OUTPUT_TOKEN_ESTIMATE) -> int:
+    """Prompt tokens of ``input`` messages (or texts) plus the expected completion."""
+    if isinstance(messages, str):
+        return count_tokens(messages) + expected_output
+    total = expected_output
+    for message in messages or []:
+        if isinstance(message, dict):
+            content = message.get("content")
+            total += 4 + count_tokens(content if isinstance(content, str) else str(content or ""))
+        else:
+            total += count_tokens(str(message))
+    return total
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    total = getattr(usage, "total_tokens", None)
+    if total is None:
+        parts = [getattr(usage, name, None) for name in ("input_tokens", "output_tokens", "prompt_tokens")]
+        parts = [p for p in parts if isinstance(p, (int, float))]
+        total = sum(parts) if parts else None
+    return int(total) if isinstance(total, (int, float)) else None
+
+
+@dataclass
+class Reservation:
+    limiter: "RateLimiter"
+    model: str
+    estimate: int
+    waited: float = 0.0
+
+    def reconcile(self, actual: Optional[int]) -> None:
+        if actual is None or actual == self.estimate:
+            return
+        self.limiter.reconcile(self.model, self.estimate, actual)
+
+
+class LocalBuckets:
+    """In-process version of the Lua scripts (single replica, tests, or no Redis)."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self._state: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, keys: Tuple[str, str], costs: Iterable[Tuple[int, int]]) -> float:
+        now = self.clock()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, (capacity, cost) in zip(keys, costs):
+                level, ts = self._state.get(key, (float(capacity), now))
+                level = min(capacity, level + max(0.0, now - ts) * capacity / 60.0)
+                levels.append((key, level, cost))
+                if cost > level:
+                    wait = max(wait, (cost - level) / (capacity / 60.0))
+            if wait > 0:
+                return wait
+            for key, level, cost in levels:
+                self._state[key] = (level - cost, now)
+            return 0.0
+
+    def level(self, key: str, capacity: int) -> float:
+        now = self.clock()
+        with self._lock:
+            level, ts = self._state.get(key, (float(capacity), now))
+        return min(capacity, level + max(0.0, now - ts) * capacity / 60.0)
+
+    def credit(self, key: str, capacity: int, delta: int) -> None:
+        with self._lock:
+            if key in self._state:
+                level, ts = self._state[key]
+                self._state[key] = (min(capacity, level + delta), ts)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget per model, shared through Redis.
+
+    ``acquire`` debits one request and the estimated tokens, sleeping while
+    the budget refills. If that would take longer than ``max_wait_seconds``
+    it raises ``RateLimited`` so the runner can park the job in the retry
+    set instead of holding a worker. If Redis is unreachable the call is
+    let through: the API's own 429s are still handled by the caller.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        *,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        default: Tuple[int, int] = (OPENAI_DEFAULT_RPM, OPENAI_DEFAULT_TPM),
+        headroom: float = RATE_LIMIT_HEADROOM,
+        max_wait_seconds: float = RATE_LIMIT_MAX_WAIT_SECONDS,
+        prefix: str = RATE_LIMIT_PREFIX,
+        sleep: Callable[[float], None] = time.sleep,
+        local: Optional[LocalBuckets] = None,
+    ) -> None:
+        self.limits = OPENAI_RATE_LIMITS if limits is None else limits
+        self.default = default
+        self.headroom = headroom
+        self.max_wait_seconds = max_wait_seconds
+        self.prefix = prefix
+        self.sleep = sleep
+        self.redis = redis_client
+        self.local = local or (LocalBuckets() if redis_client is None else None)
+        if redis_client is not None:
+            self._take = redis_client.register_script(_TAKE_LUA)
+            self._reconcile = redis_client.register_script(_RECONCILE_LUA)
+
+    def capacity(self, model: str) -> Tuple[int, int]:
+        rpm, tpm = self.limits.get(model, self.default)
+        return max(1, int(rpm * self.headroom)), max(1, int(tpm * self.headroom))
+
+    def _keys(self, model: str) -> Tuple[str, str]:
+        # Hash tag keeps both buckets of a model in one cluster slot
+        return f"{self.prefix}:{{{model}}}:req", f"{self.prefix}:{{{model}}}:tok"
+
+    def _try(self, model: str, tokens: int) -> float:
+        rpm, tpm = self.capacity(model)
+        keys = self._keys(model)
+        if self.local is not None:
+            return self.local.take(keys, [(rpm, 1), (tpm, tokens)])
+        allowed, wait = self._take(keys=list(keys), args=[rpm, 1, tpm, tokens])
+        return 0.0 if int(allowed) else float(wait)
+
+    def acquire(self, model: str, tokens: int) -> Reservation:
+        _, tpm = self.capacity(model)
+        # A single request can never need more than a full bucket
+        tokens = max(1, min(int(tokens), tpm))
+        waited = 0.0
+        while True:
+            try:
+                wait = self._try(model, tokens)
+            except Exception as err:
+                metrics.increment("rate_limit", "error")
+                log_event("ratelimit.unavailable", model=model, error=str(err))
+                return Reservation(self, model, tokens, waited)
+            if wait <= 0:
+                if waited:
+                    metrics.observe("rate_limit_wait_seconds", model, waited, buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 60))
+                return Reservation(self, model, tokens, waited)
+            if waited + wait > self.max_wait_seconds:
+                metrics.increment("rate_limit", "deferred")
+                log_event("ratelimit.deferred", model=model, tokens=tokens, wait_seconds=round(wait, 3))
+                raise RateLimited(f"rate limit budget exhausted for {model}", delay_seconds=wait)
+            # Small jitter so replicas woken together don't race for the same refill
+            pause = wait + random.uniform(0, min(0.25, wait))
+            metrics.increment("rate_limit", "waited")
+            self.sleep(pause)
+            waited += pause
+
+    def remaining(self, model: str) -> float:
+        """Share (0..1) of the model's token bucket currently available, for routing decisions.
+
+        Read-only: nothing is debited. Unknown state reads as a full bucket.
+        """
+        _, tpm = self.capacity(model)
+        key = self._keys(model)[1]
+        if self.local is not None:
+            level = self.local.level(key, tpm)
+        else:
+            tokens, ts = self.redis.hmget(key, "tokens", "ts")
+            if tokens is None:
+                return 1.0
+            seconds, micros = self.redis.time()
+            elapsed = max(0.0, seconds + micros / 1_000_000 - float(ts or 0))
+            level = min(tpm, float(tokens) + elapsed * tpm / 60.0)
+        return max(0.0, min(1.0, level / tpm))
+
+    def reconcile(self, model: str, estimate: int, actual: int) -> None:
+        _, tpm = self.capacity(model)
+        key = self._keys(model)[1]
+        try:
+            if self.local is not None:
+                self.local.credit(key, tpm, estimate - actual)
+            else:
+                self._reconcile(keys=[key], args=[tpm, estimate - actual])
+        except Exception as err:
+            log_event("ratelimit.reconcile_failed", model=model, error=str(err))
+
+    def call(self, model: str, estimate: int, fn: Callable[[], Any], usage: Callable[[Any], Optional[int]] = usage_tokens):
+        """Run ``fn`` under the budget and settle the estimate with the reported usage.
+
+        A 429 from the API is turned into ``RateLimited`` (honouring
+        ``retry-after``) so the job is deferred rather than retried hot.
+        """
+        reservation = self.acquire(model, estimate)
+        try:
+            result = fn()
+        except Exception as err:
+            if is_rate_limited(err) and not isinstance(err, RateLimited):
+                metrics.increment("rate_limit", "upstream_429")
+                raise RateLimited(f"upstream rate limit for {model}: {err}", delay_seconds=retry_after_seconds(err)) from err
+            raise
+        reservation.reconcile(usage(result))
+        return result
+
+
+class _Unlimited:
+    def remaining(self, model):
+        return 1.0
+
+    def call(self, model, estimate, fn, usage=usage_tokens):
+        return fn()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Process-wide limiter on the worker's Redis (a no-op when RATE_LIMIT_ENABLED=0)."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            if not RATE_LIMIT_ENABLED:
+                _limiter = _Unlimited()
+            else:
+                import redis
+
+                client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+                _limiter = RateLimiter(client)
+    return _limiter
+
+
+__all__ = [
+    "LocalBuckets",
+    "RateLimited",
+    "RateLimiter",
+    "estimate_tokens",
+    "get_limiter",
+    "is_rate_limited",
+    "parse_limits",
+    "usage_tokens",
+]
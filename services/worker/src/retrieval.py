@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.eventlog import log_event
+from src.segments import RankProfile, label_segments, match_query, score_expression, select_ranked_segments
+from src.vectors import storage_column, vector_literal
+
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "50"))
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "256"))
+
+
+@dataclass(frozen=True)
+class QueryProfile:
+    """What a job is looking for: a natural-language query for the vector side
+    and a weighted keyword profile for the ``tsv`` side."""
+
+    name: str
+    query: str
+    keywords: RankProfile
+
+
+class QueryEmbeddingCache:
+    """LRU of query vectors keyed by (provider, query text).
+
+    Job profiles are mostly fixed strings, so after the first job of a kind
+    the query embedding costs nothing. A vector from another model (a
+    ``FallbackEmbeddings`` batch served by its fallback) is not comparable
+    with the provider's spans: it is rejected and never cached.
+    """
+
+    def __init__(self, capacity: int = QUERY_EMBED_CACHE_SIZE) -> None:
+        self.capacity = max(1, capacity)
+        self._items: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, provider, query: str) -> List[float]:
+        key = (provider.name, query)
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return vector
+            self.misses += 1
+        embedded = provider.embed([query])
+        model = getattr(embedded, "model", provider.name)
+        if model != provider.name:
+            raise ValueError(f"query embedded with {model} instead of {provider.name}")
+        vector = embedded.vectors[0]
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+        return vector
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+
+query_cache = QueryEmbeddingCache()
+
+
+def _hybrid_sql(profile: RankProfile) -> Tuple[str, Callable[..., list]]:
+    column, cast = storage_column()
+    score, score_params = score_expression(profile)
+    sql = (
+        "WITH vec AS ("
+        f" SELECT id, row_number() OVER (ORDER BY {column} <=> %s::{cast}) AS rank FROM ("
+        f"  SELECT id, {column} FROM doc_spans"
+        f"  WHERE document_id=%s AND {column} IS NOT NULL AND char_length(btrim(text)) >= %s"
+        f"  ORDER BY {column} <=> %s::{cast} LIMIT %s"
+        " ) v"
+        "), lex AS ("
+        " SELECT id, row_number() OVER (ORDER BY score DESC, page ASC, id ASC) AS rank FROM ("
+        f"  SELECT id, page, ({score}) AS score FROM doc_spans"
+        "  WHERE document_id=%s AND char_length(btrim(text)) >= %s AND tsv @@ to_tsquery('english', %s)"
+        "  ORDER BY score DESC, page ASC, id ASC LIMIT %s"
+        " ) l"
+        "), fused AS ("
+        " SELECT id, SUM(1.0 / (%s + rank)) AS rrf FROM (SELECT id, rank FROM vec UNION ALL SELECT id, rank FROM lex) u"
+        " GROUP BY id"
+        ")"
+        " SELECT s.id, s.page, s.text, f.rrf FROM fused f JOIN doc_spans s ON s.id = f.id"
+        " ORDER BY f.rrf DESC, s.page ASC, s.id ASC LIMIT %s"
+    )
+
+    def params(vector: str, document_id: str, candidates: int, rrf_k: int, limit: int) -> list:
+        return [
+            vector,
+            document_id,
+            profile.min_chars,
+            vector,
+            candidates,
+            *score_params,
+            document_id,
+            profile.min_chars,
+            match_query(profile),
+            candidates,
+            rrf_k,
+            limit,
+        ]
+
+    return sql, params
+
+
+def hybrid_segments(
+    conn,
+    document_id: str,
+    profile: QueryProfile,
+    *,
+    prefix: str,
+    doc_name: str,
+    which: str,
+    limit: int,
+    provider=None,
+    candidates: int = RETRIEVAL_CANDIDATES,
+    rrf_k: int = RETRIEVAL_RRF_K,
+    include_score: bool = False,
+    fallback_scorer: Optional[Callable[[str], float]] = None,
+    cache: Optional[QueryEmbeddingCache] = None,
+) -> List[Dict[str, Any]]:
+    """Top-``limit`` segments by reciprocal rank fusion of ANN and keyword search.
+
+    Both candidate lists and the fusion are computed in a single SQL round
+    trip. If the query cannot be embedded or the hybrid query fails, falls
+    back to keyword-only ranking (``select_ranked_segments``).
+    """
+    vector: Optional[List[float]] = None
+    if provider is not None:
+        try:
+            vector = (cache or query_cache).get(provider, profile.query)
+        except Exception as err:
+            log_event("retrieval.query_embed_failed", profile=profile.name, error=str(err))
+
+    if vector is not None:
+        sql, build_params = _hybrid_sql(profile.keywords)
+        params = build_params(vector_literal(vector), document_id, max(limit, candidates), rrf_k, limit)
+        try:
+            with conn.transaction():
+                rows = conn.execute(sql, params).fetchall()
+            ranked = [(span_id, page, text, float(rrf)) for span_id, page, text, rrf in rows]
+            if ranked:
+                return label_segments(
+                    ranked,
+                    document_id,
+                    prefix=prefix,
+                    doc_name=doc_name,
+                    which=which,
+                    limit=limit,
+                    include_score=include_score,
+                )
+        except Exception as err:
+            log_event("retrieval.hybrid_failed", profile=profile.name, document_id=document_id, error=str(err))
+
+    return select_ranked_segments(
+        conn,
+        document_id,
+        profile.keywords,
+        prefix=prefix,
+        doc_name=doc_name,
+        which=which,
+        limit=limit,
+        fallback_scorer=fallback_scorer,
+        include_score=include_score,
+    )
+
+
+__all__ = ["QueryEmbeddingCache", "QueryProfile", "hybrid_segments", "query_cache"]
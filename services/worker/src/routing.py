@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from src.eventlog import log_event
+from src.metrics import metrics
+
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "1") not in ("0", "false", "False")
+# A route's target model must have at least this share of its token bucket left
+ROUTING_MIN_HEADROOM = float(os.getenv("ROUTING_MIN_HEADROOM", "0.1"))
+ROUTING_TIER_TTL_SECONDS = float(os.getenv("ROUTING_TIER_TTL_SECONDS", "300"))
+OPENAI_MODEL_MINI = os.getenv("OPENAI_MODEL_MINI", "gpt-5-mini")
+OPENAI_MODEL_NANO = os.getenv("OPENAI_MODEL_NANO", "gpt-5-nano")
+
+# Short, well-bounded tasks where the small model's answers hold up; every
+# other request keeps the model its call site asked for.
+DEFAULT_ROUTES: List[Dict[str, Any]] = [
+    {
+        "name": "small-input",
+        "kinds": ["goal_smart", "generate_safety_phrase", "denial_explain"],
+        "from_models": [OPENAI_MODEL_MINI],
+        "max_prompt_tokens": 1500,
+        "model": OPENAI_MODEL_NANO,
+    },
+]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """One row of the routing table; unset fields match anything.
+
+    ``max_headroom`` makes a spill-over rule: it only applies while the
+    requested model has less than that share of its token budget left.
+    """
+
+    name: str
+    model: str
+    kinds: FrozenSet[str] = frozenset({"*"})
+    tiers: FrozenSet[str] = frozenset()
+    from_models: FrozenSet[str] = frozenset()
+    min_prompt_tokens: int = 0
+    max_prompt_tokens: Optional[int] = None
+    min_headroom: float = ROUTING_MIN_HEADROOM
+    max_headroom: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "Rule":
+        def names(value: Any) -> FrozenSet[str]:
+            if value is None:
+                return frozenset()
+            if isinstance(value, str):
+                value = value.split(",")
+            return frozenset(str(item).strip() for item in value if str(item).strip())
+
+        max_tokens = spec.get("max_prompt_tokens")
+        max_headroom = spec.get("max_headroom")
+        return cls(
+            name=str(spec.get("name") or spec["model"]),
+            model=str(spec["model"]),
+            kinds=names(spec.get("kinds")) or frozenset({"*"}),
+            tiers=names(spec.get("tiers")),
+            from_models=names(spec.get("from_models")),
+            min_prompt_tokens=int(spec.get("min_prompt_tokens") or 0),
+            max_prompt_tokens=None if max_tokens is None else int(max_tokens),
+            min_headroom=float(spec.get("min_headroom", ROUTING_MIN_HEADROOM)),
+            max_headroom=None if max_headroom is None else float(max_headroom),
+        )
+
+    def matches(self, kind: str, model: str, prompt_tokens: int, tier: Optional[str]) -> bool:
+        if "*" not in self.kinds and kind not in self.kinds:
+            return False
+        if self.tiers and (tier or "") not in self.tiers:
+            return False
+        if self.from_models and model not in self.from_models:
+            return False
+        if prompt_tokens < self.min_prompt_tokens:
+            return False
+        return self.max_prompt_tokens is None or prompt_tokens <= self.max_prompt_tokens
+
+
+def parse_routes(spec: Optional[str]) -> List[Rule]:
+    """Routing table from ``MODEL_ROUTES`` (a JSON list of rules); the built-in table if unset or invalid."""
+    if not spec:
+        return [Rule.from_dict(rule) for rule in DEFAULT_ROUTES]
+    try:
+        return [Rule.from_dict(rule) for rule in json.loads(spec)]
+    except (ValueError, TypeError, KeyError) as err:
+        log_event("routing.invalid_table", error=str(err))
+        return [Rule.from_dict(rule) for rule in DEFAULT_ROUTES]
+
+
+MODEL_ROUTES = parse_routes(os.getenv("MODEL_ROUTES"))
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    model: str
+    requested: str
+
+
+def _headroom(limiter, model: str, seen: Dict[str, float]) -> float:
+    if model not in seen:
+        try:
+            seen[model] = float(limiter.remaining(model)) if limiter is not None else 1.0
+        except Exception as err:
+            log_event("routing.headroom_unavailable", model=model, error=str(err))
+            seen[model] = 1.0
+    return seen[model]
+
+
+def choose_model(
+    kind: str,
+    model: str,
+    prompt_tokens: int,
+    *,
+    tier: Optional[str] = None,
+    limiter=None,
+    routes: Optional[List[Rule]] = None,
+) -> Route:
+    """First rule matching the request whose target model has budget left, else the requested model.
+
+    Headroom is read from the shared rate limiter only for rules that need
+    it, and at most once per model per call.
+    """
+    if not ROUTING_ENABLED:
+        return Route("default", model, model)
+    seen: Dict[str, float] = {}
+    for rule in MODEL_ROUTES if routes is None else routes:
+        if not rule.matches(kind, model, prompt_tokens, tier):
+            continue
+        if rule.max_headroom is not None and _headroom(limiter, model, seen) >= rule.max_headroom:
+            continue
+        if rule.model != model and _headroom(limiter, rule.model, seen) < rule.min_headroom:
+            metrics.increment("llm_route", f"{rule.name}:no_headroom")
+            continue
+        return Route(rule.name, rule.model, model)
+    return Route("default", model, model)
+
+
+_tiers: Dict[str, Tuple[Optional[str], float]] = {}
+_tiers_lock = threading.Lock()
+
+
+def org_tier(conn, org_id: Optional[str], *, clock=time.monotonic) -> Optional[str]:
+    """The org's entitlement plan (``free``, ``pro``, ...), cached for ``ROUTING_TIER_TTL_SECONDS``.
+
+    Lookup failures return None (tier-specific rules then simply don't match);
+    the query runs in a savepoint so a failure can't abort the caller's transaction.
+    """
+    if not org_id:
+        return None
+    now = clock()
+    with _tiers_lock:
+        cached = _tiers.get(org_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    tier = None
+    try:
+        with conn.transaction():
+            row = conn.execute("SELECT plan FROM entitlements WHERE org_id=%s", (org_id,)).fetchone()
+        tier = (row[0] if row else None) or None
+    except Exception as err:
+        log_event("routing.tier_lookup_failed", org_id=org_id, error=str(err))
+    with _tiers_lock:
+        _tiers[org_id] = (tier, now + ROUTING_TIER_TTL_SECONDS)
+    return tier
+
+
+__all__ = [
+    "MODEL_ROUTES",
+    "Route",
+    "Rule",
+    "choose_model",
+    "org_tier",
+    "parse_routes",
+]
@@ -1,14 +1,66 @@
 from __future__ import annotations
 
+import datetime
 import hashlib
 import json
+import threading
 import time
-from typing import Any, Callable, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from src.jobs.registry import JobFailed
+from src.deadline import DeadlineExceeded, job_deadline
+from src.jobs.registry import JobDeferred, JobFailed, JobParked
+from src.memory import JobMemoryWatch
 from src.metrics import metrics
 from src.state import WorkerState
 
+ENQUEUED_AT_FIELD = "enqueued_at"
+DEFERRALS_FIELD = "deferrals"
+
+
+def stamp_enqueued_at(task: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+    """Record when a payload entered the queue (epoch milliseconds) unless already set."""
+    if not task.get(ENQUEUED_AT_FIELD):
+        task[ENQUEUED_AT_FIELD] = int((time.time() if now is None else now) * 1000)
+    return task
+
+
+def _epoch_seconds(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        # Accept epoch milliseconds (producers) as well as seconds
+        return float(value) / 1000.0 if value > 1e11 else float(value)
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+def payload_timestamp(payload: Optional[str], *fields: str) -> Optional[float]:
+    if not payload:
+        return None
+    try:
+        task = json.loads(payload)
+    except Exception:
+        return None
+    if not isinstance(task, dict):
+        return None
+    for field in fields or (ENQUEUED_AT_FIELD,):
+        ts = _epoch_seconds(task.get(field))
+        if ts is not None:
+            return ts
+    return None
+
+
+def queue_wait_seconds(task: Dict[str, Any], claimed_at: float) -> Optional[float]:
+    enqueued_at = _epoch_seconds(task.get(ENQUEUED_AT_FIELD))
+    if enqueued_at is None:
+        return None
+    return max(0.0, claimed_at - enqueued_at)
+
 
 class JobRunner:
     """Supervises queue consumption, dispatch, and heartbeat recording."""
@@ -22,13 +74,18 @@ class JobRunner:
         dead_letter_queue: str = "jobs:dead",
         processing_queue: Optional[str] = None,
         visibility_timeout_seconds: float = 300.0,
+        retry_set: Optional[str] = None,
+        max_deferrals: int = 20,
         max_retries: int = 3,
         backoff_seconds: float = 2.0,
         max_delay_seconds: float = 30.0,
         queue_poll_timeout: int = 5,
         queue_log_interval: float = 60.0,
         failure_sleep_seconds: float = 1.0,
+        track_memory: bool = True,
         dispatch_fn: Callable[..., None],
+        gate_fn: Optional[Callable[[str], None]] = None,
+        deadline_fn: Optional[Callable[[str], Optional[float]]] = None,
         patch_job_fn: Callable[[Optional[str], str, str, Optional[str], Optional[str]], None],
         notify_fn: Optional[Callable[[], None]],
         log_fn: Callable[..., None],
@@ -40,6 +97,9 @@ class JobRunner:
         self.processing_claims_key = f"{self.processing_queue}:claims"
         self.processing_visibility_key = f"{self.processing_queue}:visibility"
         self.dead_letter_queue = dead_letter_queue
+        self.retry_set = retry_set or f"{queue_name}:retry"
+        self.max_deferrals = max(1, max_deferrals)
+        self._last_retry_promotion = 0.0
         self.max_retries = max(1, max_retries)
         self.backoff_seconds = backoff_seconds
         self.max_delay_seconds = max_delay_seconds
@@ -47,10 +107,16 @@ class JobRunner:
         self.queue_log_interval = max(5.0, queue_log_interval)
         self.failure_sleep_seconds = max(0.5, failure_sleep_seconds)
         self.dispatch_fn = dispatch_fn
+        self.gate_fn = gate_fn
+        self.deadline_fn = deadline_fn
         self.patch_job_fn = patch_job_fn
         self.notify_fn = notify_fn
         self.log_fn = log_fn
+        self.track_memory = track_memory
         self._last_queue_log = 0.0
+        self._queue_sample_lock = threading.Lock()
+        self._sampler_stop = threading.Event()
+        self._sampler_thread: Optional[threading.Thread] = None
         self.visibility_timeout = max(0.0, float(visibility_timeout_seconds or 0))
         if self.visibility_timeout:
             self._requeue_scan_interval = max(5.0, min(self.queue_log_interval, self.visibility_timeout / 2))
@@ -61,6 +127,7 @@ class JobRunner:
     # ------------------------------------------------------------------ loop -
 
     def run_forever(self) -> None:
+        self.start_queue_sampler()
         while True:
             try:
                 self._tick()
@@ -70,6 +137,7 @@ class JobRunner:
                 time.sleep(self.failure_sleep_seconds)
 
     def _tick(self) -> None:
+        self._promote_due_retries(time.time())
         try:
             claimed = self._claim_next_job()
         except Exception:
@@ -81,6 +149,7 @@ class JobRunner:
             return
 
         claim_token, payload = claimed
+        claimed_at = time.time()
 
         try:
             task = json.loads(payload)
@@ -94,23 +163,55 @@ class JobRunner:
         job_id = task.get("job_id")
         org_id = task.get("org_id")
 
+        if self.gate_fn:
+            # e.g. a circuit breaker: park jobs whose upstream is down instead of attempting them
+            try:
+                self.gate_fn(kind)
+            except JobDeferred as deferred:
+                self._defer(task, deferred, kind, job_id, org_id)
+                self._ack_job(claim_token, payload)
+                return
+
+        wait_seconds = queue_wait_seconds(task, claimed_at)
+        if wait_seconds is not None:
+            metrics.record_queue_wait(kind or "unknown", wait_seconds)
+
         self.state.mark_job_start(job_id, kind)
-        self.log_fn("job.start", kind=kind, job_id=job_id, org_id=org_id)
+        self.log_fn("job.start", kind=kind, job_id=job_id, org_id=org_id, queue_wait_seconds=wait_seconds)
 
+        memory_watch = JobMemoryWatch().start() if self.track_memory else None
         start = time.perf_counter()
         try:
-            self.dispatch_fn(
-                task,
-                max_attempts=self.max_retries,
-                backoff_seconds=self.backoff_seconds,
-                max_delay_seconds=self.max_delay_seconds,
-                sleep_fn=time.sleep,
-                log_fn=self.log_fn,
-                metrics=metrics,
-            )
+            with job_deadline(self.deadline_fn(kind) if self.deadline_fn else None):
+                self.dispatch_fn(
+                    task,
+                    max_attempts=self.max_retries,
+                    backoff_seconds=self.backoff_seconds,
+                    max_delay_seconds=self.max_delay_seconds,
+                    sleep_fn=time.sleep,
+                    log_fn=self.log_fn,
+                    metrics=metrics,
+                )
+        except JobParked as parked:
+            self._record_duration(kind, start)
+            self.state.mark_job_deferred()
+            metrics.increment("parked", kind or "unknown")
+            self.log_fn("job.parked", kind=kind, job_id=job_id, reason=parked.reason)
+        except JobDeferred as deferred:
+            self._record_duration(kind, start)
+            self._defer(task, deferred, kind, job_id, org_id)
         except JobFailed as jf:
             self._record_duration(kind, start)
             self.state.mark_job_failure(str(jf.error))
+            if isinstance(jf.error, DeadlineExceeded):
+                metrics.increment("deadline_exceeded", kind or "unknown")
+                self.log_fn(
+                    "job.deadline_exceeded",
+                    kind=kind,
+                    job_id=job_id,
+                    what=jf.error.what,
+                    duration_ms=int((time.perf_counter() - start) * 1000),
+                )
             self.log_fn(
                 "job.failed",
                 kind=jf.kind,
@@ -130,6 +231,8 @@ class JobRunner:
             self.log_fn("job.success", kind=kind, job_id=job_id, org_id=org_id)
         finally:
             self._ack_job(claim_token, payload)
+            if memory_watch:
+                self._record_memory(kind, job_id, memory_watch)
 
     # --------------------------------------------------------------- helpers -
 
@@ -168,22 +271,69 @@ class JobRunner:
             self.state.record_loop_error(str(exc))
             self.log_fn("job.ack_error", token=token, error=str(exc))
 
+    def _defer(
+        self,
+        task: Dict[str, Any],
+        deferred: JobDeferred,
+        kind: str,
+        job_id: Optional[str],
+        org_id: Optional[str],
+    ) -> None:
+        deferrals = int(task.get(DEFERRALS_FIELD) or 0) + 1
+        if deferrals > self.max_deferrals:
+            error = f"deferred {deferrals - 1} times: {deferred.reason}"
+            self.state.mark_job_failure(error)
+            self.log_fn("job.failed", kind=kind, job_id=job_id, attempts=0, error=error)
+            self._patch_dead_letter(job_id, kind or "unknown", org_id, task, error)
+            return
+
+        payload = json.dumps({**task, DEFERRALS_FIELD: deferrals}, default=str)
+        ready_at = time.time() + deferred.delay_seconds
+        try:
+            self.redis.zadd(self.retry_set, {payload: ready_at})
+        except Exception as exc:
+            self.state.record_loop_error(str(exc))
+            self.log_fn("job.defer_error", kind=kind, job_id=job_id, error=str(exc))
+            self.redis.lpush(self.queue_name, payload)
+        self.state.mark_job_deferred()
+        metrics.increment("deferred", kind or "unknown")
+        self.log_fn(
+            "job.deferred",
+            kind=kind,
+            job_id=job_id,
+            reason=deferred.reason,
+            delay_seconds=round(deferred.delay_seconds, 3),
+            deferrals=deferrals,
+        )
+
+    def _promote_due_retries(self, now: float) -> None:
+        """Move deferred payloads whose delay has elapsed back onto the main queue."""
+        if now - self._last_retry_promotion < 1.0:
+            return
+        self._last_retry_promotion = now
+        try:
+            due = self.redis.zrangebyscore(self.retry_set, 0, now, start=0, num=100)
+        except Exception as exc:
+            self.state.record_loop_error(str(exc))
+            self.log_fn("job.retry_scan_error", error=str(exc))
+            return
+        for payload in due:
+            try:
+                # Only the replica whose ZREM succeeds re-enqueues, so a payload is promoted once
+                if self.redis.zrem(self.retry_set, payload):
+                    self.redis.lpush(self.queue_name, payload)
+            except Exception as exc:
+                self.state.record_loop_error(str(exc))
+                self.log_fn("job.retry_promote_error", error=str(exc))
+
     def _handle_idle(self) -> None:
         now = time.time()
         self.state.record_idle()
         if self.visibility_timeout:
             self._requeue_expired_jobs(now)
 
-        if now - self._last_queue_log >= self.queue_log_interval:
-            try:
-                depth = self.redis.llen(self.queue_name)
-                metrics.record_queue_depth(self.queue_name, depth)
-                self.state.record_queue_depth(depth)
-                self.log_fn("queue.depth", queue=self.queue_name, depth=depth)
-            except Exception as exc:
-                self.state.record_loop_error(str(exc))
-                self.log_fn("queue.depth_error", queue=self.queue_name, error=str(exc))
-            self._last_queue_log = now
+        if self._sampler_thread is None:
+            self.sample_queues(heartbeat=True)
 
         if self.notify_fn:
             try:
@@ -193,6 +343,103 @@ class JobRunner:
                 self.state.record_notify_error(str(exc))
                 self.log_fn("notify.error", error=str(exc))
 
+    # ------------------------------------------------------- queue sampling -
+
+    def start_queue_sampler(self) -> None:
+        """Sample queue depth and age on a timer, independent of the job loop."""
+        if self._sampler_thread is not None:
+            return
+        self._sampler_stop.clear()
+        self._sampler_thread = threading.Thread(target=self._sampler_loop, name="queue-sampler", daemon=True)
+        self._sampler_thread.start()
+
+    def stop_queue_sampler(self) -> None:
+        self._sampler_stop.set()
+        if self._sampler_thread is not None:
+            self._sampler_thread.join(timeout=5.0)
+        self._sampler_thread = None
+
+    def _sampler_loop(self) -> None:
+        while True:
+            self.sample_queues(force=True)
+            if self._sampler_stop.wait(self.queue_log_interval):
+                return
+
+    def sample_queues(self, *, force: bool = False, heartbeat: bool = False) -> Optional[Dict[str, Dict[str, Any]]]:
+        now = time.time()
+        with self._queue_sample_lock:
+            if not force and now - self._last_queue_log < self.queue_log_interval:
+                return None
+            self._last_queue_log = now
+
+        try:
+            pipe = self.redis.pipeline()
+            pipe.llen(self.queue_name)
+            pipe.lindex(self.queue_name, 0)
+            pipe.lindex(self.queue_name, -1)
+            pipe.llen(self.processing_queue)
+            if self.visibility_timeout:
+                pipe.zrange(self.processing_visibility_key, 0, 0, withscores=True)
+            else:
+                pipe.lindex(self.processing_queue, -1)
+            pipe.llen(self.dead_letter_queue)
+            pipe.lindex(self.dead_letter_queue, 0)
+            pipe.lindex(self.dead_letter_queue, -1)
+            pipe.zcard(self.retry_set)
+            pipe.zrange(self.retry_set, 0, 0)
+            results: List[Any] = list(pipe.execute())
+        except Exception as exc:
+            self.state.record_loop_error(str(exc))
+            self.log_fn("queue.depth_error", queue=self.queue_name, error=str(exc))
+            return None
+
+        (
+            main_depth,
+            main_head,
+            main_tail,
+            processing_depth,
+            processing_oldest,
+            dead_depth,
+            dead_head,
+            dead_tail,
+            retry_depth,
+            retry_next,
+        ) = results
+        if self.visibility_timeout:
+            claimed_at = float(processing_oldest[0][1]) if processing_oldest else None
+        else:
+            claimed_at = payload_timestamp(processing_oldest)
+
+        samples = {
+            self.queue_name: (main_depth, self._oldest(payload_timestamp(main_head), payload_timestamp(main_tail))),
+            self.processing_queue: (processing_depth, claimed_at),
+            self.dead_letter_queue: (
+                dead_depth,
+                self._oldest(
+                    payload_timestamp(dead_head, "failed_at", ENQUEUED_AT_FIELD),
+                    payload_timestamp(dead_tail, "failed_at", ENQUEUED_AT_FIELD),
+                ),
+            ),
+            # Deferred payloads keep their original enqueued_at, so this is how long the
+            # next-due job has been waiting overall
+            self.retry_set: (retry_depth, payload_timestamp(retry_next[0] if retry_next else None)),
+        }
+        report: Dict[str, Dict[str, Any]] = {}
+        for queue, (depth, oldest_ts) in samples.items():
+            depth = int(depth or 0)
+            age = max(0.0, now - oldest_ts) if (depth and oldest_ts is not None) else 0.0
+            metrics.record_queue_depth(queue, depth)
+            metrics.record_queue_age(queue, age)
+            report[queue] = {"depth": depth, "oldest_age_seconds": round(age, 3)}
+            self.log_fn("queue.depth", queue=queue, depth=depth, oldest_age_seconds=round(age, 3))
+        self.state.record_queue_depth(report[self.queue_name]["depth"], heartbeat=heartbeat)
+        return report
+
+    @staticmethod
+    def _oldest(*timestamps: Optional[float]) -> Optional[float]:
+        present = [ts for ts in timestamps if ts is not None]
+        return min(present) if present else None
+
     def _requeue_expired_jobs(self, now: float) -> None:
         if not self.visibility_timeout:
             return
@@ -230,6 +477,21 @@ class JobRunner:
         duration = time.perf_counter() - started_at
         metrics.record_duration(kind or "unknown", duration)
 
+    def _record_memory(self, kind: str, job_id: Optional[str], watch: JobMemoryWatch) -> None:
+        try:
+            watch.stop()
+            metrics.record_job_memory(kind or "unknown", watch.rss_before, watch.rss_after, watch.peak)
+            self.log_fn(
+                "job.memory",
+                kind=kind,
+                job_id=job_id,
+                rss_before=watch.rss_before,
+                rss_after=watch.rss_after,
+                peak_rss=watch.peak,
+            )
+        except Exception as exc:
+            self.log_fn("job.memory_error", kind=kind, job_id=job_id, error=str(exc))
+
     def _patch_dead_letter(
         self,
         job_id: Optional[str],
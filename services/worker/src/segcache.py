@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from src.eventlog import log_event
+from src.metrics import metrics
+
+SEGMENT_CACHE_TTL_SECONDS = int(os.getenv("SEGMENT_CACHE_TTL_SECONDS", "1800"))
+SEGMENT_CACHE_MAX_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_BYTES", str(512 * 1024)))
+SEGMENT_CACHE_ENABLED = os.getenv("SEGMENT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+SEGMENT_CACHE_PREFIX = os.getenv("SEGMENT_CACHE_PREFIX", "segcache")
+
+Row = Tuple[Any, int, str, Optional[float]]
+
+try:
+    import msgpack  # type: ignore
+
+    def _dumps(rows: Sequence[Row]) -> bytes:
+        return msgpack.packb([list(row) for row in rows], use_bin_type=True)
+
+    def _loads(blob: bytes) -> List[Row]:
+        return [tuple(row) for row in msgpack.unpackb(blob, raw=False)]
+
+except ImportError:  # pragma: no cover - msgpack is in requirements.txt
+
+    def _dumps(rows: Sequence[Row]) -> bytes:
+        return json.dumps([list(row) for row in rows], separators=(",", ":")).encode()
+
+    def _loads(blob: bytes) -> List[Row]:
+        return [tuple(row) for row in json.loads(blob)]
+
+
+def selection_key(*parts: Any) -> str:
+    """Short, stable digest of everything that shapes a selection (profile, query, limit, provider...)."""
+    raw = "\x1f".join(str(part) for part in parts)
+    return hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+class SegmentCache:
+    """Ranked segment rows per document, shared by every job that reads the same spans.
+
+    Entries live under ``<prefix>:<document_id>:<spans version>:<selection>``.
+    The spans version is a random token stored per document. Rewriting the
+    spans replaces the token (``invalidate``), so stale entries can never be
+    read again and simply expire. If the token itself is evicted, a new one
+    is minted and the cache starts cold rather than serving old rows.
+    Redis errors are logged and treated as misses.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        *,
+        ttl_seconds: int = SEGMENT_CACHE_TTL_SECONDS,
+        max_bytes: int = SEGMENT_CACHE_MAX_BYTES,
+        prefix: str = SEGMENT_CACHE_PREFIX,
+    ) -> None:
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+
+    def _version_key(self, document_id: str) -> str:
+        return f"{self.prefix}:ver:{document_id}"
+
+    def version(self, document_id: str) -> str:
+        key = self._version_key(document_id)
+        current = self.redis.get(key)
+        if current is None:
+            self.redis.set(key, uuid.uuid4().hex[:12], nx=True, ex=self.ttl_seconds * 4)
+            current = self.redis.get(key)
+        if isinstance(current, bytes):
+            current = current.decode()
+        return str(current)
+
+    def invalidate(self, document_id: str) -> None:
+        try:
+            self.redis.set(self._version_key(document_id), uuid.uuid4().hex[:12], ex=self.ttl_seconds * 4)
+        except Exception as err:
+            log_event("segment_cache.invalidate_failed", document_id=document_id, error=str(err))
+
+    def get_or_load(self, document_id: str, selection: str, loader: Callable[[], Sequence[Row]]) -> List[Row]:
+        try:
+            key = f"{self.prefix}:{document_id}:{self.version(document_id)}:{selection}"
+            blob = self.redis.get(key)
+        except Exception as err:
+            log_event("segment_cache.unavailable", document_id=document_id, error=str(err))
+            metrics.increment("segment_cache", "error")
+            return list(loader())
+
+        if blob is not None:
+            try:
+                rows = _loads(blob)
+                metrics.increment("segment_cache", "hit")
+                return rows
+            except Exception as err:
+                log_event("segment_cache.decode_failed", document_id=document_id, error=str(err))
+
+        metrics.increment("segment_cache", "miss")
+        rows = list(loader())
+        blob = _dumps(rows)
+        if len(blob) > self.max_bytes:
+            metrics.increment("segment_cache", "oversize")
+            return rows
+        try:
+            self.redis.set(key, blob, ex=self.ttl_seconds)
+        except Exception as err:
+            log_event("segment_cache.store_failed", document_id=document_id, error=str(err))
+        return rows
+
+
+def segment_rows(segments: Sequence[dict]) -> List[Row]:
+    """Compact ``(span_id, page, text, score)`` rows of labelled segments, for caching."""
+    return [(seg["span_id"], seg["page"], seg["text"], seg.get("score")) for seg in segments]
+
+
+__all__ = [
+    "SEGMENT_CACHE_ENABLED",
+    "SegmentCache",
+    "segment_rows",
+    "selection_key",
+]
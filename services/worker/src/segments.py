@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.eventlog import log_event
+
+# ts_rank_cd normalization 32 maps each group's rank into [0, 1) so group weights stay comparable
+_RANK_NORMALIZATION = 32
+
+
+@dataclass(frozen=True)
+class RankProfile:
+    """Weighted tsquery groups used to rank a document's spans inside Postgres.
+
+    Each group is a ``to_tsquery('english', ...)`` expression with a weight;
+    a span's score is ``1 + sum(weight * ts_rank_cd(tsv, group))`` plus an
+    optional bonus for long spans.
+    """
+
+    name: str
+    groups: Tuple[Tuple[str, float], ...]
+    min_chars: int = 40
+    long_bonus: Tuple[int, float] = (0, 0.0)
+
+
+IEP_PROFILE = RankProfile(
+    "iep",
+    (
+        ("minute:* | min", 3.0),
+        ("servic:* | therap:*", 2.0),
+        ("goal:*", 2.0),
+        ("accommod:* | modif:* | support:*", 2.0),
+        ("frequenc:* | per <-> week", 1.0),
+    ),
+)
+
+RESEARCH_PROFILE = RankProfile(
+    "research",
+    (
+        ("summari:* | conclus:*", 3.0),
+        ("recommend:* | score:* | percentil:*", 2.0),
+        ("strength:* | need:*", 1.0),
+    ),
+    min_chars=80,
+)
+
+EOB_PROFILE = RankProfile(
+    "eob",
+    (
+        ("denial:* | deni:*", 3.0),
+        ("code:* | reason:*", 2.0),
+        ("appeal:* | next <-> step:*", 2.0),
+        ("benefit:* | coverag:*", 1.0),
+    ),
+    long_bonus=(120, 1.0),
+)
+
+
+def _base_expression(profile: RankProfile) -> Tuple[str, list]:
+    """Score of a span matching none of the groups: 1 plus the long-span bonus."""
+    if not profile.long_bonus[0]:
+        return "1", []
+    return "1 + CASE WHEN char_length(btrim(text)) > %s THEN %s ELSE 0 END", list(profile.long_bonus)
+
+
+def score_expression(profile: RankProfile) -> Tuple[str, list]:
+    """SQL expression (and its parameters) scoring a doc_spans row against ``profile``."""
+    terms = []
+    params: list = []
+    for query, weight in profile.groups:
+        terms.append(f"%s * COALESCE(ts_rank_cd(tsv, to_tsquery('english', %s), {_RANK_NORMALIZATION}), 0)")
+        params.extend([weight, query])
+    base, base_params = _base_expression(profile)
+    return " + ".join([base] + terms), base_params + params
+
+
+def match_query(profile: RankProfile) -> str:
+    """Single tsquery matching any group of ``profile`` (GIN-indexable)."""
+    return " | ".join(f"({query})" for query, _ in profile.groups)
+
+
+_MATCHES = "tsv @@ to_tsquery('english', %s)"
+
+
+def _ranked_sql(profile: RankProfile) -> str:
+    """Spans matching ``match_query`` ranked by score, topped up with non-matching spans.
+
+    Only the matching branch computes ``ts_rank_cd``, and its ``tsv @@``
+    predicate can use the GIN index. The top-up branch gives the other spans
+    their base score, so short documents still fill ``limit``.
+    """
+    score, _ = score_expression(profile)
+    base, _ = _base_expression(profile)
+    order = "ORDER BY score DESC, page ASC, id ASC LIMIT %s"
+    return (
+        f"(SELECT id, page, text, ({score}) AS score FROM doc_spans "
+        f"WHERE document_id=%s AND {_MATCHES} AND char_length(btrim(text)) >= %s {order}) "
+        "UNION ALL "
+        f"(SELECT id, page, text, ({base}) AS score FROM doc_spans "
+        f"WHERE document_id=%s AND NOT COALESCE({_MATCHES}, false) AND char_length(btrim(text)) >= %s {order}) "
+        f"{order}"
+    )
+
+
+def _ranked_params(profile: RankProfile, document_id: str, limit: int) -> list:
+    _, score_params = score_expression(profile)
+    _, base_params = _base_expression(profile)
+    match = match_query(profile)
+    return (
+        score_params
+        + [document_id, match, profile.min_chars, limit]
+        + base_params
+        + [document_id, match, profile.min_chars, limit]
+        + [limit]
+    )
+
+
+def _fetch_ranked(conn, profile: RankProfile, document_id: str, limit: int) -> List[Tuple[Any, int, str, float]]:
+    # Savepoint so a missing tsv column does not abort the caller's transaction (and its org context)
+    with conn.transaction():
+        rows = conn.execute(_ranked_sql(profile), _ranked_params(profile, document_id, limit)).fetchall()
+    return [(span_id, page, (text or "").strip(), float(score)) for span_id, page, text, score in rows]
+
+
+def _fetch_scored_locally(
+    conn,
+    document_id: str,
+    limit: int,
+    scan_factor: int,
+    min_chars: int,
+    scorer: Callable[[str], float],
+) -> List[Tuple[Any, int, str, float]]:
+    rows = conn.execute(
+        "SELECT id, page, text FROM doc_spans WHERE document_id=%s ORDER BY page ASC LIMIT %s",
+        (document_id, limit * scan_factor),
+    ).fetchall()
+    kept = []
+    for span_id, page, text in rows:
+        text = (text or "").strip()
+        if len(text) >= min_chars:
+            kept.append((span_id, page, text))
+    texts = [text for _, _, text in kept]
+    # A KeywordScorer scores the whole scan in one pass; plain callables go span by span
+    scores = scorer.score_batch(texts) if hasattr(scorer, "score_batch") else [scorer(text) for text in texts]
+    scored = [(span_id, page, text, score) for (span_id, page, text), score in zip(kept, scores)]
+    scored.sort(key=lambda item: (-item[3], item[1], str(item[0])))
+    return scored
+
+
+def select_ranked_segments(
+    conn,
+    document_id: str,
+    profile: RankProfile,
+    *,
+    prefix: str,
+    doc_name: str,
+    which: str,
+    limit: int,
+    fallback_scorer: Optional[Callable[[str], float]] = None,
+    fallback_scan_factor: int = 3,
+    include_score: bool = False,
+) -> List[Dict[str, Any]]:
+    """Return up to ``limit`` labelled excerpts ranked across the whole document.
+
+    Ranking runs in Postgres against ``doc_spans.tsv``, so only the top rows
+    travel to the worker. If the full-text query fails (e.g. a database
+    without the tsv column) the legacy page-ordered scan scored by
+    ``fallback_scorer`` is used instead.
+    """
+    try:
+        rows = _fetch_ranked(conn, profile, document_id, limit)
+    except Exception as err:
+        if fallback_scorer is None:
+            raise
+        log_event("segments.rank_fallback", profile=profile.name, document_id=document_id, error=str(err))
+        rows = _fetch_scored_locally(conn, document_id, limit, fallback_scan_factor, profile.min_chars, fallback_scorer)
+
+    return label_segments(
+        rows,
+        document_id,
+        prefix=prefix,
+        doc_name=doc_name,
+        which=which,
+        limit=limit,
+        include_score=include_score,
+    )
+
+
+def label_segments(
+    rows: Sequence[Tuple[Any, int, str, float]],
+    document_id: str,
+    *,
+    prefix: str,
+    doc_name: str,
+    which: str,
+    limit: int,
+    include_score: bool = False,
+) -> List[Dict[str, Any]]:
+    """Turn ranked ``(span_id, page, text, score)`` rows into labelled prompt segments.
+
+    Text is kept whole; trimming to the prompt budget is ``src.packing``'s job.
+    """
+    segments: List[Dict[str, Any]] = []
+    used = set()
+    for span_id, page, text, score in rows:
+        span_key = str(span_id)
+        if span_key in used:
+            continue
+        segment: Dict[str, Any] = {
+            "label": f"{prefix}{len(segments) + 1:03d}",
+            "span_id": span_key,
+            "document_id": document_id,
+            "doc_name": doc_name,
+            "page": page,
+            "text": (text or "").strip(),
+        }
+        if include_score:
+            segment["score"] = score
+        segment["which"] = which
+        segments.append(segment)
+        used.add(span_key)
+        if len(segments) >= limit:
+            break
+    return segments
+
+
+__all__ = [
+    "EOB_PROFILE",
+    "IEP_PROFILE",
+    "RESEARCH_PROFILE",
+    "RankProfile",
+    "label_segments",
+    "match_query",
+    "score_expression",
+    "select_ranked_segments",
+]
@@ -62,12 +62,13 @@ class WorkerState:
         with self._lock:
             self._data["last_heartbeat"] = _now()
 
-    def record_queue_depth(self, depth: int) -> None:
+    def record_queue_depth(self, depth: int, *, heartbeat: bool = True) -> None:
         with self._lock:
             now = _now()
             self._data["queue_depth"] = max(0, int(depth))
             self._data["last_queue_depth_check"] = now
-            self._data["last_heartbeat"] = now
+            if heartbeat:
+                self._data["last_heartbeat"] = now
 
     # ---- job lifecycle ------------------------------------------------------
 
@@ -112,6 +113,18 @@ class WorkerState:
                 }
             )
 
+    def mark_job_deferred(self) -> None:
+        with self._lock:
+            now = _now()
+            self._data.update(
+                {
+                    "last_job_finished": now,
+                    "current_job": None,
+                    "current_kind": None,
+                    "last_heartbeat": now,
+                }
+            )
+
     def mark_job_crash(self, error: Optional[str] = None) -> None:
         self.mark_job_failure(error)
 
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Callable, FrozenSet, Iterable, List, Optional, Tuple
+
+from src.deadline import check
+from src.eventlog import log_event
+from src.metrics import metrics
+
+LLM_STREAM_ENABLED = os.getenv("LLM_STREAM_ENABLED", "1") not in ("0", "false", "False")
+# Minimum gap between progressive snapshots handed to the handler (each one is a DB write)
+LLM_STREAM_INTERVAL_SECONDS = float(os.getenv("LLM_STREAM_INTERVAL_SECONDS", "1.5"))
+DEFAULT_STREAM_KINDS = frozenset({"build_one_pager", "build_advocacy_outline"})
+
+
+def _parse_kinds(spec: Optional[str]) -> FrozenSet[str]:
+    if spec is None:
+        return DEFAULT_STREAM_KINDS
+    return frozenset(kind.strip() for kind in spec.split(",") if kind.strip())
+
+
+LLM_STREAM_KINDS = _parse_kinds(os.getenv("LLM_STREAM_KINDS"))
+
+
+class StreamFailed(Exception):
+    """The streamed response ended with an error event."""
+
+
+def streams(kind: str) -> bool:
+    return LLM_STREAM_ENABLED and kind in LLM_STREAM_KINDS
+
+
+def _close(prefix: str) -> Optional[str]:
+    """Append the quotes/brackets ``prefix`` leaves open, or None if it ends mid-token."""
+    stack: List[str] = []
+    in_string = escaped = False
+    for ch in prefix:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if escaped:
+        return None
+    return prefix + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def _cut_points(text: str) -> List[int]:
+    # Positions just before a ',' and just after a '{' / '[' outside strings,
+    # latest first: cutting there drops only the member still being written
+    points: List[int] = []
+    in_string = escaped = False
+    for index, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ",":
+            points.append(index)
+        elif ch in "{[":
+            points.append(index + 1)
+    return sorted(points, reverse=True)
+
+
+def parse_partial_json(text: str) -> Any:
+    """Best-effort parse of a JSON document that is still arriving.
+
+    Open strings, objects and arrays are closed; a trailing member that is
+    not yet parseable (half a key, a dangling ``:``, a partial number) is
+    dropped. Returns None while nothing usable has arrived.
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    for end in [len(text)] + _cut_points(text):
+        candidate = _close(text[:end].rstrip().rstrip(","))
+        if candidate is None:
+            continue
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+def consume_stream(
+    events: Iterable[Any],
+    on_partial: Callable[[Any], None],
+    *,
+    kind: str = "",
+    interval: float = LLM_STREAM_INTERVAL_SECONDS,
+    clock: Callable[[], float] = time.monotonic,
+) -> Tuple[str, Any]:
+    """Drain a Responses API event stream; return ``(text, usage)``.
+
+    Every ``interval`` seconds the text so far is parsed with
+    ``parse_partial_json`` and, if it changed, handed to ``on_partial``.
+    Snapshot callbacks that fail are logged and never stop the stream.
+    """
+    chunks: List[str] = []
+    usage = None
+    last_emit = clock()
+    last_snapshot: Any = None
+    snapshots = 0
+    for event in events:
+        # The HTTP timeout bounds each read; a stream that keeps trickling is cut here
+        check("openai_stream")
+        event_type = getattr(event, "type", "")
+        if event_type == "response.output_text.delta":
+            chunks.append(getattr(event, "delta", "") or "")
+            now = clock()
+            if now - last_emit < interval:
+                continue
+            last_emit = now
+            snapshot = parse_partial_json("".join(chunks))
+            if snapshot is None or snapshot == last_snapshot:
+                continue
+            last_snapshot = snapshot
+            snapshots += 1
+            try:
+                on_partial(snapshot)
+            except Exception as err:
+                log_event("llm.stream_snapshot_failed", kind=kind, error=str(err))
+        elif event_type == "response.completed":
+            usage = getattr(getattr(event, "response", None), "usage", None)
+        elif event_type in ("response.failed", "response.incomplete", "error"):
+            error = getattr(getattr(event, "response", None), "error", None) or getattr(event, "message", None)
+            raise StreamFailed(f"{event_type}: {error}")
+    metrics.increment("llm_stream", "snapshots", snapshots)
+    return "".join(chunks), usage
+
+
+__all__ = [
+    "LLM_STREAM_KINDS",
+    "StreamFailed",
+    "consume_stream",
+    "parse_partial_json",
+    "streams",
+]
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import math
+import os
+import struct
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# "vector" keeps float32 in doc_spans.embedding; "halfvec" writes float16 to doc_spans.embedding_half
+EMBED_STORAGE = (os.getenv("EMBED_STORAGE") or "vector").strip().lower()
+# Matryoshka truncation: keep the first N dimensions (0 = model default)
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "0") or 0)
+
+STORAGE_COLUMNS = {
+    "vector": ("embedding", "vector"),
+    "halfvec": ("embedding_half", "halfvec"),
+}
+
+Vector = Sequence[float]
+
+
+def storage_column(storage: Optional[str] = None) -> Tuple[str, str]:
+    """Return ``(column, sql_type)`` for the configured storage mode."""
+    mode = (storage or EMBED_STORAGE).strip().lower()
+    if mode not in STORAGE_COLUMNS:
+        raise ValueError(f"unsupported EMBED_STORAGE: {mode}")
+    return STORAGE_COLUMNS[mode]
+
+
+def column_dimensions(conn, storage: Optional[str] = None) -> Optional[int]:
+    """Declared size of the storage column (``vector(N)`` / ``halfvec(N)``); 0 if unsized, None if missing."""
+    column, _ = storage_column(storage)
+    row = conn.execute(
+        "SELECT atttypmod FROM pg_attribute WHERE attrelid = 'doc_spans'::regclass AND attname = %s AND NOT attisdropped",
+        (column,),
+    ).fetchone()
+    if not row:
+        return None
+    # pgvector stores the dimension count as the typmod; -1 means no declared size
+    return max(0, int(row[0]))
+
+
+def _normalize(vec: Vector) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec))
+    if not norm:
+        return [float(x) for x in vec]
+    return [x / norm for x in vec]
+
+
+def truncate(vec: Vector, dims: Optional[int] = None) -> List[float]:
+    """Keep the leading ``dims`` components and re-normalize (Matryoshka embeddings)."""
+    dims = EMBED_DIMENSIONS if dims is None else dims
+    if not dims or dims >= len(vec):
+        return [float(x) for x in vec]
+    return _normalize(vec[:dims])
+
+
+def to_float16(vec: Vector) -> List[float]:
+    """Round-trip through IEEE half precision, exactly as pgvector halfvec stores it."""
+    packed = struct.pack(f"<{len(vec)}e", *vec)
+    return list(struct.unpack(f"<{len(vec)}e", packed))
+
+
+def vector_literal(vec: Vector, storage: Optional[str] = None) -> str:
+    """Text literal for a pgvector cast.
+
+    halfvec values are rounded to float16 first and printed with 5
+    significant digits, the fewest that parse back to the same float16 for
+    every value, instead of full float repr. That is well under 60% of the
+    float32 literal.
+    """
+    mode = (storage or EMBED_STORAGE).strip().lower()
+    if mode == "halfvec":
+        return "[" + ",".join(f"{x:.5g}" for x in to_float16(vec)) + "]"
+    return "[" + ",".join(str(float(x)) for x in vec) + "]"
+
+
+def quantize_int8(vec: Vector) -> Tuple[bytes, float]:
+    """Symmetric per-vector int8 quantization; returns (codes, scale)."""
+    peak = max((abs(x) for x in vec), default=0.0)
+    scale = peak / 127.0 if peak else 1.0
+    codes = bytes((max(-127, min(127, round(x / scale))) & 0xFF) for x in vec)
+    return codes, scale
+
+
+def dequantize_int8(codes: bytes, scale: float) -> List[float]:
+    return [(b - 256 if b > 127 else b) * scale for b in codes]
+
+
+def bytes_per_vector(dims: int, variant: str) -> int:
+    # On-disk pgvector sizes: 8-byte header plus the payload
+    if variant == "int8":
+        return dims + 4 + 8
+    if variant == "halfvec":
+        return 2 * dims + 8
+    return 4 * dims + 8
+
+
+def _cosine(a: Vector, b: Vector) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+def _top_k(query: Vector, corpus: Sequence[Vector], k: int) -> List[int]:
+    scored = sorted(range(len(corpus)), key=lambda i: -_cosine(query, corpus[i]))
+    return scored[:k]
+
+
+VARIANTS: Dict[str, Callable[[Vector], List[float]]] = {
+    "float32": lambda v: [float(x) for x in v],
+    "halfvec": to_float16,
+    "int8": lambda v: dequantize_int8(*quantize_int8(v)),
+}
+
+
+def compare_recall(
+    corpus: Sequence[Vector],
+    queries: Sequence[Vector],
+    *,
+    k: int = 10,
+    variants: Sequence[str] = ("halfvec", "int8"),
+    dims: Sequence[int] = (),
+) -> List[Dict[str, object]]:
+    """Recall@k of reduced-precision variants against exact float32 search.
+
+    Queries stay in float32 (as they do at retrieval time); only the stored
+    corpus is transformed. Each entry in ``dims`` adds a Matryoshka-truncated
+    run for every variant.
+    """
+    baseline = [set(_top_k(q, corpus, k)) for q in queries]
+    full_dims = len(corpus[0]) if corpus else 0
+    results: List[Dict[str, object]] = []
+    for dim in [0, *dims]:
+        for variant in variants:
+            transform = VARIANTS[variant]
+            stored = [transform(truncate(v, dim)) for v in corpus]
+            hits = 0
+            for query, expected in zip(queries, baseline):
+                got = _top_k(truncate(query, dim), stored, k)
+                hits += len(expected.intersection(got))
+            effective = dim or full_dims
+            results.append(
+                {
+                    "variant": variant,
+                    "dims": effective,
+                    "recall_at_k": round(hits / (k * len(queries)), 4) if queries else 0.0,
+                    "bytes_per_vector": bytes_per_vector(effective, variant),
+                    "float32_bytes": bytes_per_vector(full_dims, "float32"),
+                }
+            )
+    return results
+
+
+__all__ = [
+    "EMBED_DIMENSIONS",
+    "EMBED_STORAGE",
+    "column_dimensions",
+    "compare_recall",
+    "dequantize_int8",
+    "quantize_int8",
+    "storage_column",
+    "to_float16",
+    "truncate",
+    "vector_literal",
+]
@@ -1,6 +1,71 @@
 import sys
+import types
 from pathlib import Path
 
 WORKER_DIR = Path(__file__).resolve().parents[1]
 if str(WORKER_DIR) not in sys.path:
   sys.path.insert(0, str(WORKER_DIR))
+
+
+# Optional heavy dependencies are stubbed so worker modules import without them
+for _name in ("fitz", "ocrmypdf", "pytesseract", "pypdfium2"):
+    if _name not in sys.modules:
+        sys.modules[_name] = types.ModuleType(_name)
+
+if "openai" not in sys.modules:
+    openai_mod = types.ModuleType("openai")
+    class _StubOpenAI:
+        def __init__(self, *args, **kwargs):
+            pass
+    openai_mod.OpenAI = _StubOpenAI  # type: ignore[attr-defined]
+    sys.modules["openai"] = openai_mod
+
+if "redis" not in sys.modules:
+    redis_mod = types.ModuleType("redis")
+    class _FakeRedis:
+        def blpop(self, *_args, **_kwargs):
+            return None
+        def llen(self, *_args, **_kwargs):
+            return 0
+        def rpush(self, *_args, **_kwargs):
+            return 0
+    redis_mod.from_url = lambda *_args, **_kwargs: _FakeRedis()  # type: ignore[attr-defined]
+    sys.modules["redis"] = redis_mod
+
+psycopg_mod = sys.modules.setdefault("psycopg", types.ModuleType("psycopg"))
+
+def _missing_connect(*_args, **_kwargs):
+    raise RuntimeError("psycopg stub")
+
+psycopg_mod.connect = _missing_connect  # type: ignore[attr-defined]
+psycopg_mod.Connection = object  # type: ignore[attr-defined]
+
+psycopg_types = sys.modules.setdefault("psycopg.types", types.ModuleType("psycopg.types"))
+psycopg_mod.types = psycopg_types  # type: ignore[attr-defined]
+
+json_mod = sys.modules.setdefault("psycopg.types.json", types.ModuleType("psycopg.types.json"))
+def _json_wrapper(value):
+    return value
+json_mod.Json = _json_wrapper  # type: ignore[attr-defined]
+psycopg_types.json = json_mod  # type: ignore[attr-defined]
+
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _local_rate_limiter(monkeypatch):
+    """Keep the shared OpenAI rate limiter in-process (and effectively unlimited) under test."""
+    from src import ratelimit
+
+    monkeypatch.setattr(ratelimit, "_limiter", ratelimit.RateLimiter(default=(10**6, 10**9), limits={}))
+
+
+@pytest.fixture(autouse=True)
+def _fresh_breakers():
+    """Circuit breakers are process-wide; don't let one test's failures open another's circuit."""
+    from src import breaker
+
+    breaker.reset()
+    yield
+    breaker.reset()
@@ -0,0 +1,207 @@
+import types
+
+from src import backfill  # type: ignore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class SpanTable:
+    """Minimal doc_spans stand-in supporting the keyset SELECT and bulk UPDATE."""
+
+    def __init__(self, count, model="old-model"):
+        self.rows = {f"00000000-0000-0000-0000-{i * 10:012d}": model for i in range(1, count + 1)}
+        self.commits = 0
+        self.updates = 0
+
+    def execute(self, sql, params):
+        if sql.startswith("SELECT"):
+            last_id, model, limit = params
+            ids = sorted(i for i, m in self.rows.items() if i > last_id and m != model)[:limit]
+            return FakeResult([(i, f"text {i}", self.document_of(i)) for i in ids])
+        model, ids, vectors = params
+        assert len(ids) == len(vectors)
+        for span_id in ids:
+            self.rows[span_id] = model
+        self.updates += 1
+        return FakeResult([])
+
+    def commit(self):
+        self.commits += 1
+
+    @staticmethod
+    def document_of(span_id):
+        # Three spans per document
+        return f"doc-{(int(span_id[-12:]) // 10 - 1) // 3}"
+
+
+class FakeSegmentCache:
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, document_id):
+        self.invalidated.append(document_id)
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.calls = []
+        self.embeddings = types.SimpleNamespace(create=self._create)
+
+    def _create(self, model, input):
+        self.calls.append(len(input))
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=[0.5, 0.25]) for _ in input])
+
+
+def test_throttle_waits_for_window():
+    clock = FakeClock()
+    throttle = backfill.Throttle(2, 100, clock=clock, sleep=clock.sleep)
+    assert throttle.acquire(10) == 0
+    assert throttle.acquire(10) == 0
+    waited = throttle.acquire(10)
+    assert waited >= 60
+    clock.now = 200
+    throttle.acquire(90)
+    assert throttle.acquire(20) > 0
+
+
+def test_reembed_spans_updates_all_and_checkpoints():
+    table = SpanTable(10)
+    client = FakeOpenAI()
+    redis_client = FakeRedis()
+    summary = backfill.reembed_spans(
+        table,
+        client,
+        model="new-model",
+        redis_client=redis_client,
+        batch_size=3,
+        concurrency=2,
+        throttle=backfill.Throttle(0, 0),
+    )
+    assert summary["done"] is True
+    assert summary["updated"] == 10
+    assert set(table.rows.values()) == {"new-model"}
+    assert sorted(client.calls) == [1, 3, 3, 3]
+    # One bulk UPDATE and commit per page of batch_size * concurrency spans
+    assert table.updates == 2
+    checkpoint = backfill.load_checkpoint(redis_client, "new-model")
+    assert checkpoint["done"] == "1"
+    assert checkpoint["processed"] == "10"
+
+
+def test_reembed_spans_resumes_from_checkpoint():
+    table = SpanTable(6)
+    redis_client = FakeRedis()
+    redis_client.hset(
+        backfill.checkpoint_key("new-model"),
+        {"last_id": "00000000-0000-0000-0000-000000000040", "processed": "4"},
+    )
+    for span_id in sorted(table.rows)[:4]:
+        table.rows[span_id] = "new-model"
+    # A span written behind the cursor by a worker still on the old model
+    table.rows["00000000-0000-0000-0000-000000000015"] = "old-model"
+    summary = backfill.reembed_spans(
+        table,
+        FakeOpenAI(),
+        model="new-model",
+        redis_client=redis_client,
+        batch_size=10,
+        concurrency=1,
+        throttle=backfill.Throttle(0, 0),
+    )
+    assert summary["done"] is True
+    assert summary["updated"] == 3
+    assert summary["processed"] == 7
+    assert set(table.rows.values()) == {"new-model"}
+
+
+def test_fresh_run_sweeps_again_for_spans_inserted_behind_the_cursor():
+    table = SpanTable(6)
+    execute = table.execute
+
+    def execute_with_late_insert(sql, params):
+        result = execute(sql, params)
+        if sql.startswith("UPDATE") and table.updates == 1:
+            # An old-model worker inserts a span below the cursor while the run is in flight
+            table.rows["00000000-0000-0000-0000-000000000005"] = "old-model"
+        return result
+
+    table.execute = execute_with_late_insert
+    summary = backfill.reembed_spans(
+        table,
+        FakeOpenAI(),
+        model="new-model",
+        redis_client=FakeRedis(),
+        batch_size=3,
+        concurrency=1,
+        throttle=backfill.Throttle(0, 0),
+    )
+    assert summary["done"] is True
+    assert summary["updated"] == 7
+    assert set(table.rows.values()) == {"new-model"}
+
+
+def test_reembed_spans_invalidates_cached_segments_of_touched_documents():
+    table = SpanTable(7)
+    table.rows["00000000-0000-0000-0000-000000000040"] = "new-model"
+    cache = FakeSegmentCache()
+    backfill.reembed_spans(
+        table,
+        FakeOpenAI(),
+        model="new-model",
+        redis_client=FakeRedis(),
+        batch_size=3,
+        concurrency=1,
+        throttle=backfill.Throttle(0, 0),
+        segment_cache=cache,
+    )
+    # Pages: spans 1-3 (doc-0), 5-7 (doc-1, doc-2); each document once per page it appears in
+    assert cache.invalidated == ["doc-0", "doc-1", "doc-2"]
+
+
+def test_copy_to_halfvec_invalidates_cached_segments():
+    pages = [[("00000000-0000-0000-0000-000000000010", "doc-a"), ("00000000-0000-0000-0000-000000000020", "doc-a")], []]
+
+    class HalfvecTable:
+        def execute(self, sql, params):
+            assert "RETURNING id::text, document_id::text" in sql
+            return FakeResult(pages.pop(0))
+
+        def commit(self):
+            pass
+
+    cache = FakeSegmentCache()
+    summary = backfill.copy_to_halfvec(HalfvecTable(), redis_client=FakeRedis(), segment_cache=cache)
+    assert summary["done"] is True
+    assert summary["copied"] == 2
+    assert cache.invalidated == ["doc-a"]
@@ -0,0 +1,262 @@
+import json
+import types
+
+import pytest
+
+from src import batch, llm  # type: ignore
+from src.jobs.registry import JobParked  # type: ignore
+
+
+class FakeRedis:
+    """The hash, sorted-set and list commands BatchLane uses (decode_responses=True)."""
+
+    def __init__(self):
+        self.values = {}
+        self.hashes = {}
+        self.zsets = {}
+        self.lists = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def delete(self, key):
+        self.values.pop(key, None)
+        self.lists.pop(key, None)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hlen(self, key):
+        return len(self.hashes.get(key, {}))
+
+    def zadd(self, key, mapping, nx=False):
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not (nx and member in zset):
+                zset[member] = score
+
+    def zrange(self, key, start, end, withscores=False):
+        ordered = sorted(self.zsets.get(key, {}).items(), key=lambda item: item[1])
+        selected = ordered[start : None if end == -1 else end + 1]
+        return selected if withscores else [member for member, _ in selected]
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+
+    def lpop(self, key):
+        items = self.lists.get(key)
+        return items.pop(0) if items else None
+
+    def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return items[start : None if end == -1 else end + 1]
+
+
+class FakeCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, text):
+        self.entries[key] = text
+
+
+class StandInTransport:
+    """Plays the Batch API: answers every request line with ``answer(body)``."""
+
+    def __init__(self, answer, status="completed"):
+        self.answer = answer
+        self.final_status = status
+        self.submitted = {}
+
+    def submit(self, jsonl, *, endpoint, completion_window, metadata):
+        batch_id = f"batch_{len(self.submitted) + 1}"
+        self.submitted[batch_id] = [json.loads(line) for line in jsonl.decode().splitlines()]
+        return batch_id
+
+    def status(self, batch_id):
+        lines = []
+        for request in self.submitted[batch_id]:
+            text = self.answer(request["body"])
+            if text is None:
+                lines.append({"custom_id": request["custom_id"], "response": {"status_code": 500, "body": {}}})
+                continue
+            body = {"output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}]}
+            lines.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None})
+        return batch.BatchStatus(self.final_status, "\n".join(json.dumps(line) for line in lines))
+
+
+def make_lane(transport, clock=lambda: 1000.0, **kwargs):
+    return batch.BatchLane(FakeRedis(), transport, cache=FakeCache(), clock=clock, **kwargs)
+
+
+def park(lane, key, task, user="summarize"):
+    request = {"model": "gpt-5-mini", "input": [{"role": "user", "content": user}]}
+    with pytest.raises(JobParked):
+        lane.park(key, request, kind="research_summary", task=task)
+
+
+def test_identical_requests_are_queued_once_and_every_job_is_remembered():
+    lane = make_lane(StandInTransport(lambda body: "{}"))
+    park(lane, "k1", {"kind": "research_summary", "job_id": "a", "batch": True})
+    park(lane, "k1", {"kind": "research_summary", "job_id": "b", "batch": True})
+    assert lane.depth() == {"pending": 1, "active": 0}
+    assert len(lane.redis.lists["batch:waiting:k1"]) == 2
+
+
+def test_partial_batch_waits_for_max_wait_then_submits_jsonl():
+    now = [1000.0]
+    transport = StandInTransport(lambda body: "{}")
+    lane = make_lane(transport, clock=lambda: now[0], max_wait_seconds=300)
+    park(lane, "k1", {"job_id": "a", "batch": True})
+    assert lane.submit_due() is None
+    now[0] += 301
+    batch_id = lane.submit_due()
+    [line] = transport.submitted[batch_id]
+    assert line["custom_id"] == "k1" and line["method"] == "POST" and line["url"] == "/v1/responses"
+    assert line["body"]["model"] == "gpt-5-mini"
+    assert lane.depth() == {"pending": 0, "active": 1}
+
+
+def test_completed_batch_fills_cache_and_requeues_jobs_without_batch_flag():
+    transport = StandInTransport(lambda body: None if "fail" in json.dumps(body) else '{"summary": "ok"}')
+    lane = make_lane(transport, max_requests=2)
+    park(lane, "k1", {"kind": "research_summary", "job_id": "a", "batch": True})
+    park(lane, "k2", {"kind": "research_summary", "job_id": "b", "batch": True}, user="fail please")
+    lane.tick()  # full batch: submitted straight away
+    lane.tick()  # stand-in finishes immediately
+
+    assert lane.cache.entries == {"k1": '{"summary": "ok"}'}
+    requeued = [json.loads(payload) for payload in lane.redis.lists["jobs"]]
+    assert sorted(task["job_id"] for task in requeued) == ["a", "b"]
+    assert all("batch" not in task for task in requeued)
+    assert not lane.redis.lists.get("batch:waiting:k1")
+    assert lane.depth() == {"pending": 0, "active": 0}
+    assert "batch:lock" not in lane.redis.values
+
+
+def test_create_response_parks_on_miss_and_replays_batch_answer(monkeypatch):
+    calls = []
+    client = types.SimpleNamespace(responses=types.SimpleNamespace(create=lambda **request: calls.append(request)))
+    lane = make_lane(StandInTransport(lambda body: '{"summary": "from batch"}'), max_requests=1)
+    monkeypatch.setattr(batch, "_lane", lane)
+    task = {"kind": "research_summary", "job_id": "a", "batch": True}
+
+    def run(payload):
+        return llm.create_response(
+            client,
+            kind="research_summary",
+            model="gpt-5-mini",
+            input=[{"role": "user", "content": "summarize"}],
+            cache=lane.cache,
+            batch_task=payload,
+        )
+
+    with pytest.raises(JobParked):
+        run(task)
+    lane.tick()
+    lane.tick()
+    [released] = lane.redis.lists["jobs"]
+    response = run(json.loads(released))
+    assert llm.response_text(response) == '{"summary": "from batch"}'
+    assert calls == []
+
+
+def test_parse_results_skips_errors_and_reads_message_text():
+    output = "\n".join(
+        [
+            json.dumps({"custom_id": "a", "error": {"code": "x"}, "response": None}),
+            json.dumps(
+                {
+                    "custom_id": "b",
+                    "response": {
+                        "status_code": 200,
+                        "body": {"output": [{"type": "reasoning", "content": []}, {"content": [{"text": "hi"}]}]},
+                    },
+                }
+            ),
+            "not json",
+        ]
+    )
+    assert batch.parse_results(output) == {"b": "hi"}
+
+
+def test_released_jobs_restart_their_queue_wait_and_record_the_batch_wait():
+    from src.metrics import metrics  # type: ignore
+
+    metrics.reset()
+    now = [1000.0]
+    lane = make_lane(StandInTransport(lambda body: "{}"), clock=lambda: now[0], max_requests=1)
+    park(lane, "k1", {"kind": "research_summary", "job_id": "a", "batch": True, "enqueued_at": 1000 * 1000})
+    lane.tick()
+    now[0] += 3600
+    lane.tick()
+    [released] = [json.loads(payload) for payload in lane.redis.lists["jobs"]]
+    assert released["enqueued_at"] == 4600 * 1000
+    histogram = metrics.snapshot()["histograms"]["batch_wait_seconds"]["research_summary"]
+    assert histogram["count"] == 1
+
+
+def test_job_parked_while_the_lane_drains_is_not_lost():
+    lane = make_lane(StandInTransport(lambda body: "{}"))
+    park(lane, "k1", {"job_id": "a", "batch": True})
+    redis = lane.redis
+    original_lpop = redis.lpop
+
+    def lpop_with_late_park(key):
+        payload = original_lpop(key)
+        if payload is not None and json.loads(payload)["job_id"] == "a":
+            redis.rpush(key, json.dumps({"job_id": "late", "batch": True}))
+        return payload
+
+    redis.lpop = lpop_with_late_park
+    assert lane._release(["k1"]) == 2
+    assert sorted(json.loads(payload)["job_id"] for payload in redis.lists["jobs"]) == ["a", "late"]
+
+
+def test_bypassing_jobs_call_the_model_instead_of_parking(monkeypatch):
+    calls = []
+    client = types.SimpleNamespace(
+        responses=types.SimpleNamespace(create=lambda **request: calls.append(request) or llm.CachedResponse.from_text("{}", cached=False))
+    )
+    lane = make_lane(StandInTransport(lambda body: "{}"))
+    monkeypatch.setattr(batch, "_lane", lane)
+    llm.create_response(
+        client,
+        kind="research_summary",
+        model="gpt-5-mini",
+        input=[{"role": "user", "content": "summarize"}],
+        cache=lane.cache,
+        bypass=True,
+        batch_task={"kind": "research_summary", "job_id": "a", "batch": True},
+    )
+    assert len(calls) == 1
+    assert lane.depth() == {"pending": 0, "active": 0}
@@ -0,0 +1,112 @@
+import pytest
+
+from src import breaker  # type: ignore
+from src.metrics import metrics  # type: ignore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+class NotFound(Exception):
+    status_code = 404
+
+
+def make_breaker(clock, name="dep", **kwargs):
+    options = dict(window_seconds=60, min_calls=4, error_rate=0.5, slow_call_seconds=5, open_seconds=30, half_open_probes=1)
+    options.update(kwargs)
+    return breaker.CircuitBreaker(name, clock=clock, **options)
+
+
+def test_error_rate_opens_then_half_open_probe_closes():
+    clock = Clock()
+    cb = make_breaker(clock)
+    for ok in (True, False, True, False):
+        cb.record(ok, 0.1)
+    assert cb.state == breaker.OPEN
+    with pytest.raises(breaker.DependencyUnavailable) as info:
+        cb.before_call()
+    assert 30 <= info.value.delay_seconds <= 37.5
+
+    clock.now = 31
+    assert cb.state == breaker.HALF_OPEN
+    cb.before_call()
+    assert not cb.admits()  # the single probe is in flight
+    cb.record(True, 0.1)
+    assert cb.state == breaker.CLOSED
+
+
+def test_failed_probe_reopens_with_longer_delay():
+    clock = Clock()
+    cb = make_breaker(clock)
+    for _ in range(4):
+        cb.record(False, 0.1)
+    clock.now = 31
+    cb.before_call()
+    cb.record(False, 0.1)
+    assert cb.state == breaker.OPEN
+    assert cb.retry_after() == pytest.approx(60)
+
+
+def test_slow_calls_open_the_circuit():
+    clock = Clock()
+    cb = make_breaker(clock, slow_call_rate=0.75)
+    for _ in range(4):
+        cb.record(True, 9.0)
+    assert cb.state == breaker.OPEN
+
+
+def test_client_errors_and_rate_limits_are_not_dependency_failures():
+    assert breaker.is_dependency_failure(ServerError())
+    assert breaker.is_dependency_failure(TimeoutError())
+    assert not breaker.is_dependency_failure(NotFound())
+    assert not breaker.is_dependency_failure(breaker.JobDeferred("429"))
+
+    class ClientError(Exception):
+        response = {"ResponseMetadata": {"HTTPStatusCode": 404}}
+
+    assert not breaker.is_dependency_failure(ClientError())
+
+
+def test_adaptive_limit_halves_on_failure_and_grows_additively():
+    limit = breaker.AdaptiveLimit("dep", maximum=8)
+    limit.acquire()
+    limit.release(ok=False, slow=False)
+    assert limit.limit == 4
+    # +1/limit per healthy call: about one step per ``limit`` calls
+    for _ in range(5):
+        limit.acquire()
+        limit.release(ok=True, slow=False)
+    assert limit.limit == 5
+
+
+def test_dependency_call_records_outcomes_and_check_job_defers():
+    metrics.reset()
+    dep = breaker.Dependency("openai", breaker=make_breaker(Clock(), "openai"), limit=breaker.AdaptiveLimit("openai", maximum=4))
+    breaker._dependencies["openai"] = dep
+
+    def fail():
+        raise ServerError("upstream down")
+
+    for _ in range(4):
+        with pytest.raises(ServerError):
+            dep.call(fail)
+    assert dep.breaker.state == breaker.OPEN
+    assert dep.limit.limit == 1
+
+    with pytest.raises(breaker.DependencyUnavailable) as info:
+        breaker.check_job("research_summary")
+    assert info.value.dependency == "openai"
+    breaker.check_job("seed_safety_phrases")  # no upstream dependency: never gated
+
+    snap = breaker.snapshot()["openai"]
+    assert snap["state"] == breaker.OPEN and snap["last_error"].startswith("ServerError")
+    assert metrics.snapshot()["gauges"]["breaker_state.openai"] == 2.0
@@ -0,0 +1,80 @@
+from src.chunking import Chunker, count_tokens
+
+
+def _words(text):
+    return len(text.split())
+
+
+def _counter(text):
+    return _words(text)
+
+
+def test_chunks_respect_sentence_boundaries_and_budget():
+    sentences = [f"Sentence number {idx} talks about speech therapy minutes." for idx in range(40)]
+    page = {"page": 1, "text": " ".join(sentences)}
+    chunker = Chunker(target_tokens=40, overlap_tokens=0, token_counter=_counter)
+
+    chunks = list(chunker.chunk_pages([page]))
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.token_count <= 40
+        assert chunk.text.startswith("Sentence number")
+        assert chunk.text.endswith("minutes.")
+    rejoined = " ".join(chunk.text for chunk in chunks)
+    assert rejoined == page["text"]
+
+
+def test_overlap_repeats_trailing_sentences():
+    text = " ".join(f"S{idx} one two three four." for idx in range(12))
+    chunker = Chunker(target_tokens=20, overlap_tokens=5, token_counter=_counter)
+
+    chunks = list(chunker.chunk_pages([{"page": 3, "text": text}]))
+
+    assert len(chunks) >= 3
+    for prev, nxt in zip(chunks, chunks[1:]):
+        last_sentence = prev.text.rsplit(". ", 1)[-1].rstrip(".") + "."
+        assert nxt.text.startswith(last_sentence)
+
+
+def test_long_sentence_is_split_on_words():
+    text = " ".join(["word"] * 95)
+    chunks = list(Chunker(target_tokens=30, overlap_tokens=0, token_counter=_counter).chunk_pages([{"page": 1, "text": text}]))
+    assert [c.token_count for c in chunks] == [30, 30, 30, 5]
+    assert all(not c.text.startswith(" ") for c in chunks)
+
+
+def test_page_provenance_with_and_without_merging():
+    pages = [
+        {"page": 1, "text": "Alpha beta gamma.\n\nDelta epsilon."},
+        {"page": 2, "text": "Zeta eta theta."},
+        {"page": 3, "text": "   "},
+        {"page": 4, "text": "Iota kappa."},
+    ]
+    per_page = list(Chunker(target_tokens=100, overlap_tokens=0, token_counter=_counter).chunk_pages(pages))
+    assert [(c.page, c.pages) for c in per_page] == [(1, (1,)), (2, (2,)), (4, (4,))]
+    assert per_page[0].text == "Alpha beta gamma.\n\nDelta epsilon."
+
+    merged = list(
+        Chunker(target_tokens=100, overlap_tokens=0, merge_pages=True, token_counter=_counter).chunk_pages(pages)
+    )
+    assert len(merged) == 1
+    assert merged[0].page == 1 and merged[0].pages == (1, 2, 4)
+
+
+def test_chunker_consumes_pages_lazily():
+    consumed = []
+
+    def pages():
+        for idx in range(1, 100):
+            consumed.append(idx)
+            yield {"page": idx, "text": "Short page text."}
+
+    first = next(Chunker(target_tokens=50, token_counter=_counter).chunk_pages(pages()))
+    assert first.page == 1
+    assert consumed == [1, 2]
+
+
+def test_default_token_counter_is_positive():
+    assert count_tokens("") == 0
+    assert count_tokens("The student receives 30 minutes of speech therapy weekly.") >= 9
@@ -0,0 +1,155 @@
+import os
+import time
+
+import pytest
+
+from src import breaker, deadline  # type: ignore
+from src.jobs.registry import JobFailed, dispatch_job, registry  # type: ignore
+from src.metrics import metrics  # type: ignore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(deadline, "clock", fake)
+    return fake
+
+
+def test_parse_deadlines_and_per_kind_lookup(monkeypatch):
+    assert deadline.parse_deadlines("Goal_Smart=60, bad, x=abc,ingest_pdf=0") == {"goal_smart": 60.0, "ingest_pdf": 0.0}
+    monkeypatch.setattr(deadline, "JOB_DEADLINES", {"goal_smart": 60.0, "ingest_pdf": 0.0})
+    assert deadline.deadline_for("goal_smart") == 60.0
+    assert deadline.deadline_for("ingest_pdf") is None
+    assert deadline.deadline_for("research_summary") == deadline.JOB_DEADLINE_SECONDS
+
+
+def test_within_passes_remaining_budget_as_timeout(clock):
+    seen = []
+    assert deadline.within("openai", lambda **options: seen.append(options)) is None
+    assert deadline.within("internal_api", lambda **options: seen.append(options), cap=5) is None
+    with deadline.job_deadline(30):
+        clock.now += 10
+        deadline.within("openai", lambda **options: seen.append(options))
+        deadline.within("internal_api", lambda **options: seen.append(options), cap=5)
+    assert seen == [{}, {"timeout": 5}, {"timeout": 20.0}, {"timeout": 5}]
+
+
+def test_failures_after_the_deadline_become_deadline_exceeded(clock):
+    metrics.reset()
+
+    def hang(**options):
+        clock.now += options["timeout"]
+        raise TimeoutError("read timed out")
+
+    with deadline.job_deadline(10):
+        with pytest.raises(deadline.DeadlineExceeded) as info:
+            deadline.within("openai", hang)
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.check("db")
+    assert info.value.what == "openai"
+    assert metrics.snapshot()["counters"]["deadline_cancelled"] == {"openai": 1, "db": 1}
+    # Our budget running out is not an upstream failure
+    assert not breaker.is_dependency_failure(info.value)
+
+
+def test_run_kills_the_whole_process_group_at_the_deadline(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    started = time.monotonic()
+    with deadline.job_deadline(1.0):
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.run(["sh", "-c", f"sleep 30 & echo $! > {pid_file}; wait"], what="ocrmypdf", capture_output=True)
+    assert time.monotonic() - started < 10
+    # The backgrounded sleep was killed with its parent: gone, or a zombie awaiting reaping
+    grandchild = int(pid_file.read_text())
+    time.sleep(0.1)
+    stat = f"/proc/{grandchild}/stat"
+    if os.path.exists(stat):
+        with open(stat) as handle:
+            assert handle.read().split()[2] == "Z"
+
+
+def test_run_without_deadline_behaves_like_subprocess_run():
+    done = deadline.run(["sh", "-c", "echo hi"], what="sh", capture_output=True, check=True)
+    assert done.returncode == 0 and done.stdout.strip() == b"hi"
+
+
+def test_dispatch_stops_retrying_once_the_deadline_has_passed(clock, monkeypatch):
+    calls = []
+
+    def slow_handler(task):
+        calls.append(task)
+        clock.now += 20
+        raise RuntimeError("canceling statement due to statement timeout")
+
+    monkeypatch.setitem(registry.handlers, "slow_demo", slow_handler)
+    with deadline.job_deadline(15):
+        with pytest.raises(JobFailed) as info:
+            dispatch_job({"kind": "slow_demo"}, max_attempts=3, backoff_seconds=0)
+    assert len(calls) == 1
+    assert isinstance(info.value.error, deadline.DeadlineExceeded)
+
+
+def test_statement_timeout_is_set_from_the_remaining_budget(clock):
+    executed = []
+
+    class Conn:
+        def execute(self, sql, params):
+            executed.append(params)
+
+        def commit(self):
+            executed.append("commit")
+
+    deadline.apply_statement_timeout(Conn())
+    assert executed == []
+    with deadline.job_deadline(12.5):
+        deadline.apply_statement_timeout(Conn())
+    assert executed == [("12500",), "commit"]
+
+
+def test_llm_handlers_mark_the_row_and_let_the_deadline_reach_the_runner(monkeypatch):
+    import types
+
+    from src import main  # type: ignore
+
+    statements = []
+
+    class Conn:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *_exc):
+            return False
+
+        def execute(self, sql, params=()):
+            statements.append(sql)
+            return types.SimpleNamespace(fetchone=lambda: ({},) if sql.startswith("SELECT outline_json") else None)
+
+        def commit(self):
+            pass
+
+    def out_of_time(*_args, **_kwargs):
+        raise deadline.DeadlineExceeded("job deadline passed during openai", "openai")
+
+    segment = {"label": "O001", "page": 1, "text": "Services were not delivered.", "span_id": "s1"}
+    monkeypatch.setenv("DATABASE_URL", "postgresql://test")
+    monkeypatch.setattr(main, "_connect", lambda _url: Conn())
+    monkeypatch.setattr(main.psycopg, "connect", lambda _url: Conn())
+    monkeypatch.setattr(main, "_retrieve_segments", lambda *_args: [segment])
+    monkeypatch.setattr(main, "pack_for_job", lambda *_args: [types.SimpleNamespace(segments=[segment], label_map={})])
+    monkeypatch.setattr(main, "org_tier", lambda *_args: None)
+    monkeypatch.setattr(main, "_openai", lambda: None)
+    monkeypatch.setattr(main, "create_response", out_of_time)
+
+    with pytest.raises(JobFailed) as info:
+        dispatch_job({"kind": "build_advocacy_outline", "outline_id": "o1", "child_id": "c1"}, max_attempts=3, backoff_seconds=0)
+    assert isinstance(info.value.error, deadline.DeadlineExceeded)
+    assert info.value.attempts == 1
+    assert "UPDATE advocacy_outlines SET status='error', updated_at=NOW() WHERE id=%s" in statements
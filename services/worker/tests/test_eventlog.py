@@ -0,0 +1,61 @@
+import io
+import json
+import threading
+
+from src.eventlog import EventLogger, parse_sample_rates
+
+
+def test_event_logger_writes_batched_json_lines():
+    stream = io.StringIO()
+    logger = EventLogger(stream=stream, flush_interval=0.01, batch_size=10)
+    for idx in range(25):
+        logger.emit("job.start", job_id=f"job-{idx}")
+
+    assert logger.flush(timeout=2.0)
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["job_id"] for line in lines] == [f"job-{idx}" for idx in range(25)]
+    assert lines[0]["event"] == "job.start" and lines[0]["ts"].endswith("Z")
+    assert logger.stats()["written"] == 25
+
+
+def test_event_logger_samples_configured_events():
+    stream = io.StringIO()
+    draws = iter([0.05, 0.5, 0.9, 0.01])
+    logger = EventLogger(
+        stream=stream,
+        sample_rates=parse_sample_rates("job.attempt_failed=0.1, bogus, other=x"),
+        random_fn=lambda: next(draws),
+    )
+    for _ in range(4):
+        logger.emit("job.attempt_failed", attempt=1)
+    logger.emit("job.success")
+    logger.flush(timeout=2.0)
+
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [e["event"] for e in events] == ["job.attempt_failed", "job.attempt_failed", "job.success"]
+    assert events[0]["sample_rate"] == 0.1
+    assert logger.stats()["sampled_out"] == 2
+
+
+class _BlockingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.release.wait(5)
+        return super().write(data)
+
+
+def test_event_logger_drops_oldest_instead_of_blocking():
+    stream = _BlockingStream()
+    logger = EventLogger(stream=stream, capacity=5, flush_interval=0.01, batch_size=1)
+    logger.emit("first")
+    for idx in range(50):
+        logger.emit("burst", idx=idx)  # must return immediately while the writer is stuck
+
+    assert logger.stats()["dropped"] > 0
+    stream.release.set()
+    assert logger.flush(timeout=5.0)
+    written = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert written[-1]["idx"] == 49
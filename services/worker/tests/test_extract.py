@@ -0,0 +1,108 @@
+import json
+import types
+
+import pytest
+
+from src import extract  # type: ignore
+from src.jobs.registry import JobDeferred  # type: ignore
+
+
+def segments(count, words=30):
+    return [
+        {"label": f"I{i:03d}", "span_id": f"s{i}", "page": i, "text": " ".join(["word"] * words), "doc_name": "IEP"}
+        for i in range(1, count + 1)
+    ]
+
+
+def reply(payload):
+    content = types.SimpleNamespace(text=json.dumps(payload))
+    return types.SimpleNamespace(output=[types.SimpleNamespace(content=[content])])
+
+
+def test_merge_folds_duplicates_keeps_order_and_valid_citations():
+    label_map = {"I001": {}, "I002": {}, "I003": {}}
+    parts = [
+        {
+            "services": [{"name": "Speech Therapy", "minutes": None, "citations": ["I001", "bogus"]}],
+            "goals": [{"area": "Reading", "target": "80% accuracy", "citations": ["I001"]}],
+            "accommodations": [],
+            "placement": None,
+            "notes": ["Meeting held in person."],
+        },
+        {
+            "services": [
+                {"name": "speech therapy ", "minutes": 60, "frequency": "weekly", "citations": ["I003", "I001"]},
+                {"name": "OT", "citations": ["I002"]},
+            ],
+            "goals": [{"area": "Reading", "target": "Fluency 90 wpm", "citations": ["I002"]}],
+            "accommodations": [{"name": "Extended time", "citations": ["I003"]}],
+            "placement": "General education 80%",
+            "start_date": "2025-09-01",
+            "notes": ["meeting held in person"],
+        },
+    ]
+    merged = extract.merge_iep_extractions(parts, label_map)
+    assert merged["services"] == [
+        {"name": "Speech Therapy", "minutes": 60, "citations": ["I001", "I003"], "frequency": "weekly"},
+        {"name": "OT", "citations": ["I002"]},
+    ]
+    assert [goal["target"] for goal in merged["goals"]] == ["80% accuracy", "Fluency 90 wpm"]
+    assert merged["placement"] == "General education 80%"
+    assert merged["start_date"] == "2025-09-01" and merged["end_date"] is None
+    assert merged["notes"] == ["Meeting held in person."]
+    assert extract.merge_iep_extractions(parts, label_map) == merged
+
+
+def test_map_reduce_covers_every_window(monkeypatch):
+    seen = []
+
+    def fake_create_response(client, **request):
+        prompt = request["input"][1]["content"]
+        labels = [line.split("]")[0][1:] for line in prompt.splitlines() if line.startswith("[I")]
+        seen.append(labels)
+        return reply({"services": [{"name": f"Service {labels[0]}", "citations": labels[:1]}], "goals": [], "accommodations": []})
+
+    monkeypatch.setattr(extract, "create_response", fake_create_response)
+    monkeypatch.setattr(extract, "IEP_WINDOW_TOKENS", 200)
+    data = extract._map_reduce_extract(None, {"document_id": "doc-1"}, segments(20))
+
+    assert len(seen) > 1
+    assert sorted(label for labels in seen for label in labels) == [f"I{i:03d}" for i in range(1, 21)]
+    # Merged in window (page) order regardless of which call finished first
+    assert [service["citations"][0] for service in data["services"]] == sorted(labels[0] for labels in seen)
+
+
+def test_failed_window_is_noted_but_deferral_defers_the_job(monkeypatch):
+    def flaky(client, **request):
+        if "part 2 of" in request["input"][1]["content"]:
+            raise ValueError("bad json")
+        return reply({"services": [], "goals": [], "accommodations": []})
+
+    monkeypatch.setattr(extract, "create_response", flaky)
+    monkeypatch.setattr(extract, "IEP_WINDOW_TOKENS", 200)
+    data = extract._map_reduce_extract(None, {"document_id": "doc-1"}, segments(20))
+    assert data["notes"] and data["notes"][-1].startswith("Pages ")
+
+    def deferred(client, **request):
+        raise JobDeferred("rate limited")
+
+    monkeypatch.setattr(extract, "create_response", deferred)
+    with pytest.raises(JobDeferred):
+        extract._map_reduce_extract(None, {"document_id": "doc-1"}, segments(20))
+
+
+def test_eob_pages_reads_only_up_to_the_token_budget(monkeypatch):
+    monkeypatch.setattr(extract, "budget_for", lambda kind, model: 50)
+    read = []
+
+    def pages():
+        for n in range(1, 200):
+            read.append(n)
+            yield {"page": n, "text": "claim denied reason code " * 4}
+
+    kept = extract.eob_pages(pages())
+    # Every page the budget can use is kept, well past any fixed page cap
+    assert [page["page"] for page in kept] == read
+    assert 1 < len(read) < 10
+    monkeypatch.setattr(extract, "budget_for", lambda kind, model: 10**6)
+    assert len(extract.eob_pages({"page": n, "text": "line"} for n in range(1, 101))) == 100
@@ -0,0 +1,112 @@
+import http.client
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.httpd import start_health_server
+from src.state import WorkerState
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("INTERNAL_API_KEY", "test-key")
+    srv = start_health_server(WorkerState(), port=0, cache_seconds=30)
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def _get(url, headers=None):
+    req = urllib.request.Request(url, headers=headers or {})
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.status, resp.read().decode("utf-8")
+
+
+def test_health_endpoint_reports_state(server):
+    status, body = _get(f"{server}/health")
+    assert status == 200
+    assert json.loads(body)["state"]["consecutive_failures"] == 0
+
+
+def test_debug_endpoints_require_internal_key(server):
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        _get(f"{server}/debug/stacks")
+    assert exc.value.code == 403
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        _get(f"{server}/debug/stacks", {"x-internal-key": "wrong"})
+    assert exc.value.code == 403
+
+
+def test_debug_stacks_and_profile(server):
+    headers = {"x-internal-key": "test-key"}
+    status, body = _get(f"{server}/debug/stacks", headers)
+    assert status == 200
+    assert "MainThread" in body
+
+    status, body = _get(f"{server}/debug/profile?seconds=0.05&interval_ms=5&idle=1", headers)
+    assert status == 200
+    lines = [line for line in body.splitlines() if line]
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert ";" in stack
+    assert int(count) >= 1
+
+
+def test_debug_memory_toggles_tracemalloc(server):
+    headers = {"x-internal-key": "test-key"}
+    start = urllib.request.Request(f"{server}/debug/memory/start?frames=2", method="POST", headers=headers)
+    with urllib.request.urlopen(start, timeout=5) as resp:
+        assert json.loads(resp.read())["tracing"] is True
+    try:
+        retained = [bytearray(1024) for _ in range(64)]
+        status, body = _get(f"{server}/debug/memory?limit=5", headers)
+        report = json.loads(body)
+        assert status == 200
+        assert report["tracing"] is True
+        assert 0 < len(report["top"]) <= 5
+        assert retained
+    finally:
+        stop = urllib.request.Request(f"{server}/debug/memory/stop", method="POST", headers=headers)
+        with urllib.request.urlopen(stop, timeout=5) as resp:
+            assert json.loads(resp.read())["tracing"] is False
+
+
+def test_health_is_cached_and_served_over_keep_alive(server):
+    host, port = server.rsplit("//", 1)[1].split(":")
+    conn = http.client.HTTPConnection(host, int(port), timeout=5)
+    try:
+        bodies = []
+        for _ in range(3):
+            conn.request("GET", "/health")
+            resp = conn.getresponse()
+            assert resp.status == 200
+            assert resp.getheader("Connection") != "close"
+            bodies.append(resp.read())
+        assert bodies[0] == bodies[1] == bodies[2]
+    finally:
+        conn.close()
+
+
+def test_health_answers_while_profile_runs(server):
+    headers = {"x-internal-key": "test-key"}
+    results = {}
+
+    def profile():
+        results["profile"] = _get(f"{server}/debug/profile?seconds=1", headers)[0]
+
+    worker = threading.Thread(target=profile)
+    worker.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    status, _ = _get(f"{server}/health")
+    assert status == 200
+    assert time.monotonic() - started < 0.5
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        _get(f"{server}/debug/stacks", headers)
+    assert exc.value.code == 429
+    worker.join()
+    assert results["profile"] == 200
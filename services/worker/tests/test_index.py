@@ -0,0 +1,296 @@
+import types
+
+import pytest
+
+from src import index  # type: ignore
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def executemany(self, sql, rows):
+        target = self.conn.inserted if sql.startswith("INSERT") else self.conn.updated
+        target.append(list(rows))
+
+
+class FakeResult:
+    def __init__(self, row, rows=()):
+        self.row = row
+        self.rows = list(rows)
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConn:
+    def __init__(self, existing=(None, 0)):
+        self.existing = existing
+        self.spans = []
+        self.inserted = []
+        self.updated = []
+        self.commits = 0
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+        if sql.startswith("SELECT d.processed_at"):
+            return FakeResult(self.existing)
+        if sql.startswith("SELECT id::text"):
+            return FakeResult(None, self.spans)
+        return FakeResult(None)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakeOpenAI:
+    embedded_batches = []
+
+    def __init__(self, *args, **kwargs):
+        self.embeddings = types.SimpleNamespace(create=self._embed)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._summary))
+
+    def _embed(self, model, input):
+        FakeOpenAI.embedded_batches.append(list(input))
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=[0.1, 0.2]) for _ in input])
+
+    def _summary(self, **_kwargs):
+        message = types.SimpleNamespace(content="short summary")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def fake_env(monkeypatch):
+    conn = FakeConn()
+    FakeOpenAI.embedded_batches = []
+    monkeypatch.setattr(index, "DB_URL", "postgres://test")
+    monkeypatch.setattr(index, "OpenAI", FakeOpenAI)
+    monkeypatch.setattr(index.psycopg, "connect", lambda *_a, **_k: conn, raising=False)
+    monkeypatch.setattr(index, "_patch_job", lambda *_a, **_k: None)
+    return conn
+
+
+def test_batched_respects_item_and_token_limits():
+    items = [{"tokens": 10} for _ in range(5)] + [{"tokens": 100}]
+    batches = list(index._batched(items, max_items=2, max_tokens=50))
+    assert [len(b) for b in batches] == [2, 2, 1, 1]
+    assert batches[-1][0]["tokens"] == 100
+
+
+def test_embed_and_store_streams_batches(fake_env, monkeypatch):
+    monkeypatch.setattr(index, "EMBED_BATCH_SIZE", 2)
+    consumed = []
+
+    def pages():
+        for n in range(1, 6):
+            consumed.append(n)
+            yield {"page": n, "text": f"Page {n} covers reading goals."}
+
+    index.embed_and_store({"document_id": "doc-1", "org_id": "org-1"}, pages=pages())
+
+    assert consumed == [1, 2, 3, 4, 5]
+    assert [len(b) for b in FakeOpenAI.embedded_batches] == [2, 2, 1]
+    assert [len(rows) for rows in fake_env.inserted] == [2, 2, 1]
+    # One commit per embedded batch plus the processed_at update
+    assert fake_env.commits == 4
+    first_row = fake_env.inserted[0][0]
+    assert first_row[2] == 1
+    assert first_row[6].startswith("[Summary] short summary\n")
+    assert first_row[7] == "[0.1,0.2]"
+
+
+def test_org_context_is_set_again_after_every_commit(fake_env, monkeypatch):
+    monkeypatch.setattr(index, "EMBED_BATCH_SIZE", 1)
+    fake_env.existing = ("2024-01-01", 3)
+    fake_env.spans = [("span-stale", index._content_hash(9, "Removed paragraph."), index.EMBED_MODEL)]
+    commit = fake_env.commit
+
+    def recorded_commit():
+        fake_env.statements.append(("COMMIT", None))
+        commit()
+
+    fake_env.commit = recorded_commit
+    index.embed_and_store(
+        {"document_id": "doc-1", "org_id": "org-1", "reindex": True},
+        pages=[{"page": 1, "text": "Goal one."}, {"page": 2, "text": "Goal two."}],
+    )
+    transactions = [[]]
+    for sql, params in fake_env.statements:
+        if sql == "COMMIT":
+            transactions.append([])
+        else:
+            transactions[-1].append((sql, params))
+    # The stale-span DELETE and processed_at UPDATE run in the last transaction, after the batch commits
+    assert len(transactions) == 4 and transactions[-1] == [] and _deleted_ids(fake_env) == [["span-stale"]]
+    for statements in transactions[1:-1]:
+        assert statements[0] == ("SELECT set_config('request.jwt.org_id', %s, true)", ("org-1",))
+
+
+def test_failed_mode_check_fails_the_job_instead_of_indexing_in_full(fake_env):
+    execute = fake_env.execute
+
+    def failing_execute(sql, params=None):
+        if sql.startswith("SELECT d.processed_at"):
+            raise RuntimeError("canceling statement due to statement timeout")
+        return execute(sql, params)
+
+    fake_env.execute = failing_execute
+    with pytest.raises(RuntimeError):
+        index.embed_and_store({"document_id": "doc-1", "org_id": "org-1"}, pages=[{"page": 1, "text": "Goal one."}])
+    assert fake_env.inserted == [] and FakeOpenAI.embedded_batches == []
+
+
+def _deleted_ids(conn):
+    return [params[0] for sql, params in conn.statements if sql.startswith("DELETE FROM doc_spans")]
+
+
+def test_embed_and_store_resumes_partial_run(fake_env):
+    text = "Accommodations include extended time."
+    fake_env.existing = (None, 2)
+    fake_env.spans = [
+        ("span-kept", index._content_hash(1, text), index.EMBED_MODEL),
+        ("span-legacy", None, None),
+    ]
+    index.embed_and_store(
+        {"document_id": "doc-1", "org_id": "org-1"},
+        pages=[{"page": 1, "text": text}, {"page": 2, "text": "Speech therapy twice weekly."}],
+    )
+    assert [len(rows) for rows in fake_env.inserted] == [1]
+    assert fake_env.inserted[0][0][2] == 2
+    assert _deleted_ids(fake_env) == [["span-legacy"]]
+
+
+def test_reindex_embeds_only_changed_chunks(fake_env):
+    kept, moved = "Goal one: reading fluency.", "Goal two: math facts."
+    fake_env.existing = ("2024-01-01", 3)
+    fake_env.spans = [
+        ("span-kept", index._content_hash(1, kept), index.EMBED_MODEL),
+        ("span-old-model", index._content_hash(2, moved), "text-embedding-ada-002"),
+        ("span-stale", index._content_hash(3, "Removed paragraph."), index.EMBED_MODEL),
+    ]
+    index.embed_and_store(
+        {"document_id": "doc-1", "org_id": "org-1", "reindex": True},
+        pages=[
+            {"page": 1, "text": kept},
+            {"page": 2, "text": moved},
+            {"page": 3, "text": "Brand new paragraph."},
+        ],
+    )
+    assert len(FakeOpenAI.embedded_batches) == 1
+    assert len(FakeOpenAI.embedded_batches[0]) == 2
+    assert [row[-1] for row in fake_env.updated[0]] == ["span-old-model"]
+    assert [row[2] for row in fake_env.inserted[0]] == [3]
+    assert _deleted_ids(fake_env) == [["span-stale"]]
+
+
+def test_reindex_keeps_spans_when_no_text(fake_env):
+    fake_env.existing = ("2024-01-01", 1)
+    fake_env.spans = [("span-kept", "abc", index.EMBED_MODEL)]
+    index.embed_and_store({"document_id": "doc-1", "reindex": True}, pages=[{"page": 1, "text": ""}])
+    assert _deleted_ids(fake_env) == []
+
+
+def test_embed_and_store_skips_processed_document(fake_env):
+    fake_env.existing = ("2024-01-01", 4)
+    index.embed_and_store({"document_id": "doc-1"}, pages=[{"page": 1, "text": "Hello."}])
+    assert fake_env.inserted == []
+    assert FakeOpenAI.embedded_batches == []
+
+
+def test_hashing_embeddings_are_deterministic_and_similarity_aware():
+    provider = index.HashingEmbeddings(dims=256)
+    texts = [
+        "Speech therapy twice weekly for articulation.",
+        "Articulation speech therapy two times weekly.",
+        "Bus transportation pickup at 7am.",
+    ]
+    first = provider.embed(texts)
+    again = index.HashingEmbeddings(dims=256).embed(texts)
+    assert first.vectors == again.vectors
+    assert first.model == "local-hash-v1-256"
+
+    def dot(a, b):
+        return sum(x * y for x, y in zip(a, b))
+
+    a, b, c = first.vectors
+    assert abs(dot(a, a) - 1.0) < 1e-5
+    assert dot(a, b) > dot(a, c)
+
+
+def test_hashing_embeddings_match_without_numpy(monkeypatch):
+    texts = ["Reading goal: 90 words per minute.", ""]
+    expected = index.HashingEmbeddings(dims=64).embed(texts).vectors
+    monkeypatch.setattr(index, "np", None)
+    fallback = index.HashingEmbeddings(dims=64).embed(texts).vectors
+    assert fallback[1] == [0.0] * 64
+    assert all(abs(x - y) < 1e-5 for x, y in zip(expected[0], fallback[0]))
+
+
+def test_fallback_embeddings_used_on_rate_limit():
+    class RateLimited(Exception):
+        status_code = 429
+
+    class Primary:
+        name = "text-embedding-3-small"
+
+        def embed(self, texts):
+            raise RateLimited("slow down")
+
+    provider = index.FallbackEmbeddings(Primary(), index.HashingEmbeddings(dims=32))
+    result = provider.embed(["hello world"])
+    assert result.model == "local-hash-v1-32"
+    assert provider.name == "text-embedding-3-small"
+
+
+def test_embed_and_store_runs_offline_with_local_provider(fake_env, monkeypatch):
+    monkeypatch.setattr(index, "INDEX_PAGE_SUMMARIES", False)
+    index.embed_and_store(
+        {"document_id": "doc-1", "org_id": "org-1"},
+        pages=[{"page": 1, "text": "Extended time on tests."}],
+        provider=index.HashingEmbeddings(dims=16),
+    )
+    assert FakeOpenAI.embedded_batches == []
+    row = fake_env.inserted[0][0]
+    assert row[6] == "Extended time on tests."
+    assert row[-1] == "local-hash-v1-16"
+
+
+def test_reindex_document_requeues_ingest_with_the_reindex_flag(monkeypatch):
+    import json
+
+    from src import main  # type: ignore
+
+    class Conn(FakeConn):
+        def execute(self, sql, params=None):
+            self.statements.append((sql, params))
+            if sql.startswith("SELECT storage_uri"):
+                return FakeResult(("org-1/doc-1.pdf", "IEP 2024.pdf", "child-1", "org-1"))
+            return FakeResult(None)
+
+    pushed = []
+    monkeypatch.setenv("DATABASE_URL", "postgres://test")
+    monkeypatch.setattr(main, "_connect", lambda _url: Conn())
+    monkeypatch.setattr(main, "r", types.SimpleNamespace(rpush=lambda queue, payload: pushed.append(json.loads(payload))))
+    main.handle_reindex_document({"document_id": "doc-1"})
+    [job] = pushed
+    assert job["kind"] == "ingest_pdf" and job["reindex"] is True
+    assert (job["s3_key"], job["filename"], job["org_id"]) == ("org-1/doc-1.pdf", "IEP 2024.pdf", "org-1")
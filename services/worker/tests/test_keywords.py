@@ -0,0 +1,81 @@
+from src import classify, segments  # type: ignore
+from src.keywords import KeywordMatcher, KeywordScorer  # type: ignore
+from src.main import _score_eob_span, _score_research_span, _score_span  # type: ignore
+
+
+TEXTS = [
+    "Speech therapy 30 minutes per week",
+    "Administrative note",
+    "",
+    "The team will MONITOR progress; supports listed.",
+    "Claim denied: reason code CO-50. Appeal within 180 days as the next step. " * 2,
+    "Summary: percentile score shows strengths and needs",
+]
+
+
+def _reference(rules, text):
+    lower = text.lower()
+    return sorted(name for name, terms in rules.items() if any(term in lower for term in terms))
+
+
+def test_matches_agree_with_substring_checks():
+    rules = {"minutes": ["minute", "min"], "admin": ["admin"], "week": ["per week", "week"]}
+    matcher = KeywordMatcher(rules)
+    for text in TEXTS:
+        assert sorted(matcher.hits(text)) == _reference(rules, text)
+
+
+def test_shorter_prefix_terms_are_credited():
+    matcher = KeywordMatcher({"long": ["minute"], "short": ["min"]})
+    assert matcher.hits("30 minutes") == {"long": 1, "short": 1}
+
+
+def test_hits_count_every_occurrence_once_per_rule():
+    matcher = KeywordMatcher({"minutes": ["minute", "min"], "goal": ["goal"]})
+    assert matcher.hits("Goal: 20 min, then 10 minutes; goal met") == {"minutes": 2, "goal": 2}
+
+
+def test_batch_scan_matches_per_text_scan():
+    matcher = KeywordMatcher({"a": ["speech", "therapy"], "b": ["denied", "appeal"], "c": ["note"]})
+    assert matcher.hits_batch(TEXTS) == [matcher.hits(text) for text in TEXTS]
+    # A term can't straddle two texts of the batch
+    assert KeywordMatcher({"x": ["ab"]}).hits_batch(["a", "b"]) == [{}, {}]
+
+
+def test_span_scorers_keep_their_weights():
+    assert _score_span("Speech therapy 30 minutes per week") == 1 + 3 + 2 + 1
+    assert _score_research_span("Summary: percentile score shows strengths and needs") == 1 + 3 + 2 + 1
+    long_denial = TEXTS[4]
+    assert _score_eob_span(long_denial) == 1 + 3 + 2 + 2 + 1
+    assert _score_eob_span("denied") == 4
+    scorer = KeywordScorer({"x": (("a",), 2)})
+    assert scorer.score_batch(TEXTS) == [scorer(text) for text in TEXTS]
+
+
+def test_local_fallback_scores_the_scan_in_one_batch():
+    calls = []
+
+    class Scorer(KeywordScorer):
+        def score_batch(self, texts):
+            calls.append(list(texts))
+            return super().score_batch(texts)
+
+    class Conn:
+        def execute(self, sql, params):
+            return self
+
+        def fetchall(self):
+            return [(1, 1, "  goal  "), (2, 2, "x"), (3, 3, "service goal")]
+
+    scored = segments._fetch_scored_locally(Conn(), "doc", 10, 4, 3, Scorer({"g": (("goal",), 2), "s": (("service",), 1)}))
+    assert calls == [["goal", "service goal"]]
+    assert [(span_id, score) for span_id, _, _, score in scored] == [(3, 4), (1, 3)]
+
+
+def test_classify_heuristics():
+    result = classify.heuristics("Jan_EOB_denial.pdf", "Speech and OT services; reading support, medical device")
+    assert result["doc_type"] == "eob"
+    assert result["domains"] == ["academic", "assistive_technology", "medical", "occupational_therapy", "speech_language"]
+    assert classify.heuristics("therapy-evaluation.pdf")["doc_type"] == "therapy_notes"
+    assert classify.heuristics("Re-Eval 2024.pdf")["doc_type"] == "eval_report"
+    assert classify.heuristics("", "") == {"doc_type": None, "domains": []}
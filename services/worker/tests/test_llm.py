@@ -0,0 +1,128 @@
+import json
+import types
+
+from src import llm  # type: ignore
+
+
+class FakeRedis:
+    """Just enough of redis-py (decode_responses=True) for ResponseCache."""
+
+    def __init__(self):
+        self.values = {}
+        self.zsets = {}
+        self.hashes = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = str(value)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def incrby(self, key, amount):
+        value = int(self.values.get(key, 0)) + amount
+        self.values[key] = str(value)
+        return value
+
+    def zadd(self, key, mapping, xx=False):
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if xx and member not in zset:
+                continue
+            zset[member] = score
+
+    def zrem(self, key, member):
+        self.zsets.get(key, {}).pop(member, None)
+
+    def zrange(self, key, start, end):
+        ordered = sorted(self.zsets.get(key, {}).items(), key=lambda item: item[1])
+        return [member for member, _ in ordered[start : end + 1]]
+
+    def zrangebyscore(self, key, low, high):
+        return [m for m, s in sorted(self.zsets.get(key, {}).items(), key=lambda i: i[1]) if s <= high]
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value)
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+
+class FakeClient:
+    def __init__(self, text='{"ok": true}'):
+        self.calls = []
+        self.text = text
+        self.responses = types.SimpleNamespace(create=self.create)
+
+    def create(self, **request):
+        self.calls.append(request)
+        content = types.SimpleNamespace(text=self.text)
+        return types.SimpleNamespace(output=[types.SimpleNamespace(content=[content])])
+
+
+SCHEMA = {"type": "json_schema", "json_schema": {"name": "X", "schema": {"type": "object"}}}
+
+
+def call(client, cache, kind="research_summary", user="hello", **kwargs):
+    return llm.create_response(
+        client,
+        kind=kind,
+        model="gpt-5-mini",
+        input=[{"role": "system", "content": "sys"}, {"role": "user", "content": user}],
+        response_format=SCHEMA,
+        cache=cache,
+        **kwargs,
+    )
+
+
+def test_identical_request_is_served_from_cache():
+    client, cache = FakeClient(), llm.ResponseCache(FakeRedis())
+    first = call(client, cache)
+    second = call(client, cache)
+    assert len(client.calls) == 1
+    assert llm.response_text(second) == llm.response_text(first)
+    assert second.cached is True
+    call(client, cache, user="different prompt")
+    assert len(client.calls) == 2
+
+
+def test_bypass_and_uncached_kinds_always_call_the_model():
+    client, cache = FakeClient(), llm.ResponseCache(FakeRedis())
+    call(client, cache)
+    call(client, cache, bypass=True)
+    call(client, cache, kind="generate_safety_phrase")
+    call(client, cache, kind="generate_safety_phrase")
+    assert len(client.calls) == 4
+
+
+def test_invalid_json_is_not_cached():
+    client, cache = FakeClient(text="not json"), llm.ResponseCache(FakeRedis())
+    call(client, cache)
+    call(client, cache)
+    assert len(client.calls) == 2
+
+
+def test_size_bound_evicts_least_recently_used():
+    now = [1000.0]
+    redis_client = FakeRedis()
+    cache = llm.ResponseCache(redis_client, max_bytes=25, clock=lambda: now[0])
+    for name in ("a", "b", "c"):
+        now[0] += 1
+        cache.put(f"k:{name}", json.dumps({"v": name * 3}))
+    now[0] += 1
+    assert cache.get("k:a") is None
+    assert cache.get("k:b") is not None
+    assert int(redis_client.get(cache.total_key)) <= 25
+    assert set(redis_client.hashes[cache.sizes_key]) == {"k:b", "k:c"}
+
+
+def test_request_key_covers_schema_and_options():
+    base = {"model": "m", "input": [{"role": "user", "content": "x"}]}
+    assert llm.request_key(base) == llm.request_key(dict(base))
+    assert llm.request_key(base) != llm.request_key({**base, "response_format": SCHEMA})
+    assert llm.request_key(base) != llm.request_key({**base, "model": "other"})
@@ -18,3 +18,19 @@ def test_metrics_snapshot_updates():
     assert snapshot["queue_depths"]["jobs"] == 3
     assert snapshot["latency_seconds"]["demo"]["max"] == 0.5
     assert snapshot["latency_seconds"]["demo"]["count"] == 1
+
+
+def test_metrics_job_memory_histogram():
+    worker_metrics.reset()
+    mib = 1024 * 1024
+    worker_metrics.record_job_memory("ingest_pdf", 100 * mib, 110 * mib, 300 * mib)
+
+    snapshot = worker_metrics.snapshot()
+    peak = snapshot["histograms"]["job_peak_rss_bytes"]["ingest_pdf"]
+    assert peak["count"] == 1
+    assert peak["buckets"][str(256 * mib)] == 0
+    assert peak["buckets"][str(384 * mib)] == 1
+    assert peak["buckets"]["+Inf"] == 1
+    retained = snapshot["histograms"]["job_retained_rss_bytes"]["ingest_pdf"]
+    assert retained["max"] == 10 * mib
+    assert snapshot["gauges"]["rss_bytes"] == 110 * mib
@@ -0,0 +1,72 @@
+from src import packing  # type: ignore
+
+
+def words(text):
+    return len(text.split())
+
+
+def seg(label, text, page=1, span_id=None):
+    return {"label": label, "span_id": span_id or label, "page": page, "text": text, "which": "latest"}
+
+
+def test_budget_lookup_prefers_model_specific_override():
+    overrides = packing.parse_budgets("goal_smart=1000, gpt-5:goal_smart=4000,bad=x,missing")
+    assert overrides == {"goal_smart": 1000, "gpt-5:goal_smart": 4000}
+    assert packing.budget_for("goal_smart", "gpt-5", overrides) == 4000
+    assert packing.budget_for("goal_smart", "gpt-5-mini", overrides) == 1000
+    assert packing.budget_for("prep_iep_diff", None, {}) == packing.DEFAULT_BUDGETS["prep_iep_diff"]
+    assert packing.budget_for("unknown_kind", None, {}) == packing.PROMPT_TOKEN_BUDGET
+
+
+def test_trim_to_tokens_cuts_on_word_boundary():
+    assert packing.trim_to_tokens("one two three four five", 3, words) == "one two three"
+    assert packing.trim_to_tokens("short", 10, words) == "short"
+    assert packing.trim_to_tokens("anything", 0, words) == ""
+
+
+def test_pack_segments_greedy_fill_dedupe_and_relabel():
+    segments = [
+        seg("L001", "Speech therapy 60 minutes weekly in the resource room with the SLP."),
+        seg("L002", "Speech therapy 60 minutes weekly in the resource room with the SLP!"),
+        seg("L003", " ".join(["filler"] * 40)),
+        seg("L004", "Goal: reads 90 words per minute by June."),
+    ]
+    packed = packing.pack_segments(segments, budget=30, counter=words, max_segment_tokens=100)
+    assert [s["span_id"] for s in packed.segments] == ["L001", "L004"]
+    assert [s["label"] for s in packed.segments] == ["L001", "L002"]
+    assert packed.label_map["L002"]["span_id"] == "L004"
+    assert packed.duplicates == 1
+    assert packed.dropped == 1
+    assert packed.tokens_used <= 30
+    # inputs are not relabelled in place
+    assert segments[3]["label"] == "L004"
+
+
+def test_pack_segments_trims_long_excerpts():
+    packed = packing.pack_segments(
+        [seg("R001", " ".join(f"w{i}" for i in range(50)))], budget=100, counter=words, max_segment_tokens=10
+    )
+    assert words(packed.segments[0]["text"]) == 10
+    assert packed.trimmed == 1
+
+
+def test_pack_for_job_rolls_unused_share_forward():
+    latest = [seg("L001", "alpha beta gamma delta")]
+    previous = [seg(f"P{i:03d}", f"previous excerpt number {i} unique{i}") for i in range(1, 20)]
+    latest_pack, previous_pack = packing.pack_for_job("prep_iep_diff", None, [latest, previous], budget=60, shares=[0.6])
+    assert latest_pack.budget == 36
+    assert previous_pack.budget == 60 - latest_pack.tokens_used
+    assert latest_pack.tokens_used + previous_pack.tokens_used <= 60
+    # identical text in different groups is not treated as a duplicate
+    same = packing.pack_for_job("x", None, [latest, latest], budget=100)
+    assert [len(p.segments) for p in same] == [1, 1]
+
+
+def test_split_windows_keeps_every_segment_and_label():
+    segments = [seg(f"I{i:03d}", " ".join(["w"] * 10), page=i) for i in range(1, 8)]
+    windows = packing.split_windows(segments, 30, counter=words)
+    assert [len(w.segments) for w in windows] == [2, 2, 2, 1]
+    assert [s["label"] for w in windows for s in w.segments] == [f"I{i:03d}" for i in range(1, 8)]
+    assert all(w.tokens_used <= 30 for w in windows)
+    [single] = packing.split_windows([seg("I001", " ".join(["w"] * 100))], 30, counter=words)
+    assert single.trimmed == 1 and single.tokens_used <= 30
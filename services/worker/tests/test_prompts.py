@@ -0,0 +1,50 @@
+import types
+
+from src import extract, llm, prompts  # type: ignore
+from src.metrics import metrics  # type: ignore
+from src.packing import split_windows  # type: ignore
+
+
+def test_build_messages_orders_stable_content_first():
+    [system, user] = prompts.build_messages(
+        "sys",
+        instructions=["Do the thing."],
+        documents=["Excerpts:", "[A001] text"],
+        request=["Child ID: c-1", None],
+    )
+    assert system == {"role": "system", "content": "sys"}
+    assert user["content"] == "Do the thing.\nExcerpts:\n[A001] text\nChild ID: c-1"
+
+
+def test_requests_for_the_same_document_share_everything_but_the_tail():
+    first = prompts.build_messages("sys", instructions=["Rewrite."], documents=["[G001] long excerpt"], request=["goal one"])
+    second = prompts.build_messages("sys", instructions=["Rewrite."], documents=["[G001] long excerpt"], request=["goal two"])
+    shared = first[1]["content"][: -len("goal one")]
+    assert second[1]["content"].startswith(shared)
+
+
+def test_iep_window_number_comes_after_the_excerpts():
+    segments = [{"label": f"I{i:03d}", "page": i, "text": "words " * 40} for i in range(1, 7)]
+    windows = split_windows(segments, 120)
+    content = extract._iep_messages(windows[1], 2, len(windows))[1]["content"]
+    assert content.index("[I") < content.index("part 2 of")
+
+
+def test_prompt_token_usage_reads_responses_and_chat_shapes():
+    responses = types.SimpleNamespace(input_tokens=1200, input_tokens_details=types.SimpleNamespace(cached_tokens=1024))
+    assert prompts.prompt_token_usage(responses) == (1200, 1024)
+    chat = {"prompt_tokens": 300, "prompt_tokens_details": {"cached_tokens": None}}
+    assert prompts.prompt_token_usage(chat) == (300, 0)
+    assert prompts.prompt_token_usage(None) == (None, 0)
+
+
+def test_create_response_counts_cached_prompt_tokens():
+    metrics.reset()
+    usage = types.SimpleNamespace(input_tokens=2048, input_tokens_details=types.SimpleNamespace(cached_tokens=1536))
+    client = types.SimpleNamespace(
+        responses=types.SimpleNamespace(create=lambda **request: llm.CachedResponse.from_text("hi", usage=usage, cached=False))
+    )
+    llm.create_response(client, kind="generate_safety_phrase", model="m", input=[{"role": "user", "content": "x"}])
+    counters = metrics.snapshot()["counters"]
+    assert counters["llm_prompt_tokens"]["generate_safety_phrase"] == 2048
+    assert counters["llm_cached_prompt_tokens"]["generate_safety_phrase"] == 1536
@@ -0,0 +1,107 @@
+import types
+
+import pytest
+
+from src import ratelimit  # type: ignore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(clock, limits=None, max_wait=20.0):
+    return ratelimit.RateLimiter(
+        limits=limits or {"m": (60, 6000)},
+        headroom=1.0,
+        max_wait_seconds=max_wait,
+        sleep=clock.sleep,
+        local=ratelimit.LocalBuckets(clock=clock),
+    )
+
+
+def test_parse_limits_reads_rpm_and_tpm_per_model():
+    assert ratelimit.parse_limits("gpt-5-mini=500:200000, bad=1,x=a:b") == {"gpt-5-mini": (500, 200000)}
+
+
+def test_acquire_blocks_until_bucket_refills():
+    clock = Clock()
+    limiter = make_limiter(clock, limits={"m": (60, 600)})
+    limiter.acquire("m", 600)
+    assert clock.sleeps == []
+    limiter.acquire("m", 100)
+    # 600 tpm refills 10 tokens/s, so 100 tokens need ~10s
+    assert 10.0 <= sum(clock.sleeps) <= 10.3
+
+
+def test_acquire_defers_when_wait_exceeds_budget():
+    clock = Clock()
+    limiter = make_limiter(clock, limits={"m": (60, 600)}, max_wait=2.0)
+    limiter.acquire("m", 600)
+    with pytest.raises(ratelimit.RateLimited) as info:
+        limiter.acquire("m", 300)
+    assert info.value.delay_seconds == pytest.approx(30.0)
+
+
+def test_reconcile_returns_unused_estimate():
+    clock = Clock()
+    limiter = make_limiter(clock, limits={"m": (60, 1000)})
+    response = types.SimpleNamespace(usage=types.SimpleNamespace(total_tokens=100))
+    limiter.call("m", 1000, lambda: response)
+    # 900 of the 1000 estimated tokens were credited back
+    limiter.acquire("m", 900)
+    assert clock.sleeps == []
+
+
+def test_upstream_429_becomes_deferral_with_retry_after():
+    class RateLimitError(Exception):
+        status_code = 429
+        response = types.SimpleNamespace(headers={"retry-after": "7"})
+
+    def fail():
+        raise RateLimitError("slow down")
+
+    limiter = make_limiter(Clock())
+    with pytest.raises(ratelimit.RateLimited) as info:
+        limiter.call("m", 10, fail)
+    assert info.value.delay_seconds == 7.0
+    assert ratelimit.is_rate_limited(info.value)
+
+
+def test_redis_scripts_receive_both_buckets():
+    calls = []
+
+    class Script:
+        def __init__(self, name):
+            self.name = name
+
+        def __call__(self, keys, args):
+            calls.append((self.name, keys, args))
+            return [1, "0"] if self.name == "take" else 1
+
+    class FakeRedis:
+        def __init__(self):
+            self.scripts = iter(["take", "reconcile"])
+
+        def register_script(self, _source):
+            return Script(next(self.scripts))
+
+    limiter = ratelimit.RateLimiter(FakeRedis(), limits={"gpt-5-mini": (100, 10000)}, headroom=0.9)
+    limiter.call("gpt-5-mini", 500, lambda: types.SimpleNamespace(usage=types.SimpleNamespace(total_tokens=200)))
+    assert calls[0] == ("take", ["ratelimit:{gpt-5-mini}:req", "ratelimit:{gpt-5-mini}:tok"], [90, 1, 9000, 500])
+    assert calls[1] == ("reconcile", ["ratelimit:{gpt-5-mini}:tok"], [9000, 300])
+
+
+def test_usage_tokens_reads_responses_and_embeddings_usage():
+    assert ratelimit.usage_tokens(types.SimpleNamespace(usage=types.SimpleNamespace(total_tokens=42))) == 42
+    usage = types.SimpleNamespace(total_tokens=None, input_tokens=10, output_tokens=5)
+    assert ratelimit.usage_tokens(types.SimpleNamespace(usage=usage)) == 15
+    assert ratelimit.usage_tokens(types.SimpleNamespace()) is None
@@ -0,0 +1,127 @@
+import contextlib
+import types
+
+from src import retrieval, segments  # type: ignore
+
+PROFILE = retrieval.QueryProfile("iep_diff", "service minutes and goals", segments.IEP_PROFILE)
+
+
+class CountingProvider:
+    name = "test-embed"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        return types.SimpleNamespace(vectors=[[0.5, 0.5] for _ in texts], model=self.name)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConn:
+    def __init__(self, hybrid_rows=None, keyword_rows=None, fail_hybrid=False):
+        self.hybrid_rows = hybrid_rows or []
+        self.keyword_rows = keyword_rows or []
+        self.fail_hybrid = fail_hybrid
+        self.queries = []
+
+    @contextlib.contextmanager
+    def transaction(self):
+        yield
+
+    def execute(self, sql, params):
+        self.queries.append((sql, list(params)))
+        if sql.startswith("WITH vec"):
+            if self.fail_hybrid:
+                raise RuntimeError("operator does not exist: vector <=> unknown")
+            return FakeResult(self.hybrid_rows)
+        return FakeResult(self.keyword_rows)
+
+
+def test_query_embedding_is_cached_per_provider_and_text():
+    cache = retrieval.QueryEmbeddingCache(capacity=2)
+    provider = CountingProvider()
+    cache.get(provider, "a")
+    cache.get(provider, "a")
+    cache.get(provider, "b")
+    cache.get(provider, "c")
+    cache.get(provider, "a")
+    assert provider.calls == 4
+    assert cache.hits == 1
+
+
+def test_fallback_query_vectors_are_not_cached_or_searched():
+    class RateLimitedProvider(CountingProvider):
+        def embed(self, texts):
+            self.calls += 1
+            return types.SimpleNamespace(vectors=[[0.1, 0.9] for _ in texts], model="local-hash-v1-1536")
+
+    cache = retrieval.QueryEmbeddingCache()
+    provider = RateLimitedProvider()
+    conn = FakeConn(keyword_rows=[("s1", 2, "Goal: reading fluency.", 2.0)])
+    result = retrieval.hybrid_segments(
+        conn, "doc-1", PROFILE, prefix="L", doc_name="IEP", which="latest", limit=5, provider=provider, cache=cache
+    )
+    assert [seg["span_id"] for seg in result] == ["s1"]
+    assert not any(sql.startswith("WITH vec") for sql, _ in conn.queries)
+    retrieval.hybrid_segments(
+        conn, "doc-1", PROFILE, prefix="L", doc_name="IEP", which="latest", limit=5, provider=provider, cache=cache
+    )
+    assert provider.calls == 2 and cache.hits == 0
+
+
+def test_hybrid_query_binds_every_placeholder():
+    sql, build = retrieval._hybrid_sql(segments.IEP_PROFILE)
+    params = build("[0.5,0.5]", "doc-1", 50, 60, 10)
+    assert sql.count("%s") == len(params)
+
+
+def test_hybrid_segments_uses_fused_ranking():
+    conn = FakeConn(hybrid_rows=[("s9", 4, "Speech therapy 60 minutes weekly.", 0.032), ("s2", 1, "Goal text", 0.016)])
+    result = retrieval.hybrid_segments(
+        conn,
+        "doc-1",
+        PROFILE,
+        prefix="L",
+        doc_name="IEP",
+        which="latest",
+        limit=5,
+        provider=CountingProvider(),
+        cache=retrieval.QueryEmbeddingCache(),
+        include_score=True,
+    )
+    assert [seg["span_id"] for seg in result] == ["s9", "s2"]
+    assert result[0]["label"] == "L001"
+    assert len(conn.queries) == 1
+
+
+def test_hybrid_segments_falls_back_to_keywords():
+    rows = [("s1", 2, "Accommodations: extended time on tests.", 3.0)]
+    failing = FakeConn(keyword_rows=rows, fail_hybrid=True)
+    result = retrieval.hybrid_segments(
+        failing,
+        "doc-1",
+        PROFILE,
+        prefix="R",
+        doc_name="Eval",
+        which="previous",
+        limit=5,
+        provider=CountingProvider(),
+        cache=retrieval.QueryEmbeddingCache(),
+    )
+    assert [seg["span_id"] for seg in result] == ["s1"]
+    assert "ts_rank_cd" in failing.queries[-1][0]
+
+    no_provider = FakeConn(keyword_rows=rows)
+    result = retrieval.hybrid_segments(
+        no_provider, "doc-1", PROFILE, prefix="R", doc_name="Eval", which="previous", limit=5
+    )
+    assert len(no_provider.queries) == 1
+    assert result[0]["label"] == "R001"
@@ -0,0 +1,110 @@
+import types
+
+from src import llm, ratelimit, routing  # type: ignore
+from src.metrics import metrics  # type: ignore
+
+TABLE = routing.parse_routes(
+    """[
+      {"name": "small", "kinds": ["goal_smart"], "from_models": ["mini"], "max_prompt_tokens": 100, "model": "nano"},
+      {"name": "pro-large", "kinds": "*", "tiers": ["pro"], "min_prompt_tokens": 5000, "model": "large"},
+      {"name": "spill", "tiers": ["free"], "from_models": ["mini"], "max_headroom": 0.2, "model": "nano"}
+    ]"""
+)
+
+
+class Headroom:
+    def __init__(self, **levels):
+        self.levels = levels
+        self.asked = []
+
+    def remaining(self, model):
+        self.asked.append(model)
+        return self.levels.get(model, 1.0)
+
+
+def test_small_prompts_of_listed_kinds_go_to_the_small_model():
+    route = routing.choose_model("goal_smart", "mini", 80, routes=TABLE, limiter=Headroom())
+    assert (route.name, route.model, route.requested) == ("small", "nano", "mini")
+    assert routing.choose_model("goal_smart", "mini", 400, routes=TABLE).model == "mini"
+    assert routing.choose_model("research_summary", "mini", 80, routes=TABLE).name == "default"
+
+
+def test_tier_and_headroom_gate_routes():
+    limiter = Headroom(nano=0.05)
+    # Target model nearly out of budget: keep the requested one
+    assert routing.choose_model("goal_smart", "mini", 80, routes=TABLE, limiter=limiter).name == "default"
+    assert routing.choose_model("prep_iep_diff", "mini", 9000, tier="pro", routes=TABLE).model == "large"
+    assert routing.choose_model("prep_iep_diff", "mini", 9000, tier="free", routes=TABLE).model == "mini"
+
+    congested = Headroom(mini=0.1)
+    route = routing.choose_model("denial_explain", "mini", 3000, tier="free", routes=TABLE, limiter=congested)
+    assert route.name == "spill" and route.model == "nano"
+    assert routing.choose_model("denial_explain", "mini", 3000, tier="free", routes=TABLE, limiter=Headroom()).name == "default"
+
+
+def test_invalid_table_falls_back_to_defaults():
+    assert [rule.name for rule in routing.parse_routes("not json")] == [rule["name"] for rule in routing.DEFAULT_ROUTES]
+
+
+def test_headroom_reads_local_bucket_without_debiting():
+    now = [0.0]
+    limiter = ratelimit.RateLimiter(limits={"m": (60, 600)}, headroom=1.0, local=ratelimit.LocalBuckets(clock=lambda: now[0]))
+    assert limiter.remaining("m") == 1.0
+    limiter.acquire("m", 450)
+    assert limiter.remaining("m") == 0.25
+    assert limiter.remaining("m") == 0.25
+    now[0] += 30  # half a minute refills half the bucket
+    assert limiter.remaining("m") == 0.75
+
+
+def test_create_response_sends_to_the_routed_model_and_caches_under_the_requested_one(monkeypatch):
+    metrics.reset()
+    monkeypatch.setattr(routing, "MODEL_ROUTES", TABLE)
+    sent = []
+
+    def create(**request):
+        sent.append(request["model"])
+        return llm.CachedResponse.from_text("{}", cached=False)
+
+    client = types.SimpleNamespace(responses=types.SimpleNamespace(create=create))
+    cache = types.SimpleNamespace(entries={})
+    cache.get = cache.entries.get
+    cache.put = cache.entries.__setitem__
+    messages = [{"role": "user", "content": "short goal"}]
+    llm.create_response(client, kind="goal_smart", model="mini", input=messages, cache=cache)
+    assert sent == ["nano"]
+    assert list(cache.entries) == [llm.request_key({"model": "mini", "input": messages})]
+    assert metrics.snapshot()["counters"]["llm_route"]["small:nano"] == 1
+
+    # Under load the route changes, but the same prompt still hits the cache
+    monkeypatch.setattr(routing, "MODEL_ROUTES", [])
+    response = llm.create_response(client, kind="goal_smart", model="mini", input=messages, cache=cache)
+    assert response.cached and sent == ["nano"]
+
+
+def test_org_tier_is_cached_and_lookup_failures_read_as_no_tier(monkeypatch):
+    monkeypatch.setattr(routing, "_tiers", {})
+    queries = []
+
+    class Conn:
+        def transaction(self):
+            return self
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, sql, params):
+            queries.append(params)
+            if params[0] == "broken":
+                raise RuntimeError("relation does not exist")
+            return types.SimpleNamespace(fetchone=lambda: ("pro",))
+
+    conn = Conn()
+    assert routing.org_tier(conn, "org-1") == "pro"
+    assert routing.org_tier(conn, "org-1") == "pro"
+    assert routing.org_tier(conn, "broken") is None
+    assert routing.org_tier(conn, None) is None
+    assert queries == [("org-1",), ("broken",)]
@@ -1,9 +1,11 @@
 import json
+import time
 from typing import Any, Dict, List, Optional
 
-from src.jobs.registry import JobFailed
+from src import deadline
+from src.jobs.registry import JobDeferred, JobFailed, JobParked
 from src.metrics import metrics as worker_metrics
-from src.runner import JobRunner
+from src.runner import JobRunner, stamp_enqueued_at
 from src.state import WorkerState
 
 
@@ -36,11 +38,26 @@ class FakePipeline:
         self._commands.append(("lpush", args, kwargs))
         return self
 
+    def llen(self, *args, **kwargs):
+        self._commands.append(("llen", args, kwargs))
+        return self
+
+    def lindex(self, *args, **kwargs):
+        self._commands.append(("lindex", args, kwargs))
+        return self
+
+    def zrange(self, *args, **kwargs):
+        self._commands.append(("zrange", args, kwargs))
+        return self
+
+    def zcard(self, *args, **kwargs):
+        self._commands.append(("zcard", args, kwargs))
+        return self
+
     def execute(self):
-        for name, args, kwargs in self._commands:
-            getattr(self._redis, name)(*args, **kwargs)
+        results = [getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in self._commands]
         self._commands.clear()
-        return []
+        return results
 
 
 class FakeRedis:
@@ -49,9 +66,11 @@ class FakeRedis:
         self.processing: List[str] = []
         self.claims: Dict[str, str] = {}
         self.visibility: Dict[str, float] = {}
+        self.retry: Dict[str, float] = {}
         self.brpoplpush_calls: List[Any] = []
         self.llen_calls: List[Any] = []
         self.rpush_calls: List[Any] = []
+        self.dead: List[str] = []
 
     def brpoplpush(self, source: str, dest: str, timeout: int):
         self.brpoplpush_calls.append((source, dest, timeout))
@@ -61,14 +80,33 @@ class FakeRedis:
         self.processing.insert(0, payload)
         return payload
 
+    def _list(self, queue: str) -> List[str]:
+        if queue.endswith(":processing"):
+            return self.processing
+        if queue.endswith(":dead"):
+            return self.dead
+        return self.jobs
+
     def llen(self, queue: str) -> int:
         self.llen_calls.append(queue)
-        if queue.endswith(":processing"):
-            return len(self.processing)
-        return len(self.jobs)
+        return len(self._list(queue))
+
+    def lindex(self, queue: str, index: int) -> Optional[str]:
+        items = self._list(queue)
+        try:
+            return items[index]
+        except IndexError:
+            return None
+
+    def zrange(self, key: str, start: int, end: int, withscores: bool = False):
+        ordered = sorted(self._zset(key).items(), key=lambda item: item[1])
+        selected = ordered[start : end + 1]
+        return selected if withscores else [token for token, _ in selected]
 
     def rpush(self, queue: str, payload: str) -> None:
         self.rpush_calls.append((queue, payload))
+        if queue.endswith(":dead"):
+            self.dead.append(payload)
 
     def pipeline(self) -> FakePipeline:
         return FakePipeline(self)
@@ -77,8 +115,14 @@ class FakeRedis:
     def hset(self, _key: str, field: str, value: str) -> None:
         self.claims[field] = value
 
-    def zadd(self, _key: str, mapping: Dict[str, float]) -> None:
-        self.visibility.update(mapping)
+    def _zset(self, key: str) -> Dict[str, float]:
+        return self.retry if key.endswith(":retry") else self.visibility
+
+    def zadd(self, key: str, mapping: Dict[str, float]) -> None:
+        self._zset(key).update(mapping)
+
+    def zcard(self, key: str) -> int:
+        return len(self._zset(key))
 
     def lrem(self, queue: str, _count: int, value: str) -> None:
         target = self.processing if queue.endswith(":processing") else self.jobs
@@ -87,8 +131,8 @@ class FakeRedis:
     def hdel(self, _key: str, field: str) -> None:
         self.claims.pop(field, None)
 
-    def zrem(self, _key: str, field: str) -> None:
-        self.visibility.pop(field, None)
+    def zrem(self, key: str, field: str) -> int:
+        return 1 if self._zset(key).pop(field, None) is not None else 0
 
     def lpush(self, queue: str, value: str) -> None:
         if not queue.endswith(":processing"):
@@ -99,8 +143,9 @@ class FakeRedis:
     def hget(self, _key: str, field: str) -> Optional[str]:
         return self.claims.get(field)
 
-    def zrangebyscore(self, _key: str, _min: float, max_score: float) -> List[str]:
-        return [token for token, score in self.visibility.items() if score <= max_score]
+    def zrangebyscore(self, key: str, _min: float, max_score: float, start: int = 0, num: Optional[int] = None) -> List[str]:
+        due = [token for token, score in sorted(self._zset(key).items(), key=lambda item: item[1]) if score <= max_score]
+        return due[start : None if num is None else start + num]
 
 
 def test_runner_idle_updates_queue_depth_and_notify():
@@ -140,6 +185,77 @@ def test_runner_idle_updates_queue_depth_and_notify():
     assert "queue.depth" in events
 
 
+def _make_runner(redis_client, state, events, dispatch=None):
+    return JobRunner(
+        redis_client=redis_client,
+        state=state,
+        queue_name="jobs",
+        dead_letter_queue="jobs:dead",
+        max_retries=1,
+        backoff_seconds=0.0,
+        max_delay_seconds=0.0,
+        queue_poll_timeout=1,
+        queue_log_interval=5,
+        failure_sleep_seconds=0.1,
+        dispatch_fn=dispatch or (lambda *args, **kwargs: None),
+        patch_job_fn=lambda *args, **kwargs: None,
+        notify_fn=None,
+        log_fn=lambda event, **fields: events.append((event, fields)),
+    )
+
+
+def test_runner_records_queue_wait_from_enqueue_timestamp():
+    worker_metrics.reset()
+    task = stamp_enqueued_at({"kind": "demo", "job_id": "job-wait"}, now=time.time() - 3.0)
+    redis_client = FakeRedis(jobs=[task])
+    events: List[Any] = []
+    runner = _make_runner(redis_client, WorkerState(), events)
+
+    runner._tick()
+
+    wait = worker_metrics.snapshot()["histograms"]["queue_wait_seconds"]["demo"]
+    assert wait["count"] == 1
+    assert 2.5 <= wait["max"] < 30
+    start_fields = next(fields for event, fields in events if event == "job.start")
+    assert start_fields["queue_wait_seconds"] >= 2.5
+
+
+def test_runner_sampler_reports_depth_and_oldest_age_per_queue():
+    worker_metrics.reset()
+    now = time.time()
+    redis_client = FakeRedis(
+        jobs=[
+            stamp_enqueued_at({"kind": "demo", "job_id": "new"}, now=now - 1.0),
+            stamp_enqueued_at({"kind": "demo", "job_id": "old"}, now=now - 40.0),
+        ]
+    )
+    redis_client.dead.append(json.dumps({"kind": "demo", "failed_at": "2000-01-01T00:00:00Z"}))
+    redis_client.visibility["tok"] = now - 12.0
+    redis_client.processing.append("{}")
+    redis_client.retry[json.dumps(stamp_enqueued_at({"kind": "demo"}, now=now - 90.0))] = now + 30.0
+    state = WorkerState()
+    heartbeat_before = state._data["last_heartbeat"]  # type: ignore[attr-defined]
+    events: List[Any] = []
+    runner = _make_runner(redis_client, state, events)
+
+    report = runner.sample_queues(force=True)
+
+    assert report is not None
+    assert report["jobs"]["depth"] == 2
+    assert 39 <= report["jobs"]["oldest_age_seconds"] < 60
+    assert 11 <= report["jobs:processing"]["oldest_age_seconds"] < 30
+    assert report["jobs:dead"]["oldest_age_seconds"] > 86400
+    assert report["jobs:retry"]["depth"] == 1
+    assert 89 <= report["jobs:retry"]["oldest_age_seconds"] < 120
+    snapshot = worker_metrics.snapshot()
+    assert snapshot["queue_depths"]["jobs"] == 2
+    assert snapshot["queue_oldest_age_seconds"]["jobs:processing"] >= 11
+    assert state.snapshot()["queue_depth"] == 2
+    # background sampling must not count as a job-loop heartbeat
+    assert state._data["last_heartbeat"] == heartbeat_before  # type: ignore[attr-defined]
+    assert runner.sample_queues() is None  # rate limited
+
+
 def test_runner_dispatch_success():
     worker_metrics.reset()
     task = {"kind": "demo", "job_id": "job-123", "org_id": "org-1"}
@@ -174,6 +290,9 @@ def test_runner_dispatch_success():
     assert dispatched and dispatched[0]["job_id"] == "job-123"
     assert snap["last_success"] is not None
     assert "job.success" in events
+    assert "job.memory" in events
+    peak = worker_metrics.snapshot()["histograms"]["job_peak_rss_bytes"]["demo"]
+    assert peak["count"] == 1 and peak["max"] > 0
 
 
 def test_runner_dispatch_failure_records_dead_letter():
@@ -214,3 +333,115 @@ def test_runner_dispatch_failure_records_dead_letter():
     assert patched and patched[0][0] == "job-err"
     assert redis_client.rpush_calls, "dead-letter queue should receive payload"
     assert "job.failed" in events
+
+
+def _deferring_runner(redis_client, events, max_deferrals=20):
+    def dispatch(_task, **kwargs):
+        raise JobDeferred("budget exhausted", delay_seconds=30)
+
+    return JobRunner(
+        redis_client=redis_client,
+        state=WorkerState(),
+        queue_name="jobs",
+        dead_letter_queue="jobs:dead",
+        max_retries=3,
+        max_deferrals=max_deferrals,
+        queue_poll_timeout=1,
+        queue_log_interval=5,
+        dispatch_fn=dispatch,
+        patch_job_fn=lambda *args, **kwargs: None,
+        notify_fn=None,
+        log_fn=lambda event, **fields: events.append((event, fields)),
+    )
+
+
+def test_runner_defers_job_to_retry_set_and_promotes_when_due():
+    worker_metrics.reset()
+    redis_client = FakeRedis(jobs=[{"kind": "prep_recommendations", "job_id": "job-1"}])
+    events: List[Any] = []
+    runner = _deferring_runner(redis_client, events)
+
+    runner._tick()
+
+    assert not redis_client.dead and not redis_client.jobs
+    [(payload, ready_at)] = redis_client.retry.items()
+    assert json.loads(payload)["deferrals"] == 1
+    assert ready_at > time.time() + 25
+    assert runner.state.snapshot()["consecutive_failures"] == 0
+    assert "job.deferred" in [name for name, _ in events]
+    assert worker_metrics.snapshot()["counters"]["deferred"] == {"prep_recommendations": 1}
+
+    runner._promote_due_retries(time.time())
+    assert redis_client.retry and not redis_client.jobs
+    runner._last_retry_promotion = 0.0
+    runner._promote_due_retries(ready_at + 1)
+    assert not redis_client.retry
+    assert redis_client.jobs == [payload]
+
+
+def test_runner_dead_letters_after_too_many_deferrals():
+    redis_client = FakeRedis(jobs=[{"kind": "goal_smart", "job_id": "job-2", "deferrals": 3}])
+    events: List[Any] = []
+    runner = _deferring_runner(redis_client, events, max_deferrals=3)
+
+    runner._tick()
+
+    assert not redis_client.retry
+    assert len(redis_client.dead) == 1
+    assert "deferred 3 times" in json.loads(redis_client.dead[0])["error"]
+
+
+def test_runner_gate_defers_without_dispatching():
+    worker_metrics.reset()
+    redis_client = FakeRedis(jobs=[{"kind": "research_summary", "job_id": "job-3"}])
+    events: List[Any] = []
+    dispatched: List[Any] = []
+    runner = _make_runner(redis_client, WorkerState(), events, dispatch=lambda task, **kwargs: dispatched.append(task))
+
+    def gate(kind):
+        raise JobDeferred(f"circuit open for {kind}", delay_seconds=45)
+
+    runner.gate_fn = gate
+    runner._tick()
+
+    assert not dispatched and not redis_client.processing
+    [ready_at] = redis_client.retry.values()
+    assert ready_at > time.time() + 40
+    assert "job.start" not in [name for name, _ in events]
+
+
+def test_runner_parked_job_is_acked_without_retry_entry():
+    worker_metrics.reset()
+    redis_client = FakeRedis(jobs=[{"kind": "research_summary", "job_id": "job-4", "batch": True}])
+    events: List[Any] = []
+
+    def dispatch(_task, **kwargs):
+        raise JobParked("queued for the batch lane")
+
+    runner = _make_runner(redis_client, WorkerState(), events, dispatch=dispatch)
+    runner._tick()
+
+    assert not redis_client.retry and not redis_client.dead and not redis_client.processing
+    assert "job.parked" in [name for name, _ in events]
+    assert worker_metrics.snapshot()["counters"]["parked"] == {"research_summary": 1}
+
+
+def test_runner_applies_kind_deadline_and_records_overrun():
+    worker_metrics.reset()
+    redis_client = FakeRedis(jobs=[{"kind": "goal_smart", "job_id": "job-5"}])
+    events: List[Any] = []
+    seen: List[Optional[float]] = []
+
+    def dispatch(_task, **kwargs):
+        seen.append(deadline.remaining())
+        raise JobFailed("goal_smart", _task, deadline.DeadlineExceeded("job deadline passed during openai", "openai"), 1)
+
+    runner = _make_runner(redis_client, WorkerState(), events, dispatch=dispatch)
+    runner.deadline_fn = lambda kind: 60.0 if kind == "goal_smart" else None
+    runner._tick()
+
+    assert seen and 59 < seen[0] <= 60
+    assert deadline.remaining() is None  # the deadline ends with the job
+    assert worker_metrics.snapshot()["counters"]["deadline_exceeded"] == {"goal_smart": 1}
+    assert "job.deadline_exceeded" in [name for name, _ in events]
+    assert len(redis_client.dead) == 1
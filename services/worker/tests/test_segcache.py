@@ -0,0 +1,77 @@
+from src import segcache  # type: ignore
+from src.metrics import metrics  # type: ignore
+
+
+class FakeRedis:
+    def __init__(self, fail=False):
+        self.data = {}
+        self.fail = fail
+
+    def get(self, key):
+        if self.fail:
+            raise ConnectionError("redis down")
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if self.fail:
+            raise ConnectionError("redis down")
+        if nx and key in self.data:
+            return False
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+
+ROWS = [("s1", 3, "Speech therapy 60 minutes weekly.", 4.5), ("s2", 1, "Goal: reading fluency.", None)]
+
+
+def loader(calls):
+    def load():
+        calls.append(1)
+        return ROWS
+
+    return load
+
+
+def test_rows_round_trip_and_second_read_hits():
+    metrics.reset()
+    cache = segcache.SegmentCache(FakeRedis())
+    calls = []
+    key = segcache.selection_key("ranked", "iep", 80)
+    assert cache.get_or_load("doc-1", key, loader(calls)) == ROWS
+    assert cache.get_or_load("doc-1", key, loader(calls)) == ROWS
+    assert len(calls) == 1
+    assert metrics.snapshot()["counters"]["segment_cache"] == {"miss": 1, "hit": 1}
+
+
+def test_invalidate_rotates_spans_version():
+    redis_client = FakeRedis()
+    cache = segcache.SegmentCache(redis_client)
+    calls = []
+    cache.get_or_load("doc-1", "k", loader(calls))
+    cache.get_or_load("doc-2", "k", loader(calls))
+    cache.invalidate("doc-1")
+    cache.get_or_load("doc-1", "k", loader(calls))
+    cache.get_or_load("doc-2", "k", loader(calls))
+    assert len(calls) == 3
+
+
+def test_oversize_and_unavailable_redis_fall_through_to_loader():
+    redis_client = FakeRedis()
+    small = segcache.SegmentCache(redis_client, max_bytes=10)
+    calls = []
+    small.get_or_load("doc-1", "k", loader(calls))
+    small.get_or_load("doc-1", "k", loader(calls))
+    assert len(calls) == 2
+    assert not any(key.startswith("segcache:doc-1:") for key in redis_client.data)
+
+    down = segcache.SegmentCache(FakeRedis(fail=True))
+    assert down.get_or_load("doc-1", "k", loader(calls)) == ROWS
+    down.invalidate("doc-1")
+
+
+def test_segment_rows_keep_rank_order():
+    segments = [
+        {"label": "L001", "span_id": "s9", "page": 2, "text": "a", "score": 1.5},
+        {"label": "L002", "span_id": "s1", "page": 1, "text": "b"},
+    ]
+    assert segcache.segment_rows(segments) == [("s9", 2, "a", 1.5), ("s1", 1, "b", None)]
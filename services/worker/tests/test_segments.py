@@ -0,0 +1,96 @@
+import contextlib
+
+from src import segments  # type: ignore
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConn:
+    def __init__(self, ranked_rows=None, page_rows=None, fail_ranked=False):
+        self.ranked_rows = ranked_rows or []
+        self.page_rows = page_rows or []
+        self.fail_ranked = fail_ranked
+        self.queries = []
+        self.savepoints = 0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.savepoints += 1
+        yield
+
+    def execute(self, sql, params):
+        self.queries.append((sql, list(params)))
+        if "ts_rank_cd" in sql:
+            if self.fail_ranked:
+                raise RuntimeError('column "tsv" does not exist')
+            return FakeResult(self.ranked_rows)
+        return FakeResult(self.page_rows)
+
+
+def test_ranked_query_binds_every_placeholder():
+    for profile in (segments.IEP_PROFILE, segments.RESEARCH_PROFILE, segments.EOB_PROFILE):
+        sql = segments._ranked_sql(profile)
+        params = segments._ranked_params(profile, "doc-1", 10)
+        assert sql.count("%s") == len(params)
+        assert params[-1] == 10
+        # Ranking only touches spans the GIN index finds; the rest are a cheap top-up
+        assert "AND tsv @@ to_tsquery('english', %s) AND" in sql
+        assert sql.count("ts_rank_cd") == len(profile.groups)
+        assert params.count(segments.match_query(profile)) == 2
+
+
+def test_select_ranked_segments_keeps_database_order():
+    conn = FakeConn(
+        ranked_rows=[
+            ("s2", 9, "  Speech therapy 30 minutes per week.  ", 4.2),
+            ("s1", 1, "Goal: reading fluency.", 2.0),
+            ("s2", 9, "duplicate row", 1.0),
+        ]
+    )
+    result = segments.select_ranked_segments(
+        conn,
+        "doc-1",
+        segments.IEP_PROFILE,
+        prefix="L",
+        doc_name="IEP",
+        which="latest",
+        limit=5,
+        include_score=True,
+    )
+    assert [seg["label"] for seg in result] == ["L001", "L002"]
+    assert result[0]["span_id"] == "s2"
+    assert result[0]["text"] == "Speech therapy 30 minutes per week."
+    assert result[0]["score"] == 4.2
+    assert conn.savepoints == 1
+    assert len(conn.queries) == 1
+
+
+def test_select_ranked_segments_falls_back_to_local_scoring():
+    long_denial = "Claim denied: reason code CO-50, not medically necessary. " * 2
+    conn = FakeConn(
+        fail_ranked=True,
+        page_rows=[
+            ("s1", 1, "Member services phone number and mailing address."),
+            ("s2", 2, long_denial),
+            ("s3", 3, "short"),
+        ],
+    )
+    result = segments.select_ranked_segments(
+        conn,
+        "doc-1",
+        segments.EOB_PROFILE,
+        prefix="D",
+        doc_name="EOB",
+        which="denial",
+        limit=5,
+        fallback_scorer=lambda text: 5 if "denied" in text else 1,
+    )
+    assert [seg["span_id"] for seg in result] == ["s2", "s1"]
+    assert "score" not in result[0]
+    assert result[0]["which"] == "denial"
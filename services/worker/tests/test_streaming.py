@@ -0,0 +1,147 @@
+import json
+import types
+
+import pytest
+
+from src import llm, streaming  # type: ignore
+
+
+def delta(text):
+    return types.SimpleNamespace(type="response.output_text.delta", delta=text)
+
+
+def completed(total_tokens=42):
+    usage = types.SimpleNamespace(total_tokens=total_tokens)
+    return types.SimpleNamespace(type="response.completed", response=types.SimpleNamespace(usage=usage))
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"title": "Sup', {"title": "Sup"}),
+        ('{"title": "A", "sections": [{"heading": "Rea', {"title": "A", "sections": [{"heading": "Rea"}]}),
+        ('{"title": "A", "secti', {"title": "A"}),
+        ('{"title": "A", "n": ', {"title": "A"}),
+        ('{"a": [1, 2, tr', {"a": [1, 2]}),
+        ('{"a": "line\\', {}),
+        ('{"a": "x"}', {"a": "x"}),
+        ("", None),
+    ],
+)
+def test_parse_partial_json_closes_what_is_open(text, expected):
+    assert streaming.parse_partial_json(text) == expected
+
+
+def test_consume_stream_emits_changed_snapshots_at_bounded_intervals():
+    now = [0.0]
+
+    def clock():
+        now[0] += 1.0
+        return now[0]
+
+    pieces = ['{"title": "Support', ' snapshot", "sections": [', '{"heading": "Reading"}', "]}"]
+    snapshots = []
+    text, usage = streaming.consume_stream(
+        [delta(piece) for piece in pieces] + [completed()], snapshots.append, interval=2.0, clock=clock
+    )
+    assert json.loads(text)["sections"] == [{"heading": "Reading"}]
+    assert usage.total_tokens == 42
+    assert snapshots == [{"title": "Support snapshot", "sections": []}, {"title": "Support snapshot", "sections": [{"heading": "Reading"}]}]
+
+
+def test_snapshot_failure_does_not_stop_the_stream():
+    def boom(_snapshot):
+        raise RuntimeError("db down")
+
+    text, _ = streaming.consume_stream([delta('{"a": 1'), delta("}")], boom, interval=0.0)
+    assert text == '{"a": 1}'
+
+
+def test_create_response_streams_opted_in_kinds_only(monkeypatch):
+    requests = []
+
+    def create(**request):
+        requests.append(request)
+        if request.get("stream"):
+            return iter([delta('{"title": "T"'), delta("}"), completed()])
+        content = types.SimpleNamespace(text='{"title": "T"}')
+        return types.SimpleNamespace(output=[types.SimpleNamespace(content=[content])])
+
+    client = types.SimpleNamespace(responses=types.SimpleNamespace(create=create))
+    monkeypatch.setattr(llm, "LLM_CACHE_ENABLED", False)
+    partials = []
+    streamed = llm.create_response(client, kind="build_one_pager", model="m", input="x", on_partial=partials.append)
+    plain = llm.create_response(client, kind="goal_smart", model="m", input="x", on_partial=partials.append)
+
+    assert llm.response_text(streamed) == llm.response_text(plain) == '{"title": "T"}'
+    assert [bool(r.get("stream")) for r in requests] == [True, False]
+    assert streamed.cached is False and streamed.usage.total_tokens == 42
+
+
+class _AbortingConn:
+    """Mimics psycopg: after a failed statement the transaction rejects everything until rolled back."""
+
+    def __init__(self):
+        self.aborted = False
+        self.status = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        if self.aborted:
+            raise RuntimeError("current transaction is aborted")
+        if "status='streaming'" in sql:
+            self.aborted = True
+            raise RuntimeError("snapshot write failed")
+        if sql.startswith("SELECT outline_json"):
+            return types.SimpleNamespace(fetchone=lambda: ({},))
+        if sql.startswith("UPDATE advocacy_outlines"):
+            self.status = params[2]
+        return types.SimpleNamespace(fetchone=lambda: None)
+
+    def commit(self):
+        pass
+
+    def transaction(self):
+        conn = self
+
+        class _Savepoint:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, exc_type, *_):
+                conn.aborted = False
+                return False
+
+        return _Savepoint()
+
+
+def test_failed_snapshot_write_does_not_fail_the_final_result(monkeypatch):
+    from src import main  # type: ignore
+
+    conn = _AbortingConn()
+    segment = {"label": "O001", "page": 1, "text": "Services were not delivered.", "span_id": "s1"}
+    outline = {"summary": "s", "facts": [{"text": "f", "citations": ["O001"]}], "attempts": [], "remedies": [], "next_steps": [], "closing": ""}
+
+    def fake_create_response(_client, *, on_partial, **_kwargs):
+        text, usage = streaming.consume_stream([delta(json.dumps(outline))], on_partial, interval=0.0)
+        return llm.CachedResponse.from_text(text, usage=usage, cached=False)
+
+    monkeypatch.setenv("DATABASE_URL", "postgresql://test")
+    monkeypatch.setattr(main, "_connect", lambda _url: conn)
+    monkeypatch.setattr(main, "_retrieve_segments", lambda *_args: [segment])
+    monkeypatch.setattr(
+        main,
+        "pack_for_job",
+        lambda *_args: [types.SimpleNamespace(segments=[segment], label_map={"O001": {**segment, "document_id": "d1", "doc_name": "IEP", "which": "O"}})],
+    )
+    monkeypatch.setattr(main, "org_tier", lambda *_args: None)
+    monkeypatch.setattr(main, "_openai", lambda: None)
+    monkeypatch.setattr(main, "create_response", fake_create_response)
+
+    main.handle_build_advocacy_outline({"outline_id": "o1", "child_id": "c1", "org_id": "org", "document_id": "d1"})
+    assert conn.status == "ready"
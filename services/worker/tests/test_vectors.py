@@ -0,0 +1,102 @@
+import math
+import random
+
+import pytest
+
+from src import vectors  # type: ignore
+
+
+def _random_vectors(count, dims, seed=3):
+    rng = random.Random(seed)
+    return [[rng.gauss(0, 1) for _ in range(dims)] for _ in range(count)]
+
+
+def test_truncate_renormalizes():
+    vec = [3.0, 4.0, 12.0]
+    out = vectors.truncate(vec, 2)
+    assert out == pytest.approx([0.6, 0.8])
+    assert vectors.truncate(vec, 0) == vec
+
+
+def test_int8_roundtrip_error_is_bounded():
+    vec = _random_vectors(1, 256)[0]
+    codes, scale = vectors.quantize_int8(vec)
+    assert len(codes) == 256
+    restored = vectors.dequantize_int8(codes, scale)
+    assert max(abs(a - b) for a, b in zip(vec, restored)) <= scale / 2 + 1e-9
+
+
+def test_halfvec_literal_is_compact():
+    vec = _random_vectors(1, 64)[0]
+    full = vectors.vector_literal(vec, "vector")
+    half = vectors.vector_literal(vec, "halfvec")
+    assert len(half) < len(full) * 0.6
+    parsed = [float(x) for x in half.strip("[]").split(",")]
+    assert all(math.isclose(a, b, rel_tol=2e-3, abs_tol=1e-4) for a, b in zip(parsed, vec))
+
+
+def test_halfvec_literal_round_trips_float16():
+    vec = [x * 0.05 for x in _random_vectors(1, 20000, seed=11)[0]]
+    half = vectors.vector_literal(vec, "halfvec")
+    parsed = [float(x) for x in half.strip("[]").split(",")]
+    assert vectors.to_float16(parsed) == vectors.to_float16(vec)
+
+
+def test_storage_column_rejects_unknown_mode():
+    assert vectors.storage_column("halfvec") == ("embedding_half", "halfvec")
+    with pytest.raises(ValueError):
+        vectors.storage_column("int4")
+
+
+def test_compare_recall_reports_each_variant():
+    data = _random_vectors(220, 32)
+    results = vectors.compare_recall(data[20:], data[:20], k=5, variants=("float32", "halfvec", "int8"), dims=(16,))
+    by_key = {(r["variant"], r["dims"]): r for r in results}
+    assert by_key[("float32", 32)]["recall_at_k"] == 1.0
+    assert by_key[("halfvec", 32)]["recall_at_k"] >= 0.95
+    assert by_key[("int8", 32)]["recall_at_k"] >= 0.85
+    assert by_key[("halfvec", 32)]["bytes_per_vector"] < by_key[("float32", 32)]["bytes_per_vector"]
+    assert ("int8", 16) in by_key
+
+
+def test_column_dimensions_reads_the_pgvector_typmod():
+    class Conn:
+        def __init__(self, row):
+            self.row = row
+            self.params = None
+
+        def execute(self, sql, params):
+            self.params = params
+            return self
+
+        def fetchone(self):
+            return self.row
+
+    conn = Conn((768,))
+    assert vectors.column_dimensions(conn, "halfvec") == 768
+    assert conn.params == ("embedding_half",)
+    assert vectors.column_dimensions(Conn((-1,)), "vector") == 0
+    assert vectors.column_dimensions(Conn(None), "halfvec") is None
+
+
+def test_embedding_dimensions_must_match_the_column(monkeypatch):
+    from src import index  # type: ignore
+
+    monkeypatch.setattr(index, "EMBED_PROVIDER", "openai")
+    monkeypatch.setattr(index, "EMBED_FALLBACK_PROVIDER", "")
+    monkeypatch.setattr(index, "EMBED_MODEL", "text-embedding-3-small")
+    monkeypatch.setattr(index, "EMBED_DIMENSIONS", 0)
+    index.check_embedding_dimensions(1536, "halfvec")
+    index.check_embedding_dimensions(0, "halfvec")  # unsized column accepts anything
+
+    monkeypatch.setattr(index, "EMBED_DIMENSIONS", 768)
+    with pytest.raises(RuntimeError, match=r"halfvec\(1536\).*768"):
+        index.check_embedding_dimensions(1536, "halfvec")
+    index.check_embedding_dimensions(768, "halfvec")
+
+    monkeypatch.setattr(index, "EMBED_FALLBACK_PROVIDER", "hashing")
+    monkeypatch.setattr(index, "LOCAL_EMBED_DIMENSIONS", 1536)
+    with pytest.raises(RuntimeError, match="hashing"):
+        index.check_embedding_dimensions(768, "halfvec")
+    with pytest.raises(RuntimeError, match="missing"):
+        index.check_embedding_dimensions(None, "halfvec")